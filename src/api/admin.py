@@ -1,14 +1,17 @@
 """Admin API routes"""
 from fastapi import APIRouter, Depends, HTTPException, Header, Request
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from pydantic import BaseModel
 from typing import Optional, List
+import hashlib
+import json
 import secrets
 from ..core.auth import AuthManager
 from ..core.database import Database
 from ..core.config import config
 from ..services.token_manager import TokenManager
 from ..services.proxy_manager import ProxyManager
+from ..services.token_importer import TokenImporter
 
 router = APIRouter()
 
@@ -184,15 +187,68 @@ async def change_password(
 
 # ========== Token Management ==========
 
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match check: comma-separated list or "*", weak comparison"""
+    if not if_none_match:
+        return False
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*":
+            return True
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == opaque:
+            return True
+    return False
+
+
+def _etag_response(request: Request, payload) -> Response:
+    """Return payload as JSON with an ETag, or 304 if the client already has it"""
+    body = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    etag = f'W/"{hashlib.md5(body).hexdigest()}"'
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
+    return Response(content=body, media_type="application/json", headers={"ETag": etag, "Cache-Control": "no-cache"})
+
+
 @router.get("/api/tokens")
-async def get_tokens(token: str = Depends(verify_admin_token)):
-    """Get all tokens with statistics"""
-    tokens = await token_manager.get_all_tokens()
-    result = []
+async def get_tokens(
+    request: Request,
+    page: Optional[int] = None,
+    page_size: int = 50,
+    sort: str = "created_at",
+    order: str = "desc",
+    status: Optional[str] = None,
+    q: Optional[str] = None,
+    token: str = Depends(verify_admin_token)
+):
+    """Get tokens with statistics
 
-    for t in tokens:
-        stats = await db.get_token_stats(t.id)
+    不传 page 时返回全部 token 数组 (兼容前端)；传 page 时返回
+    {"items", "total", "page", "page_size"}。支持 sort/order 排序、
+    status=active|inactive 和 q (邮箱/名称/备注) 过滤。
+    """
+    is_active = {"active": True, "inactive": False}.get(status)
+    limit = None
+    offset = 0
+    if page is not None:
+        page = max(page, 1)
+        page_size = min(max(page_size, 1), 500)
+        limit = page_size
+        offset = (page - 1) * page_size
+
+    rows, total = await db.get_tokens_with_stats(
+        search=q,
+        is_active=is_active,
+        sort=sort,
+        descending=order.lower() != "asc",
+        limit=limit,
+        offset=offset
+    )
 
+    result = []
+    for t, stats in rows:
         result.append({
             "id": t.id,
             "st": t.st,  # Session Token for editing
@@ -214,12 +270,20 @@ async def get_tokens(token: str = Depends(verify_admin_token)):
             "video_enabled": t.video_enabled,
             "image_concurrency": t.image_concurrency,
             "video_concurrency": t.video_concurrency,
-            "image_count": stats.image_count if stats else 0,
-            "video_count": stats.video_count if stats else 0,
-            "error_count": stats.error_count if stats else 0
+            "image_count": stats["image_count"],
+            "video_count": stats["video_count"],
+            "error_count": stats["error_count"]
         })
 
-    return result  # 直接返回数组,兼容前端
+    if page is None:
+        return _etag_response(request, result)  # 直接返回数组,兼容前端
+
+    return _etag_response(request, {
+        "items": result,
+        "total": total,
+        "page": page,
+        "page_size": page_size
+    })
 
 
 @router.post("/api/tokens")
@@ -476,93 +540,34 @@ async def st_to_at(
 @router.post("/api/tokens/import")
 async def import_tokens(
     request: ImportTokensRequest,
+    stream: bool = False,
     token: str = Depends(verify_admin_token)
 ):
-    """批量导入Token"""
-    from datetime import datetime, timezone
-
-    added = 0
-    updated = 0
-    errors = []
-
-    for idx, item in enumerate(request.tokens):
-        try:
-            st = item.session_token
+    """批量导入Token
 
-            if not st:
-                errors.append(f"第{idx+1}项: 缺少 session_token")
-                continue
+    stream=true 时以 NDJSON 逐行返回进度，最后一行为导入结果
+    """
+    importer = TokenImporter(token_manager)
 
-            # 使用 ST 转 AT 获取用户信息
+    if stream:
+        async def generate():
             try:
-                result = await token_manager.flow_client.st_to_at(st)
-                at = result["access_token"]
-                email = result.get("user", {}).get("email")
-                expires = result.get("expires")
-
-                if not email:
-                    errors.append(f"第{idx+1}项: 无法获取邮箱信息")
-                    continue
-
-                # 解析过期时间
-                at_expires = None
-                is_expired = False
-                if expires:
-                    try:
-                        at_expires = datetime.fromisoformat(expires.replace('Z', '+00:00'))
-                        # 判断是否过期
-                        now = datetime.now(timezone.utc)
-                        is_expired = at_expires <= now
-                    except:
-                        pass
-
-                # 使用邮箱检查是否已存在
-                existing_tokens = await token_manager.get_all_tokens()
-                existing = next((t for t in existing_tokens if t.email == email), None)
-
-                if existing:
-                    # 更新现有Token
-                    await token_manager.update_token(
-                        token_id=existing.id,
-                        st=st,
-                        at=at,
-                        at_expires=at_expires,
-                        image_enabled=item.image_enabled,
-                        video_enabled=item.video_enabled,
-                        image_concurrency=item.image_concurrency,
-                        video_concurrency=item.video_concurrency
-                    )
-                    # 如果过期则禁用
-                    if is_expired:
-                        await token_manager.disable_token(existing.id)
-                    updated += 1
-                else:
-                    # 添加新Token
-                    new_token = await token_manager.add_token(
-                        st=st,
-                        image_enabled=item.image_enabled,
-                        video_enabled=item.video_enabled,
-                        image_concurrency=item.image_concurrency,
-                        video_concurrency=item.video_concurrency
-                    )
-                    # 如果过期则禁用
-                    if is_expired:
-                        await token_manager.disable_token(new_token.id)
-                    added += 1
-
+                async for event in importer.run(request.tokens):
+                    yield json.dumps(event, ensure_ascii=False) + "\n"
             except Exception as e:
-                errors.append(f"第{idx+1}项: {str(e)}")
+                yield json.dumps({"type": "result", "success": False, "message": f"导入失败: {str(e)}"}, ensure_ascii=False) + "\n"
 
-        except Exception as e:
-            errors.append(f"第{idx+1}项: {str(e)}")
+        return StreamingResponse(generate(), media_type="application/x-ndjson")
 
-    return {
-        "success": True,
-        "added": added,
-        "updated": updated,
-        "errors": errors if errors else None,
-        "message": f"导入完成: 新增 {added} 个, 更新 {updated} 个" + (f", {len(errors)} 个失败" if errors else "")
-    }
+    result = None
+    try:
+        async for event in importer.run(request.tokens):
+            result = event
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"导入失败: {str(e)}")
+
+    result.pop("type", None)
+    return result
 
 
 # ========== Config Management ==========
@@ -673,39 +678,12 @@ async def logout(token: str = Depends(verify_admin_token)):
 
 
 @router.get("/api/stats")
-async def get_stats(token: str = Depends(verify_admin_token)):
+async def get_stats(request: Request, token: str = Depends(verify_admin_token)):
     """Get statistics for dashboard"""
-    tokens = await token_manager.get_all_tokens()
-    active_tokens = [t for t in tokens if t.is_active]
+    from datetime import date
 
-    # Calculate totals
-    total_images = 0
-    total_videos = 0
-    total_errors = 0
-    today_images = 0
-    today_videos = 0
-    today_errors = 0
-
-    for t in tokens:
-        stats = await db.get_token_stats(t.id)
-        if stats:
-            total_images += stats.image_count
-            total_videos += stats.video_count
-            total_errors += stats.error_count  # Historical total errors
-            today_images += stats.today_image_count
-            today_videos += stats.today_video_count
-            today_errors += stats.today_error_count
-
-    return {
-        "total_tokens": len(tokens),
-        "active_tokens": len(active_tokens),
-        "total_images": total_images,
-        "total_videos": total_videos,
-        "total_errors": total_errors,
-        "today_images": today_images,
-        "today_videos": today_videos,
-        "today_errors": today_errors
-    }
+    stats = await db.get_dashboard_stats(str(date.today()))
+    return _etag_response(request, stats)
 
 
 @router.get("/api/logs")
@@ -996,6 +974,15 @@ async def get_captcha_config(token: str = Depends(verify_admin_token)):
     }
 
 
+@router.get("/api/captcha/pool/stats")
+async def get_captcha_pool_stats(token: str = Depends(verify_admin_token)):
+    """Get reCAPTCHA token pool hit/miss statistics"""
+    return {
+        "success": True,
+        "stats": token_manager.flow_client.captcha_pool.get_stats()
+    }
+
+
 # ========== Plugin Configuration Endpoints ==========
 
 @router.get("/api/plugin/config")
@@ -1,16 +1,15 @@
 """API routes - OpenAI compatible endpoints"""
 from fastapi import APIRouter, Depends, HTTPException
-from fastapi.responses import StreamingResponse, JSONResponse
-from typing import List, Optional
+from fastapi.responses import StreamingResponse, JSONResponse, Response
+from typing import List, Optional, Union
 import base64
 import re
-import json
 import time
-from urllib.parse import urlparse
-from curl_cffi.requests import AsyncSession
 from ..core.auth import verify_api_key_header
 from ..core.models import ChatCompletionRequest
 from ..services.generation_handler import GenerationHandler, MODEL_CONFIG
+from ..services.admission_queue import QueueFullError
+from ..services.image_fetcher import ImageFetcher
 from ..core.logger import debug_logger
 
 router = APIRouter()
@@ -25,38 +24,32 @@ def set_generation_handler(handler: GenerationHandler):
     generation_handler = handler
 
 
-async def retrieve_image_data(url: str) -> Optional[bytes]:
-    """
-    智能获取图片数据：
-    1. 优先检查是否为本地 /tmp/ 缓存文件，如果是则直接读取磁盘
-    2. 如果本地不存在或是外部链接，则进行网络下载
+# 合法的标准 base64 (无换行/空白)，满足时原样透传给上游，不解码再编码
+_BASE64_PATTERN = re.compile(r"[A-Za-z0-9+/]+={0,2}")
+
+
+def _parse_data_uri(data_uri: str) -> Optional[Union[bytes, str]]:
+    """解析 data:image/...;base64,... 图片
+
+    Returns:
+        合法的 base64 直接返回字符串 (由 upload_image 透传)，
+        其他情况 (含换行、URL-safe 等) 宽松解码为 bytes；没有 base64 数据时返回 None
     """
-    # 优先尝试本地读取
-    try:
-        if "/tmp/" in url and generation_handler and generation_handler.file_cache:
-            path = urlparse(url).path
-            filename = path.split("/tmp/")[-1]
-            local_file_path = generation_handler.file_cache.cache_dir / filename
-
-            if local_file_path.exists() and local_file_path.is_file():
-                data = local_file_path.read_bytes()
-                if data:
-                    return data
-    except Exception as e:
-        debug_logger.log_warning(f"[CONTEXT] 本地缓存读取失败: {str(e)}")
+    start = data_uri.find("base64,")
+    if start < 0:
+        return None
+    image_base64 = data_uri[start + 7:]
+    if not image_base64:
+        return None
+    if len(image_base64) % 4 == 0 and _BASE64_PATTERN.fullmatch(image_base64):
+        return image_base64
+    return base64.b64decode(image_base64)
 
-    # 回退逻辑：网络下载
-    try:
-        async with AsyncSession() as session:
-            response = await session.get(url, timeout=30, impersonate="chrome110", verify=False)
-            if response.status_code == 200:
-                return response.content
-            else:
-                debug_logger.log_warning(f"[CONTEXT] 图片下载失败，状态码: {response.status_code}")
-    except Exception as e:
-        debug_logger.log_error(f"[CONTEXT] 图片下载异常: {str(e)}")
 
-    return None
+def _image_fetcher() -> ImageFetcher:
+    """图片获取器 (本地缓存目录来自 generation handler)"""
+    cache_dir = generation_handler.file_cache.cache_dir if generation_handler and generation_handler.file_cache else None
+    return ImageFetcher(cache_dir)
 
 
 @router.get("/v1/models")
@@ -100,7 +93,9 @@ async def create_chat_completion(
 
         # Handle both string and array format (OpenAI multimodal)
         prompt = ""
-        images: List[bytes] = []
+        # 远程图片先占位，稍后与历史参考图一起并发下载
+        images: List[Optional[Union[bytes, str]]] = []
+        remote_images: List[tuple] = []
 
         if isinstance(content, str):
             # Simple text format
@@ -115,36 +110,20 @@ async def create_chat_completion(
                     image_url = item.get("image_url", {}).get("url", "")
                     if image_url.startswith("data:image"):
                         # Parse base64
-                        match = re.search(r"base64,(.+)", image_url)
-                        if match:
-                            image_base64 = match.group(1)
-                            image_bytes = base64.b64decode(image_base64)
-                            images.append(image_bytes)
+                        image_data = _parse_data_uri(image_url)
+                        if image_data:
+                            images.append(image_data)
                     elif image_url.startswith("http://") or image_url.startswith("https://"):
                         # Download remote image URL
                         debug_logger.log_info(f"[IMAGE_URL] 下载远程图片: {image_url}")
-                        try:
-                            downloaded_bytes = await retrieve_image_data(image_url)
-                            if downloaded_bytes and len(downloaded_bytes) > 0:
-                                images.append(downloaded_bytes)
-                                debug_logger.log_info(f"[IMAGE_URL] ✅ 远程图片下载成功: {len(downloaded_bytes)} 字节")
-                            else:
-                                debug_logger.log_warning(f"[IMAGE_URL] ⚠️ 远程图片下载失败或为空: {image_url}")
-                        except Exception as e:
-                            debug_logger.log_error(f"[IMAGE_URL] ❌ 远程图片下载异常: {str(e)}")
-
-        # Fallback to deprecated image parameter
-        if request.image and not images:
-            if request.image.startswith("data:image"):
-                match = re.search(r"base64,(.+)", request.image)
-                if match:
-                    image_base64 = match.group(1)
-                    image_bytes = base64.b64decode(image_base64)
-                    images.append(image_bytes)
+                        remote_images.append((len(images), image_url))
+                        images.append(None)
 
         # 自动参考图：仅对图片模型生效
         model_config = MODEL_CONFIG.get(request.model)
 
+        # 历史参考图候选: 从最近的 assistant 回复开始，每条回复取最后一张图片
+        history_urls: List[str] = []
         if model_config and model_config["type"] == "image" and len(request.messages) > 1:
             debug_logger.log_info(f"[CONTEXT] 开始查找历史参考图，消息数量: {len(request.messages)}")
 
@@ -153,26 +132,58 @@ async def create_chat_completion(
                 if msg.role == "assistant" and isinstance(msg.content, str):
                     # 匹配 Markdown 图片格式: ![...](http...)
                     matches = re.findall(r"!\[.*?\]\((.*?)\)", msg.content)
-                    if matches:
-                        last_image_url = matches[-1]
-
-                        if last_image_url.startswith("http"):
-                            try:
-                                downloaded_bytes = await retrieve_image_data(last_image_url)
-                                if downloaded_bytes and len(downloaded_bytes) > 0:
-                                    # 将历史图片插入到最前面
-                                    images.insert(0, downloaded_bytes)
-                                    debug_logger.log_info(f"[CONTEXT] ✅ 添加历史参考图: {last_image_url}")
-                                    break
-                                else:
-                                    debug_logger.log_warning(f"[CONTEXT] 图片下载失败或为空，尝试下一个: {last_image_url}")
-                            except Exception as e:
-                                debug_logger.log_error(f"[CONTEXT] 处理参考图时出错: {str(e)}")
-                                # 继续尝试下一个图片
+                    if matches and matches[-1].startswith("http"):
+                        history_urls.append(matches[-1])
+
+        # 并发下载所有远程图片和第一个历史参考图候选
+        fetcher = _image_fetcher()
+        history_image = None
+        if remote_images or history_urls:
+            urls = [url for _, url in remote_images] + history_urls[:1]
+            results = await fetcher.fetch_all(urls)
+            for (slot, image_url), downloaded_bytes in zip(remote_images, results):
+                if downloaded_bytes:
+                    images[slot] = downloaded_bytes
+                    debug_logger.log_info(f"[IMAGE_URL] ✅ 远程图片下载成功: {len(downloaded_bytes)} 字节")
+                else:
+                    debug_logger.log_warning(f"[IMAGE_URL] ⚠️ 远程图片下载失败或为空: {image_url}")
+            if history_urls:
+                history_image = results[-1]
+        images = [image for image in images if image]
+
+        # Fallback to deprecated image parameter
+        if request.image and not images:
+            if request.image.startswith("data:image"):
+                image_data = _parse_data_uri(request.image)
+                if image_data:
+                    images.append(image_data)
+
+        for idx, last_image_url in enumerate(history_urls):
+            if idx > 0:
+                # 前一个候选失败，继续尝试下一个图片
+                history_image = await fetcher.fetch(last_image_url)
+            if history_image:
+                # 将历史图片插入到最前面
+                images.insert(0, history_image)
+                debug_logger.log_info(f"[CONTEXT] ✅ 添加历史参考图: {last_image_url}")
+                break
+            else:
+                debug_logger.log_warning(f"[CONTEXT] 图片下载失败或为空，尝试下一个: {last_image_url}")
 
         if not prompt:
             raise HTTPException(status_code=400, detail="Prompt cannot be empty")
 
+        # 排队已满时在开始生成前直接返回 429
+        if model_config:
+            try:
+                generation_handler.admission_queue.check_capacity(model_config["type"])
+            except QueueFullError as e:
+                raise HTTPException(
+                    status_code=429,
+                    detail=str(e),
+                    headers={"Retry-After": str(e.retry_after)}
+                )
+
         # Call generation handler
         if request.stream:
             # Streaming response
@@ -209,13 +220,11 @@ async def create_chat_completion(
                 result = chunk
 
             if result:
-                # Parse the result JSON string
-                try:
-                    result_json = json.loads(result)
-                    return JSONResponse(content=result_json)
-                except json.JSONDecodeError:
-                    # If not JSON, return as-is
-                    return JSONResponse(content={"result": result})
+                # handler 产出的已是 JSON 字符串，直接返回，避免解析后再序列化
+                if result.startswith("{"):
+                    return Response(content=result, media_type="application/json")
+                # If not JSON, return as-is
+                return JSONResponse(content={"result": result})
             else:
                 raise HTTPException(status_code=500, detail="Generation failed: No response from handler")
 
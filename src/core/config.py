@@ -73,6 +73,66 @@ class Config:
     def max_poll_attempts(self) -> int:
         return self._config["flow"]["max_poll_attempts"]
 
+    @property
+    def poll_max_interval(self) -> float:
+        """Upper bound (seconds) for adaptive video poll intervals"""
+        return self._config.get("flow", {}).get("poll_max_interval", 30.0)
+
+    @property
+    def poll_jitter(self) -> float:
+        """Relative random jitter applied to video poll intervals"""
+        return self._config.get("flow", {}).get("poll_jitter", 0.15)
+
+    @property
+    def poll_batch_window(self) -> float:
+        """Window (seconds) for merging video status checks into one batch call"""
+        return self._config.get("flow", {}).get("poll_batch_window", 0.5)
+
+    @property
+    def poll_batch_size(self) -> int:
+        """Max operations per batchCheckAsyncVideoGenerationStatus call"""
+        return self._config.get("flow", {}).get("poll_batch_size", 50)
+
+    @property
+    def http_pool_max_size(self) -> int:
+        """Max number of pooled HTTP sessions (one per proxy/impersonate pair)"""
+        return self._config.get("flow", {}).get("session_pool_max_size", 8)
+
+    @property
+    def http_pool_max_clients(self) -> int:
+        """Max concurrent connections per pooled HTTP session"""
+        return self._config.get("flow", {}).get("session_pool_max_clients", 32)
+
+    @property
+    def http_pool_idle_timeout(self) -> int:
+        """Close pooled HTTP sessions idle for longer than this (seconds)"""
+        return self._config.get("flow", {}).get("session_pool_idle_timeout", 300)
+
+    @property
+    def at_refresh_lead(self) -> int:
+        """Seconds before at_expires at which the AT is refreshed in the background"""
+        return self._config.get("flow", {}).get("at_refresh_lead", 3600)
+
+    @property
+    def at_refresh_jitter(self) -> int:
+        """Random extra lead (seconds) so tokens expiring together refresh at different times"""
+        return self._config.get("flow", {}).get("at_refresh_jitter", 300)
+
+    @property
+    def at_refresh_concurrency(self) -> int:
+        """Max number of background AT refreshes running in parallel"""
+        return self._config.get("flow", {}).get("at_refresh_concurrency", 4)
+
+    @property
+    def token_import_concurrency(self) -> int:
+        """Max parallel Flow requests during bulk token import"""
+        return self._config.get("flow", {}).get("import_concurrency", 8)
+
+    @property
+    def token_import_rate(self) -> float:
+        """Max Flow requests per second during bulk token import (0 = unlimited)"""
+        return self._config.get("flow", {}).get("import_rate_limit", 10)
+
     @property
     def server_host(self) -> str:
         return self._config["server"]["host"]
@@ -81,6 +141,21 @@ class Config:
     def server_port(self) -> int:
         return self._config["server"]["port"]
 
+    @property
+    def db_reader_pool_size(self) -> int:
+        """Max number of pooled SQLite reader connections"""
+        return self._config.get("database", {}).get("reader_pool_size", 4)
+
+    @property
+    def stats_flush_interval_ms(self) -> int:
+        """Interval (ms) between batched token stats writes"""
+        return self._config.get("database", {}).get("stats_flush_interval_ms", 1000)
+
+    @property
+    def stats_flush_max_events(self) -> int:
+        """Flush token stats early once this many events are buffered"""
+        return self._config.get("database", {}).get("stats_flush_max_events", 200)
+
     @property
     def debug_enabled(self) -> bool:
         return self._config.get("debug", {}).get("enabled", False)
@@ -97,6 +172,26 @@ class Config:
     def debug_mask_token(self) -> bool:
         return self._config.get("debug", {}).get("mask_token", True)
 
+    @property
+    def debug_log_format(self) -> str:
+        """Log file format: "text" or "json" (one JSON object per line)"""
+        return self._config.get("debug", {}).get("log_format", "text")
+
+    @property
+    def debug_log_max_bytes(self) -> int:
+        """Rotate logs.txt when it grows beyond this size (0 = never)"""
+        return self._config.get("debug", {}).get("log_max_bytes", 10 * 1024 * 1024)
+
+    @property
+    def debug_log_backup_count(self) -> int:
+        """Number of rotated log files to keep"""
+        return self._config.get("debug", {}).get("log_backup_count", 5)
+
+    @property
+    def debug_log_rotate_when(self) -> str:
+        """Time-based rotation interval (e.g. "midnight", "H"); empty uses size-based rotation"""
+        return self._config.get("debug", {}).get("log_rotate_when", "")
+
     # Mutable properties for runtime updates
     @property
     def api_key(self) -> str:
@@ -150,6 +245,36 @@ class Config:
             self._config["generation"] = {}
         self._config["generation"]["video_timeout"] = timeout
 
+    @property
+    def queue_timeout(self) -> float:
+        """Max seconds a request waits for a free token slot (0 = reject immediately)"""
+        return self._config.get("generation", {}).get("queue_timeout", 60)
+
+    @property
+    def queue_max_length(self) -> int:
+        """Max waiting requests per generation type before rejecting with 429"""
+        return self._config.get("generation", {}).get("queue_max_length", 100)
+
+    @property
+    def upload_cache_ttl(self) -> int:
+        """Seconds an uploaded reference image's mediaGenerationId is reused (0 disables)"""
+        return self._config.get("generation", {}).get("upload_cache_ttl", 3600)
+
+    @property
+    def upload_cache_max_entries(self) -> int:
+        """Max cached reference image uploads"""
+        return self._config.get("generation", {}).get("upload_cache_max_entries", 1000)
+
+    @property
+    def upload_concurrency(self) -> int:
+        """Max concurrent reference image uploads per token"""
+        return self._config.get("generation", {}).get("upload_concurrency", 4)
+
+    @property
+    def max_image_bytes(self) -> int:
+        """Max size of a referenced image fetched from a URL (0 = unlimited)"""
+        return self._config.get("generation", {}).get("max_image_bytes", 20 * 1024 * 1024)
+
     @property
     def upsample_timeout(self) -> int:
         """Get upsample (4K/2K) timeout in seconds"""
@@ -195,6 +320,16 @@ class Config:
             self._config["cache"] = {}
         self._config["cache"]["base_url"] = base_url
 
+    @property
+    def cache_max_file_size(self) -> int:
+        """Max size (bytes) of a single cached file (0 = unlimited)"""
+        return self._config.get("cache", {}).get("max_file_size", 2 * 1024 * 1024 * 1024)
+
+    @property
+    def cache_max_size(self) -> int:
+        """Max total size (bytes) of the cache directory; least recently used files are evicted beyond it (0 = unlimited)"""
+        return self._config.get("cache", {}).get("max_size", 10 * 1024 * 1024 * 1024)
+
     # Captcha configuration
     @property
     def captcha_method(self) -> str:
@@ -295,6 +430,36 @@ class Config:
             self._config["captcha"] = {}
         self._config["captcha"]["capsolver_base_url"] = base_url
 
+    @property
+    def captcha_race_providers(self) -> list:
+        """Extra API captcha providers raced against captcha_method"""
+        return self._config.get("captcha", {}).get("race_providers", [])
+
+    # Captcha token pool configuration
+    @property
+    def captcha_pool_enabled(self) -> bool:
+        """Whether reCAPTCHA tokens are pre-solved in the background"""
+        return self._config.get("captcha", {}).get("pool_enabled", False)
+
+    @property
+    def captcha_pool_max_size(self) -> int:
+        """Max pre-solved tokens kept per (project_id, action)"""
+        return self._config.get("captcha", {}).get("pool_max_size", 3)
+
+    @property
+    def captcha_pool_token_ttl(self) -> int:
+        """Discard pre-solved tokens older than this (seconds)"""
+        return self._config.get("captcha", {}).get("pool_token_ttl", 90)
+
+    @property
+    def captcha_pool_idle_timeout(self) -> int:
+        """Stop prefetching for a key after this long without requests (seconds)"""
+        return self._config.get("captcha", {}).get("pool_idle_timeout", 120)
+
+    @property
+    def browser_recycle_after(self) -> int:
+        """Restart a captcha browser process after this many solves"""
+        return self._config.get("captcha", {}).get("browser_recycle_after", 50)
 
 # Global config instance
 config = Config()
@@ -1,11 +1,18 @@
 """Database storage layer for Flow2API"""
+import asyncio
 import aiosqlite
 import json
+from contextlib import asynccontextmanager
 from datetime import datetime
-from typing import Optional, List
+from typing import Optional, List, Dict, Callable, Awaitable
 from pathlib import Path
+from .config import config
 from .models import Token, TokenStats, Task, RequestLog, AdminConfig, ProxyConfig, GenerationConfig, CacheConfig, Project, CaptchaConfig, PluginConfig
 
+# Token columns that update_token/import_tokens write even when the value is None
+# (other None values mean "leave unchanged"), so a 429 ban can be cleared
+CLEARABLE_TOKEN_FIELDS = frozenset({"ban_reason", "banned_at"})
+
 
 class Database:
     """SQLite database manager"""
@@ -18,10 +25,86 @@ class Database:
             db_path = str(data_dir / "flow.db")
         self.db_path = db_path
 
+        # 进程生命周期内复用的连接: 一个写连接 + 读连接池
+        self._writer: Optional[aiosqlite.Connection] = None
+        self._write_lock = asyncio.Lock()
+        self._readers: Optional[asyncio.Queue] = None
+        self._reader_count = 0
+        self._closed = False
+
+        # tokens 表变更监听器: (event, token_id, fields)，event 为 added/updated/deleted
+        self._token_listeners: List[Callable[[str, int, Dict], Awaitable[None]]] = []
+
     def db_exists(self) -> bool:
         """Check if database file exists"""
         return Path(self.db_path).exists()
 
+    async def _open_connection(self) -> aiosqlite.Connection:
+        """Open a long-lived connection with WAL enabled"""
+        conn = await aiosqlite.connect(self.db_path, cached_statements=256)
+        conn.row_factory = aiosqlite.Row
+        await conn.execute("PRAGMA journal_mode=WAL")
+        await conn.execute("PRAGMA synchronous=NORMAL")
+        await conn.execute("PRAGMA busy_timeout=5000")
+        return conn
+
+    @asynccontextmanager
+    async def _write(self):
+        """Borrow the single writer connection (serialized)
+
+        Commits on success if a transaction is still open, rolls back on error.
+        """
+        async with self._write_lock:
+            if self._writer is None:
+                self._writer = await self._open_connection()
+            db = self._writer
+            try:
+                yield db
+                if db.in_transaction:
+                    await db.commit()
+            except BaseException:
+                if db.in_transaction:
+                    await db.rollback()
+                raise
+
+    @asynccontextmanager
+    async def _read(self):
+        """Borrow a reader connection from the pool"""
+        if self._readers is None:
+            self._readers = asyncio.Queue()
+
+        if self._readers.empty() and self._reader_count < config.db_reader_pool_size:
+            self._reader_count += 1
+            try:
+                db = await self._open_connection()
+            except Exception:
+                self._reader_count -= 1
+                raise
+        else:
+            db = await self._readers.get()
+
+        try:
+            yield db
+        finally:
+            if self._closed:
+                await db.close()
+            else:
+                if db.in_transaction:
+                    await db.rollback()
+                self._readers.put_nowait(db)
+
+    async def close(self):
+        """Close all pooled connections (called on shutdown)"""
+        self._closed = True
+        async with self._write_lock:
+            if self._writer is not None:
+                await self._writer.close()
+                self._writer = None
+        if self._readers is not None:
+            while not self._readers.empty():
+                await self._readers.get_nowait().close()
+                self._reader_count -= 1
+
     async def _table_exists(self, db, table_name: str) -> bool:
         """Check if a table exists in the database"""
         cursor = await db.execute(
@@ -189,7 +272,7 @@ class Database:
                         Used only to initialize missing config rows with default values.
                         Existing config rows will NOT be overwritten.
         """
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._write() as db:
             print("Checking database integrity and performing migrations...")
 
             # ========== Step 1: Create missing tables ==========
@@ -343,7 +426,7 @@ class Database:
 
     async def init_db(self):
         """Initialize database tables"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._write() as db:
             # Tokens table (Flow2API版本)
             await db.execute("""
                 CREATE TABLE IF NOT EXISTS tokens (
@@ -595,34 +678,92 @@ class Database:
             print(f"⚠️ request_logs表迁移失败: {e}")
             # Continue even if migration fails
 
+    def add_token_listener(self, listener: Callable[[str, int, Dict], Awaitable[None]]):
+        """Register a callback invoked after tokens rows are added/updated/deleted"""
+        self._token_listeners.append(listener)
+
+    async def _notify_token_changed(self, event: str, token_id: int, fields: Optional[Dict] = None):
+        for listener in self._token_listeners:
+            try:
+                await listener(event, token_id, fields or {})
+            except Exception as e:
+                print(f"⚠️ Token listener failed ({event} {token_id}): {e}")
+
     # Token operations
+    async def _insert_token(self, db: aiosqlite.Connection, token: Token) -> int:
+        """Insert token row and its stats entry (caller commits)"""
+        cursor = await db.execute("""
+            INSERT INTO tokens (st, at, at_expires, email, name, remark, is_active,
+                               credits, user_paygate_tier, current_project_id, current_project_name,
+                               image_enabled, video_enabled, image_concurrency, video_concurrency)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, (token.st, token.at, token.at_expires, token.email, token.name, token.remark,
+              token.is_active, token.credits, token.user_paygate_tier,
+              token.current_project_id, token.current_project_name,
+              token.image_enabled, token.video_enabled,
+              token.image_concurrency, token.video_concurrency))
+        token_id = cursor.lastrowid
+
+        # Create stats entry
+        await db.execute("""
+            INSERT INTO token_stats (token_id) VALUES (?)
+        """, (token_id,))
+        return token_id
+
     async def add_token(self, token: Token) -> int:
         """Add a new token"""
-        async with aiosqlite.connect(self.db_path) as db:
-            cursor = await db.execute("""
-                INSERT INTO tokens (st, at, at_expires, email, name, remark, is_active,
-                                   credits, user_paygate_tier, current_project_id, current_project_name,
-                                   image_enabled, video_enabled, image_concurrency, video_concurrency)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (token.st, token.at, token.at_expires, token.email, token.name, token.remark,
-                  token.is_active, token.credits, token.user_paygate_tier,
-                  token.current_project_id, token.current_project_name,
-                  token.image_enabled, token.video_enabled,
-                  token.image_concurrency, token.video_concurrency))
+        async with self._write() as db:
+            token_id = await self._insert_token(db, token)
             await db.commit()
-            token_id = cursor.lastrowid
 
-            # Create stats entry
-            await db.execute("""
-                INSERT INTO token_stats (token_id) VALUES (?)
-            """, (token_id,))
+        await self._notify_token_changed("added", token_id)
+        return token_id
+
+    async def import_tokens(self, new_tokens: List[Token], updates: List[tuple]) -> List[int]:
+        """Insert and update many tokens in a single transaction
+
+        Args:
+            new_tokens: Tokens to insert; a project row is created for each
+                token that has current_project_id set
+            updates: [(token_id, {field: value}), ...]; None values are skipped
+                as in update_token, except for CLEARABLE_TOKEN_FIELDS
+
+        Returns:
+            IDs of the inserted tokens, in order
+        """
+        new_ids = []
+        applied_updates = []
+        async with self._write() as db:
+            for token in new_tokens:
+                token_id = await self._insert_token(db, token)
+                new_ids.append(token_id)
+                if token.current_project_id:
+                    await db.execute("""
+                        INSERT INTO projects (project_id, token_id, project_name, tool_name, is_active)
+                        VALUES (?, ?, ?, ?, ?)
+                    """, (token.current_project_id, token_id, token.current_project_name or "", "PINHOLE", True))
+
+            for token_id, kwargs in updates:
+                fields = self._token_update_fields(kwargs)
+                if not fields:
+                    continue
+                await db.execute(
+                    f"UPDATE tokens SET {', '.join(f'{key} = ?' for key in fields)} WHERE id = ?",
+                    [*fields.values(), token_id]
+                )
+                applied_updates.append((token_id, fields))
+
             await db.commit()
 
-            return token_id
+        for token_id in new_ids:
+            await self._notify_token_changed("added", token_id)
+        for token_id, fields in applied_updates:
+            await self._notify_token_changed("updated", token_id, fields)
+        return new_ids
 
     async def get_token(self, token_id: int) -> Optional[Token]:
         """Get token by ID"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._read() as db:
             db.row_factory = aiosqlite.Row
             cursor = await db.execute("SELECT * FROM tokens WHERE id = ?", (token_id,))
             row = await cursor.fetchone()
@@ -632,7 +773,7 @@ class Database:
 
     async def get_token_by_st(self, st: str) -> Optional[Token]:
         """Get token by ST"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._read() as db:
             db.row_factory = aiosqlite.Row
             cursor = await db.execute("SELECT * FROM tokens WHERE st = ?", (st,))
             row = await cursor.fetchone()
@@ -642,7 +783,7 @@ class Database:
 
     async def get_token_by_email(self, email: str) -> Optional[Token]:
         """Get token by email"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._read() as db:
             db.row_factory = aiosqlite.Row
             cursor = await db.execute("SELECT * FROM tokens WHERE email = ?", (email,))
             row = await cursor.fetchone()
@@ -652,49 +793,149 @@ class Database:
 
     async def get_all_tokens(self) -> List[Token]:
         """Get all tokens"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._read() as db:
             db.row_factory = aiosqlite.Row
             cursor = await db.execute("SELECT * FROM tokens ORDER BY created_at DESC")
             rows = await cursor.fetchall()
             return [Token(**dict(row)) for row in rows]
 
+    # 管理后台 token 列表允许的排序字段
+    TOKEN_SORT_COLUMNS = {
+        "id": "t.id",
+        "created_at": "t.created_at",
+        "last_used_at": "t.last_used_at",
+        "use_count": "t.use_count",
+        "credits": "t.credits",
+        "email": "t.email",
+        "image_count": "image_count",
+        "video_count": "video_count",
+        "error_count": "error_count",
+    }
+
+    async def get_tokens_with_stats(
+        self,
+        search: Optional[str] = None,
+        is_active: Optional[bool] = None,
+        sort: str = "created_at",
+        descending: bool = True,
+        limit: Optional[int] = None,
+        offset: int = 0
+    ) -> tuple:
+        """Get tokens joined with their stats in one query
+
+        Returns:
+            ([(Token, {"image_count", "video_count", "error_count"}), ...], total matching rows)
+        """
+        conditions = []
+        params: List = []
+        if search:
+            conditions.append("(t.email LIKE ? OR t.name LIKE ? OR t.remark LIKE ?)")
+            params.extend([f"%{search}%"] * 3)
+        if is_active is not None:
+            conditions.append("t.is_active = ?")
+            params.append(is_active)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+        order_column = self.TOKEN_SORT_COLUMNS.get(sort, "t.created_at")
+        direction = "DESC" if descending else "ASC"
+        paging = ""
+        paging_params: List = []
+        if limit is not None:
+            paging = "LIMIT ? OFFSET ?"
+            paging_params = [limit, offset]
+
+        async with self._read() as db:
+            cursor = await db.execute(f"SELECT COUNT(*) FROM tokens t {where}", params)
+            total = (await cursor.fetchone())[0]
+
+            cursor = await db.execute(f"""
+                SELECT t.*,
+                       COALESCE(s.image_count, 0) AS image_count,
+                       COALESCE(s.video_count, 0) AS video_count,
+                       COALESCE(s.error_count, 0) AS error_count
+                FROM tokens t
+                LEFT JOIN token_stats s ON s.token_id = t.id
+                {where}
+                ORDER BY {order_column} {direction}, t.id {direction}
+                {paging}
+            """, params + paging_params)
+            rows = await cursor.fetchall()
+
+        result = []
+        for row in rows:
+            data = dict(row)
+            stats = {key: data.pop(key) for key in ("image_count", "video_count", "error_count")}
+            result.append((Token(**data), stats))
+        return result, total
+
+    async def get_dashboard_stats(self, today: str) -> Dict[str, int]:
+        """Aggregate token counts and usage stats in one query
+
+        Args:
+            today: Current date string; today_* counters from other days count as 0
+        """
+        async with self._read() as db:
+            cursor = await db.execute("""
+                SELECT COUNT(*) AS total_tokens,
+                       COALESCE(SUM(t.is_active), 0) AS active_tokens,
+                       COALESCE(SUM(s.image_count), 0) AS total_images,
+                       COALESCE(SUM(s.video_count), 0) AS total_videos,
+                       COALESCE(SUM(s.error_count), 0) AS total_errors,
+                       COALESCE(SUM(CASE WHEN s.today_date = ?1 THEN s.today_image_count ELSE 0 END), 0) AS today_images,
+                       COALESCE(SUM(CASE WHEN s.today_date = ?1 THEN s.today_video_count ELSE 0 END), 0) AS today_videos,
+                       COALESCE(SUM(CASE WHEN s.today_date = ?1 THEN s.today_error_count ELSE 0 END), 0) AS today_errors
+                FROM tokens t
+                LEFT JOIN token_stats s ON s.token_id = t.id
+            """, (today,))
+            row = await cursor.fetchone()
+            return dict(row)
+
     async def get_active_tokens(self) -> List[Token]:
         """Get all active tokens"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._read() as db:
             db.row_factory = aiosqlite.Row
             cursor = await db.execute("SELECT * FROM tokens WHERE is_active = 1 ORDER BY last_used_at ASC")
             rows = await cursor.fetchall()
             return [Token(**dict(row)) for row in rows]
 
+    @staticmethod
+    def _token_update_fields(kwargs: Dict) -> Dict:
+        """Drop None values except for CLEARABLE_TOKEN_FIELDS"""
+        return {
+            key: value for key, value in kwargs.items()
+            if value is not None or key in CLEARABLE_TOKEN_FIELDS
+        }
+
     async def update_token(self, token_id: int, **kwargs):
         """Update token fields"""
-        async with aiosqlite.connect(self.db_path) as db:
-            updates = []
-            params = []
-
-            for key, value in kwargs.items():
-                if value is not None:
-                    updates.append(f"{key} = ?")
-                    params.append(value)
+        fields = self._token_update_fields(kwargs)
+        if not fields:
+            return
+
+        async with self._write() as db:
+            updates = [f"{key} = ?" for key in fields]
+            params = list(fields.values())
+            params.append(token_id)
+            query = f"UPDATE tokens SET {', '.join(updates)} WHERE id = ?"
+            await db.execute(query, params)
+            await db.commit()
 
-            if updates:
-                params.append(token_id)
-                query = f"UPDATE tokens SET {', '.join(updates)} WHERE id = ?"
-                await db.execute(query, params)
-                await db.commit()
+        await self._notify_token_changed("updated", token_id, fields)
 
     async def delete_token(self, token_id: int):
         """Delete token and related data"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._write() as db:
             await db.execute("DELETE FROM token_stats WHERE token_id = ?", (token_id,))
             await db.execute("DELETE FROM projects WHERE token_id = ?", (token_id,))
             await db.execute("DELETE FROM tokens WHERE id = ?", (token_id,))
             await db.commit()
 
+        await self._notify_token_changed("deleted", token_id)
+
     # Project operations
     async def add_project(self, project: Project) -> int:
         """Add a new project"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._write() as db:
             cursor = await db.execute("""
                 INSERT INTO projects (project_id, token_id, project_name, tool_name, is_active)
                 VALUES (?, ?, ?, ?, ?)
@@ -705,7 +946,7 @@ class Database:
 
     async def get_project_by_id(self, project_id: str) -> Optional[Project]:
         """Get project by UUID"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._read() as db:
             db.row_factory = aiosqlite.Row
             cursor = await db.execute("SELECT * FROM projects WHERE project_id = ?", (project_id,))
             row = await cursor.fetchone()
@@ -715,7 +956,7 @@ class Database:
 
     async def get_projects_by_token(self, token_id: int) -> List[Project]:
         """Get all projects for a token"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._read() as db:
             db.row_factory = aiosqlite.Row
             cursor = await db.execute(
                 "SELECT * FROM projects WHERE token_id = ? ORDER BY created_at DESC",
@@ -726,14 +967,14 @@ class Database:
 
     async def delete_project(self, project_id: str):
         """Delete project"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._write() as db:
             await db.execute("DELETE FROM projects WHERE project_id = ?", (project_id,))
             await db.commit()
 
     # Task operations
     async def create_task(self, task: Task) -> int:
         """Create a new task"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._write() as db:
             cursor = await db.execute("""
                 INSERT INTO tasks (task_id, token_id, model, prompt, status, progress, scene_id)
                 VALUES (?, ?, ?, ?, ?, ?, ?)
@@ -744,7 +985,7 @@ class Database:
 
     async def get_task(self, task_id: str) -> Optional[Task]:
         """Get task by ID"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._read() as db:
             db.row_factory = aiosqlite.Row
             cursor = await db.execute("SELECT * FROM tasks WHERE task_id = ?", (task_id,))
             row = await cursor.fetchone()
@@ -758,7 +999,7 @@ class Database:
 
     async def update_task(self, task_id: str, **kwargs):
         """Update task"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._write() as db:
             updates = []
             params = []
 
@@ -776,6 +1017,37 @@ class Database:
                 await db.execute(query, params)
                 await db.commit()
 
+    async def get_task_duration_stats(self, days: int = 7) -> Dict[str, Dict[str, float]]:
+        """Get per-model completion duration statistics from recent tasks
+
+        Returns:
+            {model: {"count": n, "avg": seconds, "min": seconds, "max": seconds}}
+        """
+        async with self._read() as db:
+            db.row_factory = aiosqlite.Row
+            # created_at 为 CURRENT_TIMESTAMP (UTC 文本)，completed_at 为 time.time() 写入的时间戳
+            cursor = await db.execute("""
+                SELECT model, COUNT(*) AS count, AVG(duration) AS avg,
+                       MIN(duration) AS min, MAX(duration) AS max
+                FROM (
+                    SELECT model,
+                           CAST(completed_at AS REAL) - CAST(strftime('%s', created_at) AS REAL) AS duration
+                    FROM tasks
+                    WHERE status = 'completed'
+                      AND typeof(completed_at) IN ('real', 'integer')
+                      AND created_at >= datetime('now', ?)
+                )
+                WHERE duration > 0
+                GROUP BY model
+            """, (f"-{days} days",))
+            rows = await cursor.fetchall()
+            return {row["model"]: {
+                "count": row["count"],
+                "avg": row["avg"],
+                "min": row["min"],
+                "max": row["max"]
+            } for row in rows}
+
     # Token stats operations (kept for compatibility, now delegates to specific methods)
     async def increment_token_stats(self, token_id: int, stat_type: str):
         """Increment token statistics (delegates to specific methods)"""
@@ -788,7 +1060,7 @@ class Database:
 
     async def get_token_stats(self, token_id: int) -> Optional[TokenStats]:
         """Get token statistics"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._read() as db:
             db.row_factory = aiosqlite.Row
             cursor = await db.execute("SELECT * FROM token_stats WHERE token_id = ?", (token_id,))
             row = await cursor.fetchone()
@@ -799,7 +1071,7 @@ class Database:
     async def increment_image_count(self, token_id: int):
         """Increment image generation count with daily reset"""
         from datetime import date
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._write() as db:
             today = str(date.today())
             # Get current stats
             cursor = await db.execute("SELECT today_date FROM token_stats WHERE token_id = ?", (token_id,))
@@ -828,7 +1100,7 @@ class Database:
     async def increment_video_count(self, token_id: int):
         """Increment video generation count with daily reset"""
         from datetime import date
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._write() as db:
             today = str(date.today())
             # Get current stats
             cursor = await db.execute("SELECT today_date FROM token_stats WHERE token_id = ?", (token_id,))
@@ -863,7 +1135,7 @@ class Database:
         - today_error_count: Today's errors (reset on date change)
         """
         from datetime import date
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._write() as db:
             today = str(date.today())
             # Get current stats
             cursor = await db.execute("SELECT today_date FROM token_stats WHERE token_id = ?", (token_id,))
@@ -902,16 +1174,52 @@ class Database:
 
         Note: error_count (total historical errors) is NEVER reset
         """
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._write() as db:
             await db.execute("""
                 UPDATE token_stats SET consecutive_error_count = 0 WHERE token_id = ?
             """, (token_id,))
             await db.commit()
 
+    async def apply_token_stats_batch(self, today: str, stats_rows: List[tuple], usage_rows: List[tuple]):
+        """Apply aggregated token counters in a single transaction
+
+        Args:
+            today: Date string the counters belong to (for daily reset)
+            stats_rows: [(token_id, images, videos, errors, reset_consecutive, consecutive_delta), ...]
+                reset_consecutive=True means consecutive_error_count is replaced by consecutive_delta
+            usage_rows: [(token_id, use_count_delta, last_used_at), ...]
+        """
+        async with self._write() as db:
+            if stats_rows:
+                # SET 表达式中引用的都是更新前的值，today_date 变化时当日计数从本批次重新开始
+                await db.executemany("""
+                    UPDATE token_stats
+                    SET image_count = image_count + ?2,
+                        video_count = video_count + ?3,
+                        error_count = error_count + ?4,
+                        today_image_count = CASE WHEN today_date = ?1 THEN today_image_count + ?2 ELSE ?2 END,
+                        today_video_count = CASE WHEN today_date = ?1 THEN today_video_count + ?3 ELSE ?3 END,
+                        today_error_count = CASE WHEN today_date = ?1 THEN today_error_count + ?4 ELSE ?4 END,
+                        consecutive_error_count = CASE WHEN ?5 THEN ?6 ELSE consecutive_error_count + ?6 END,
+                        last_error_at = CASE WHEN ?4 > 0 THEN CURRENT_TIMESTAMP ELSE last_error_at END,
+                        today_date = ?1
+                    WHERE token_id = ?7
+                """, [
+                    (today, images, videos, errors, reset, delta, token_id)
+                    for token_id, images, videos, errors, reset, delta in stats_rows
+                ])
+            if usage_rows:
+                await db.executemany("""
+                    UPDATE tokens
+                    SET use_count = use_count + ?, last_used_at = ?
+                    WHERE id = ?
+                """, [(count, last_used_at, token_id) for token_id, count, last_used_at in usage_rows])
+            await db.commit()
+
     # Config operations
     async def get_admin_config(self) -> Optional[AdminConfig]:
         """Get admin configuration"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._read() as db:
             db.row_factory = aiosqlite.Row
             cursor = await db.execute("SELECT * FROM admin_config WHERE id = 1")
             row = await cursor.fetchone()
@@ -921,7 +1229,7 @@ class Database:
 
     async def update_admin_config(self, **kwargs):
         """Update admin configuration"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._write() as db:
             updates = []
             params = []
 
@@ -938,7 +1246,7 @@ class Database:
 
     async def get_proxy_config(self) -> Optional[ProxyConfig]:
         """Get proxy configuration"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._read() as db:
             db.row_factory = aiosqlite.Row
             cursor = await db.execute("SELECT * FROM proxy_config WHERE id = 1")
             row = await cursor.fetchone()
@@ -948,7 +1256,7 @@ class Database:
 
     async def update_proxy_config(self, enabled: bool, proxy_url: Optional[str] = None):
         """Update proxy configuration"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._write() as db:
             await db.execute("""
                 UPDATE proxy_config
                 SET enabled = ?, proxy_url = ?, updated_at = CURRENT_TIMESTAMP
@@ -958,7 +1266,7 @@ class Database:
 
     async def get_generation_config(self) -> Optional[GenerationConfig]:
         """Get generation configuration"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._read() as db:
             db.row_factory = aiosqlite.Row
             cursor = await db.execute("SELECT * FROM generation_config WHERE id = 1")
             row = await cursor.fetchone()
@@ -968,7 +1276,7 @@ class Database:
 
     async def update_generation_config(self, image_timeout: int, video_timeout: int):
         """Update generation configuration"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._write() as db:
             await db.execute("""
                 UPDATE generation_config
                 SET image_timeout = ?, video_timeout = ?, updated_at = CURRENT_TIMESTAMP
@@ -979,7 +1287,7 @@ class Database:
     # Request log operations
     async def add_request_log(self, log: RequestLog):
         """Add request log"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._write() as db:
             await db.execute("""
                 INSERT INTO request_logs (token_id, operation, request_body, response_body, status_code, duration)
                 VALUES (?, ?, ?, ?, ?, ?)
@@ -989,7 +1297,7 @@ class Database:
 
     async def get_logs(self, limit: int = 100, token_id: Optional[int] = None):
         """Get request logs with token email"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._read() as db:
             db.row_factory = aiosqlite.Row
 
             if token_id:
@@ -1035,7 +1343,7 @@ class Database:
 
     async def clear_all_logs(self):
         """Clear all request logs"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._write() as db:
             await db.execute("DELETE FROM request_logs")
             await db.commit()
 
@@ -1048,7 +1356,7 @@ class Database:
             is_first_startup: If True, initialize all config rows from setting.toml.
                             If False (upgrade mode), only ensure missing config rows exist with default values.
         """
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._write() as db:
             if is_first_startup:
                 # First startup: Initialize all config tables with values from setting.toml
                 await self._ensure_config_rows(db, config_dict)
@@ -1112,7 +1420,7 @@ class Database:
     # Cache config operations
     async def get_cache_config(self) -> CacheConfig:
         """Get cache configuration"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._read() as db:
             db.row_factory = aiosqlite.Row
             cursor = await db.execute("SELECT * FROM cache_config WHERE id = 1")
             row = await cursor.fetchone()
@@ -1123,7 +1431,7 @@ class Database:
 
     async def update_cache_config(self, enabled: bool = None, timeout: int = None, base_url: Optional[str] = None):
         """Update cache configuration"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._write() as db:
             db.row_factory = aiosqlite.Row
             # Get current values
             cursor = await db.execute("SELECT * FROM cache_config WHERE id = 1")
@@ -1162,7 +1470,7 @@ class Database:
     async def get_debug_config(self) -> 'DebugConfig':
         """Get debug configuration"""
         from .models import DebugConfig
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._read() as db:
             db.row_factory = aiosqlite.Row
             cursor = await db.execute("SELECT * FROM debug_config WHERE id = 1")
             row = await cursor.fetchone()
@@ -1179,7 +1487,7 @@ class Database:
         mask_token: bool = None
     ):
         """Update debug configuration"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._write() as db:
             db.row_factory = aiosqlite.Row
             # Get current values
             cursor = await db.execute("SELECT * FROM debug_config WHERE id = 1")
@@ -1215,7 +1523,7 @@ class Database:
     # Captcha config operations
     async def get_captcha_config(self) -> CaptchaConfig:
         """Get captcha configuration"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._read() as db:
             db.row_factory = aiosqlite.Row
             cursor = await db.execute("SELECT * FROM captcha_config WHERE id = 1")
             row = await cursor.fetchone()
@@ -1239,7 +1547,7 @@ class Database:
         browser_count: int = None
     ):
         """Update captcha configuration"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._write() as db:
             db.row_factory = aiosqlite.Row
             cursor = await db.execute("SELECT * FROM captcha_config WHERE id = 1")
             row = await cursor.fetchone()
@@ -1296,7 +1604,7 @@ class Database:
     # Plugin config operations
     async def get_plugin_config(self) -> PluginConfig:
         """Get plugin configuration"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._read() as db:
             db.row_factory = aiosqlite.Row
             cursor = await db.execute("SELECT * FROM plugin_config WHERE id = 1")
             row = await cursor.fetchone()
@@ -1306,7 +1614,7 @@ class Database:
 
     async def update_plugin_config(self, connection_token: str, auto_enable_on_update: bool = True):
         """Update plugin configuration"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._write() as db:
             db.row_factory = aiosqlite.Row
             cursor = await db.execute("SELECT * FROM plugin_config WHERE id = 1")
             row = await cursor.fetchone()
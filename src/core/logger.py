@@ -1,20 +1,41 @@
-"""Debug logger module for detailed API request/response logging"""
+"""Debug logger module for detailed API request/response logging
+
+日志通过 QueueHandler 投递到后台线程 (QueueListener) 写入文件，
+事件循环中只做入队，不做磁盘 IO。
+"""
+import atexit
 import json
 import logging
+import logging.handlers
+import queue
 from datetime import datetime
 from pathlib import Path
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional
 from .config import config
 
+
+class _JsonLineFormatter(logging.Formatter):
+    """One JSON object per log entry"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        return json.dumps({
+            "time": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname.lower(),
+            "message": record.getMessage()
+        }, ensure_ascii=False)
+
+
 class DebugLogger:
     """Debug logger for API requests and responses"""
 
     def __init__(self):
         self.log_file = Path("logs.txt")
+        self._listener: Optional[logging.handlers.QueueListener] = None
         self._setup_logger()
+        atexit.register(self.close)
 
     def _setup_logger(self):
-        """Setup file logger"""
+        """Setup queue-backed file logger"""
         # Create logger
         self.logger = logging.getLogger("debug_logger")
         self.logger.setLevel(logging.DEBUG)
@@ -22,27 +43,60 @@ class DebugLogger:
         # Remove existing handlers
         self.logger.handlers.clear()
 
-        # Create file handler
-        file_handler = logging.FileHandler(
-            self.log_file,
-            mode='a',
-            encoding='utf-8'
-        )
+        # Create rotating file handler (文件在首次写入时才创建)
+        if config.debug_log_rotate_when:
+            file_handler = logging.handlers.TimedRotatingFileHandler(
+                self.log_file,
+                when=config.debug_log_rotate_when,
+                backupCount=config.debug_log_backup_count,
+                encoding='utf-8',
+                delay=True
+            )
+        else:
+            file_handler = logging.handlers.RotatingFileHandler(
+                self.log_file,
+                mode='a',
+                maxBytes=config.debug_log_max_bytes,
+                backupCount=config.debug_log_backup_count,
+                encoding='utf-8',
+                delay=True
+            )
         file_handler.setLevel(logging.DEBUG)
 
         # Create formatter
-        formatter = logging.Formatter(
-            '%(message)s',
-            datefmt='%Y-%m-%d %H:%M:%S'
-        )
+        if config.debug_log_format == "json":
+            formatter = _JsonLineFormatter()
+        else:
+            formatter = logging.Formatter(
+                '%(message)s',
+                datefmt='%Y-%m-%d %H:%M:%S'
+            )
         file_handler.setFormatter(formatter)
 
-        # Add handler
-        self.logger.addHandler(file_handler)
+        # 事件循环只负责入队，由后台线程写文件
+        log_queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._listener = logging.handlers.QueueListener(log_queue, file_handler, respect_handler_level=True)
+        self._listener.start()
+        self.logger.addHandler(logging.handlers.QueueHandler(log_queue))
 
         # Prevent propagation to root logger
         self.logger.propagate = False
 
+    def close(self):
+        """Flush queued records and stop the writer thread"""
+        if self._listener:
+            self._listener.stop()
+            self._listener = None
+
+    @property
+    def enabled(self) -> bool:
+        """Whether debug logging is on; check before building expensive messages"""
+        return config.debug_enabled
+
+    def _emit(self, lines: List[str], level: int = logging.INFO):
+        """Write a multi-line block as a single log record"""
+        self.logger.log(level, "\n".join(lines))
+
     def _mask_token(self, token: str) -> str:
         """Mask token for logging (show first 6 and last 6 characters)"""
         if not config.debug_mask_token or len(token) <= 12:
@@ -53,10 +107,6 @@ class DebugLogger:
         """Format current timestamp"""
         return datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
 
-    def _write_separator(self, char: str = "=", length: int = 100):
-        """Write separator line"""
-        self.logger.info(char * length)
-
     def _truncate_large_fields(self, data: Any, max_length: int = 200) -> Any:
         """对大字段进行截断处理，特别是 base64 编码的图片数据
         
@@ -98,16 +148,16 @@ class DebugLogger:
             return
 
         try:
-            self._write_separator()
-            self.logger.info(f"🔵 [REQUEST] {self._format_timestamp()}")
-            self._write_separator("-")
+            lines = ["=" * 100]
+            lines.append(f"🔵 [REQUEST] {self._format_timestamp()}")
+            lines.append("-" * 100)
 
             # Basic info
-            self.logger.info(f"Method: {method}")
-            self.logger.info(f"URL: {url}")
+            lines.append(f"Method: {method}")
+            lines.append(f"URL: {url}")
 
             # Headers
-            self.logger.info("\n📋 Headers:")
+            lines.append("\n📋 Headers:")
             masked_headers = dict(headers)
             if "Authorization" in masked_headers or "authorization" in masked_headers:
                 auth_key = "Authorization" if "Authorization" in masked_headers else "authorization"
@@ -126,35 +176,36 @@ class DebugLogger:
                         masked_headers["Cookie"] = f"__Secure-next-auth.session-token={self._mask_token(st_token)}"
 
             for key, value in masked_headers.items():
-                self.logger.info(f"  {key}: {value}")
+                lines.append(f"  {key}: {value}")
 
             # Body
             if body is not None:
-                self.logger.info("\n📦 Request Body:")
+                lines.append("\n📦 Request Body:")
                 if isinstance(body, (dict, list)):
                     body_str = json.dumps(body, indent=2, ensure_ascii=False)
-                    self.logger.info(body_str)
+                    lines.append(body_str)
                 else:
-                    self.logger.info(str(body))
+                    lines.append(str(body))
 
             # Files
             if files:
-                self.logger.info("\n📎 Files:")
+                lines.append("\n📎 Files:")
                 try:
                     if hasattr(files, 'keys') and callable(getattr(files, 'keys', None)):
                         for key in files.keys():
-                            self.logger.info(f"  {key}: <file data>")
+                            lines.append(f"  {key}: <file data>")
                     else:
-                        self.logger.info("  <multipart form data>")
+                        lines.append("  <multipart form data>")
                 except (AttributeError, TypeError):
-                    self.logger.info("  <binary file data>")
+                    lines.append("  <binary file data>")
 
             # Proxy
             if proxy:
-                self.logger.info(f"\n🌐 Proxy: {proxy}")
+                lines.append(f"\n🌐 Proxy: {proxy}")
 
-            self._write_separator()
-            self.logger.info("")  # Empty line
+            lines.append("=" * 100)
+            lines.append("")  # Empty line
+            self._emit(lines)
 
         except Exception as e:
             self.logger.error(f"Error logging request: {e}")
@@ -172,30 +223,30 @@ class DebugLogger:
             return
 
         try:
-            self._write_separator()
-            self.logger.info(f"🟢 [RESPONSE] {self._format_timestamp()}")
-            self._write_separator("-")
+            lines = ["=" * 100]
+            lines.append(f"🟢 [RESPONSE] {self._format_timestamp()}")
+            lines.append("-" * 100)
 
             # Status
             status_emoji = "✅" if 200 <= status_code < 300 else "❌"
-            self.logger.info(f"Status: {status_code} {status_emoji}")
+            lines.append(f"Status: {status_code} {status_emoji}")
 
             # Duration
             if duration_ms is not None:
-                self.logger.info(f"Duration: {duration_ms:.2f}ms")
+                lines.append(f"Duration: {duration_ms:.2f}ms")
 
             # Headers
-            self.logger.info("\n📋 Response Headers:")
+            lines.append("\n📋 Response Headers:")
             for key, value in headers.items():
-                self.logger.info(f"  {key}: {value}")
+                lines.append(f"  {key}: {value}")
 
             # Body
-            self.logger.info("\n📦 Response Body:")
+            lines.append("\n📦 Response Body:")
             if isinstance(body, (dict, list)):
                 # 对大字段进行截断处理
                 body_to_log = self._truncate_large_fields(body)
                 body_str = json.dumps(body_to_log, indent=2, ensure_ascii=False)
-                self.logger.info(body_str)
+                lines.append(body_str)
             elif isinstance(body, str):
                 # Try to parse as JSON
                 try:
@@ -203,18 +254,19 @@ class DebugLogger:
                     # 对大字段进行截断处理
                     parsed = self._truncate_large_fields(parsed)
                     body_str = json.dumps(parsed, indent=2, ensure_ascii=False)
-                    self.logger.info(body_str)
+                    lines.append(body_str)
                 except:
                     # Not JSON, log as text (limit length)
                     if len(body) > 2000:
-                        self.logger.info(f"{body[:2000]}... (truncated)")
+                        lines.append(f"{body[:2000]}... (truncated)")
                     else:
-                        self.logger.info(body)
+                        lines.append(body)
             else:
-                self.logger.info(str(body))
+                lines.append(str(body))
 
-            self._write_separator()
-            self.logger.info("")  # Empty line
+            lines.append("=" * 100)
+            lines.append("")  # Empty line
+            self._emit(lines)
 
         except Exception as e:
             self.logger.error(f"Error logging response: {e}")
@@ -231,49 +283,57 @@ class DebugLogger:
             return
 
         try:
-            self._write_separator()
-            self.logger.info(f"🔴 [ERROR] {self._format_timestamp()}")
-            self._write_separator("-")
+            lines = ["=" * 100]
+            lines.append(f"🔴 [ERROR] {self._format_timestamp()}")
+            lines.append("-" * 100)
 
             if status_code:
-                self.logger.info(f"Status Code: {status_code}")
+                lines.append(f"Status Code: {status_code}")
 
-            self.logger.info(f"Error Message: {error_message}")
+            lines.append(f"Error Message: {error_message}")
 
             if response_text:
-                self.logger.info("\n📦 Error Response:")
+                lines.append("\n📦 Error Response:")
                 # Try to parse as JSON
                 try:
                     parsed = json.loads(response_text)
                     body_str = json.dumps(parsed, indent=2, ensure_ascii=False)
-                    self.logger.info(body_str)
+                    lines.append(body_str)
                 except:
                     # Not JSON, log as text
                     if len(response_text) > 2000:
-                        self.logger.info(f"{response_text[:2000]}... (truncated)")
+                        lines.append(f"{response_text[:2000]}... (truncated)")
                     else:
-                        self.logger.info(response_text)
+                        lines.append(response_text)
 
-            self._write_separator()
-            self.logger.info("")  # Empty line
+            lines.append("=" * 100)
+            lines.append("")  # Empty line
+            self._emit(lines)
 
         except Exception as e:
             self.logger.error(f"Error logging error: {e}")
 
-    def log_info(self, message: str):
-        """Log general info message to log.txt"""
+    def log_info(self, message: str, *args):
+        """Log general info message to log.txt
+
+        args 非空时按 message % args 延迟格式化，调试关闭时不产生格式化开销
+        """
         if not config.debug_enabled:
             return
         try:
+            if args:
+                message = message % args
             self.logger.info(f"ℹ️  [{self._format_timestamp()}] {message}")
         except Exception as e:
             self.logger.error(f"Error logging info: {e}")
 
-    def log_warning(self, message: str):
+    def log_warning(self, message: str, *args):
         """Log warning message to log.txt"""
         if not config.debug_enabled:
             return
         try:
+            if args:
+                message = message % args
             self.logger.warning(f"⚠️  [{self._format_timestamp()}] {message}")
         except Exception as e:
             self.logger.error(f"Error logging warning: {e}")
@@ -3,17 +3,20 @@ from fastapi import FastAPI
 from fastapi.responses import HTMLResponse, FileResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
+import asyncio
 from contextlib import asynccontextmanager
 from pathlib import Path
 
 from .core.config import config
 from .core.database import Database
+from .core.logger import debug_logger
 from .services.flow_client import FlowClient
 from .services.proxy_manager import ProxyManager
 from .services.token_manager import TokenManager
 from .services.load_balancer import LoadBalancer
 from .services.concurrency_manager import ConcurrencyManager
 from .services.generation_handler import GenerationHandler
+from .services.http_session_pool import http_session_pool
 from .api import routes, admin
 
 
@@ -81,6 +84,7 @@ async def lifespan(app: FastAPI):
 
     # Initialize browser captcha service if needed
     browser_service = None
+    browser_warmup_task = None
     if captcha_config.captcha_method == "personal":
         from .services.browser_captcha_personal import BrowserCaptchaService
         browser_service = await BrowserCaptchaService.get_instance(db)
@@ -107,6 +111,18 @@ async def lifespan(app: FastAPI):
         browser_service = await BrowserCaptchaService.get_instance(db)
         print("✓ Browser captcha service initialized (headless mode)")
 
+        # 后台预热浏览器：使用第一个可用token的project_id预加载 reCAPTCHA
+        warmup_project_id = None
+        for t in await token_manager.get_all_tokens():
+            if t.current_project_id and t.is_active:
+                warmup_project_id = t.current_project_id
+                break
+        browser_warmup_task = asyncio.create_task(browser_service.warmup(warmup_project_id))
+        print("✓ Browser captcha warm-up started")
+
+    # Load in-memory token registry
+    await token_manager.registry.load()
+
     # Initialize concurrency manager
     tokens = await token_manager.get_all_tokens()
 
@@ -115,15 +131,19 @@ async def lifespan(app: FastAPI):
     # Start file cache cleanup task
     await generation_handler.file_cache.start_cleanup_task()
 
-    # Start 429 auto-unban and ST auto-refresh task
-    import asyncio
+    # Start batched token stats writer
+    await token_manager.stats_writer.start()
+
+    # Start proactive AT/ST refresh scheduler
+    await token_manager.refresh_scheduler.start()
+
+    # Start 429 auto-unban task
     async def auto_maintenance_task():
-        """定时任务：每小时检查并解禁429被禁用的token，以及刷新过期的ST"""
+        """定时任务：每小时检查并解禁429被禁用的token (ST/AT 刷新由 refresh_scheduler 负责)"""
         while True:
             try:
                 await asyncio.sleep(3600)  # 每小时执行一次
                 await token_manager.auto_unban_429_tokens()
-                await token_manager.auto_refresh_st_tokens()
             except Exception as e:
                 print(f"❌ Auto-maintenance task error: {e}")
 
@@ -133,7 +153,9 @@ async def lifespan(app: FastAPI):
     print(f"✓ Total tokens: {len(tokens)}")
     print(f"✓ Cache: {'Enabled' if config.cache_enabled else 'Disabled'} (timeout: {config.cache_timeout}s)")
     print(f"✓ File cache cleanup task started")
-    print(f"✓ Auto-maintenance task started (429 unban + ST refresh, runs every hour)")
+    print(f"✓ Token stats writer started (flush every {config.stats_flush_interval_ms}ms)")
+    print(f"✓ AT refresh scheduler started (refresh {config.at_refresh_lead}s before expiry)")
+    print(f"✓ Auto-maintenance task started (429 unban, runs every hour)")
     print(f"✓ Server running on http://{config.server_host}:{config.server_port}")
     print("=" * 60)
 
@@ -143,18 +165,42 @@ async def lifespan(app: FastAPI):
     print("Flow2API Shutting down...")
     # Stop file cache cleanup task
     await generation_handler.file_cache.stop_cleanup_task()
+    # Stop AT refresh scheduler
+    await token_manager.refresh_scheduler.close()
     # Stop auto-maintenance task
     auto_maintenance_task_handle.cancel()
     try:
         await auto_maintenance_task_handle
     except asyncio.CancelledError:
         pass
+    # Stop browser warm-up before closing the browsers it may still be launching
+    if browser_warmup_task:
+        browser_warmup_task.cancel()
+        try:
+            await browser_warmup_task
+        except asyncio.CancelledError:
+            pass
     # Close browser if initialized
     if browser_service:
         await browser_service.close()
         print("✓ Browser captcha service closed")
+    # Stop reCAPTCHA token prefetching
+    await flow_client.captcha_pool.close()
+    # Cancel pending batched video status checks
+    await generation_handler.video_poller.close()
+    # Close pooled HTTP sessions
+    await http_session_pool.close()
+    # Flush buffered token stats before closing the database
+    await token_manager.stats_writer.close()
+    # Close database connections
+    await db.close()
     print("✓ File cache cleanup task stopped")
     print("✓ Auto-maintenance task stopped")
+    print("✓ HTTP session pool closed")
+    print("✓ Token stats flushed")
+    print("✓ Database connections closed")
+    # Flush queued debug log records
+    debug_logger.close()
 
 
 # Initialize components
@@ -0,0 +1,157 @@
+"""Admission queue for saturated tokens
+
+所有 Token 的并发槽位都被占满时，请求按生成类型 (image/video) 进入 FIFO 队列等待，
+有槽位释放时由队首请求重试预留；超过等待期限返回失败，队列过长时直接拒绝 (429)。
+"""
+import asyncio
+import math
+import time
+from collections import deque
+from typing import AsyncGenerator, Deque, Dict, Optional, Union
+from ..core.config import config
+from ..core.logger import debug_logger
+from .load_balancer import LoadBalancer, NoEligibleTokenError, TokenLease
+
+
+# 排队期间即使没有槽位释放也定期重试 (Token 启用/并发调整不会触发释放通知)
+RETRY_INTERVAL = 5.0
+# 没有历史数据时建议客户端重试的等待时间(秒)
+DEFAULT_RETRY_AFTER = 5
+
+
+class QueueFullError(Exception):
+    """排队人数已达上限"""
+
+    def __init__(self, kind: str, retry_after: int):
+        super().__init__(f"{'图片' if kind == 'image' else '视频'}生成排队人数已满，请稍后重试")
+        self.kind = kind
+        self.retry_after = retry_after
+
+
+class _Ticket:
+    def __init__(self):
+        self.event = asyncio.Event()
+        self.enqueued_at = time.time()
+
+
+class AdmissionQueue:
+    """按生成类型排队等待并发槽位"""
+
+    def __init__(self, load_balancer: LoadBalancer):
+        self.load_balancer = load_balancer
+        self._queues: Dict[str, Deque[_Ticket]] = {"image": deque(), "video": deque()}
+        # 最近排队等待时间(秒)的指数平均，用于估算 Retry-After
+        self._avg_wait: Dict[str, float] = {}
+        load_balancer.add_release_listener(self._wake)
+
+    def _wake(self, kind: str):
+        """唤醒该类型所有排队请求 (队首重试预留，其余更新位置)"""
+        for ticket in self._queues.get(kind, ()):
+            ticket.event.set()
+
+    def retry_after(self, kind: str) -> int:
+        """估算客户端应等待多久再重试(秒)"""
+        avg_wait = self._avg_wait.get(kind)
+        if avg_wait is None:
+            return DEFAULT_RETRY_AFTER
+        return max(1, math.ceil(avg_wait))
+
+    def check_capacity(self, kind: str):
+        """队列已满时抛出 QueueFullError (在开始生成前调用，以便返回 429)"""
+        if len(self._queues[kind]) >= config.queue_max_length:
+            raise QueueFullError(kind, self.retry_after(kind))
+
+    def _record_wait(self, kind: str, waited: float):
+        previous = self._avg_wait.get(kind)
+        self._avg_wait[kind] = waited if previous is None else previous * 0.8 + waited * 0.2
+
+    async def admit(
+        self,
+        kind: str,
+        model: Optional[str] = None
+    ) -> AsyncGenerator[Union[int, TokenLease, None], None]:
+        """预留 Token，必要时排队等待
+
+        Yields:
+            排队位置 (int, 位置变化时产出)，最后产出 TokenLease，
+            等待超时或没有可用 Token (无需排队，立即返回) 时产出 None
+
+        Raises:
+            QueueFullError: 队列已满
+        """
+        queue = self._queues[kind]
+
+        # 没有人排队时直接尝试预留，避免插队
+        if not queue:
+            try:
+                lease = await self.load_balancer.reserve(kind, model=model)
+            except NoEligibleTokenError:
+                yield None
+                return
+            if lease:
+                yield lease
+                return
+
+        if config.queue_timeout <= 0:
+            yield None
+            return
+        self.check_capacity(kind)
+
+        ticket = _Ticket()
+        queue.append(ticket)
+        deadline = ticket.enqueued_at + config.queue_timeout
+        debug_logger.log_info(f"[QUEUE] {kind} 请求进入排队 (位置 {len(queue)})")
+
+        last_position = None
+        try:
+            while True:
+                # 先清除唤醒标记，预留或产出位置期间的释放通知不会丢失
+                ticket.event.clear()
+                position = queue.index(ticket) + 1
+                if position == 1:
+                    try:
+                        lease = await self.load_balancer.reserve(kind, model=model)
+                    except NoEligibleTokenError:
+                        # 排队期间 Token 被禁用或失效，继续等待没有意义
+                        debug_logger.log_warning(f"[QUEUE] {kind} 没有可用Token，退出排队")
+                        yield None
+                        return
+                    if lease:
+                        # 先出队再交出 lease，避免调用方迟迟不关闭生成器导致队列阻塞
+                        queue.remove(ticket)
+                        self._record_wait(kind, time.time() - ticket.enqueued_at)
+                        self._wake(kind)
+                        debug_logger.log_info(f"[QUEUE] {kind} 请求出队，等待 {time.time() - ticket.enqueued_at:.1f}s")
+                        yield lease
+                        return
+
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    debug_logger.log_warning(f"[QUEUE] {kind} 请求排队超时 ({config.queue_timeout}s)")
+                    queue.remove(ticket)
+                    self._wake(kind)
+                    yield None
+                    return
+
+                if position != last_position:
+                    last_position = position
+                    yield position
+
+                try:
+                    await asyncio.wait_for(ticket.event.wait(), timeout=min(remaining, RETRY_INTERVAL))
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            if ticket in queue:
+                queue.remove(ticket)
+                self._wake(kind)
+
+    def get_stats(self) -> dict:
+        """获取排队状态"""
+        return {
+            kind: {
+                "waiting": len(queue),
+                "retry_after": self.retry_after(kind)
+            }
+            for kind, queue in self._queues.items()
+        }
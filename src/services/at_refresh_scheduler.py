@@ -0,0 +1,170 @@
+"""Proactive AT refresh scheduler
+
+按 at_expires 维护一个最小堆，在 AT 过期前 (提前 at_refresh_lead 秒并加入随机抖动)
+后台刷新 ST/AT，限制并行数，使请求路径上的 is_at_valid 只需检查内存。
+"""
+import asyncio
+import heapq
+import itertools
+import random
+import time
+from datetime import timezone
+from typing import Dict, List, Optional, Set, Tuple
+from ..core.config import config
+from ..core.logger import debug_logger
+
+
+# 刷新后 at_expires 未变化 (例如非认证错误) 时的重试间隔(秒)，
+# 也是同一 token 两次后台刷新之间的最小间隔
+RETRY_DELAY = 300
+
+
+class AtRefreshScheduler:
+    """AT 过期前主动刷新"""
+
+    def __init__(self, token_manager):
+        self.token_manager = token_manager
+        # (due_time, token_id, version)，过期条目通过 version 惰性丢弃
+        self._heap: List[Tuple[float, int, int]] = []
+        self._versions: Dict[int, int] = {}
+        # 调度时使用的 at_expires 时间戳，未变化的更新不重新调度
+        self._expires: Dict[int, Optional[float]] = {}
+        # 刷新后在此时间之前不再调度该 token
+        self._not_before: Dict[int, float] = {}
+        self._version_counter = itertools.count(1)
+        self._running: Set[int] = set()
+        self._refresh_tasks: Set[asyncio.Task] = set()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        token_manager.db.add_token_listener(self._on_token_changed)
+
+    async def start(self):
+        """从内存 token 索引建立调度并启动后台任务"""
+        if self._task:
+            return
+        self._semaphore = asyncio.Semaphore(max(1, config.at_refresh_concurrency))
+        for token in self.token_manager.registry.all():
+            self._schedule(token.id)
+        self._task = asyncio.create_task(self._run())
+        debug_logger.log_info(f"[AT_SCHEDULER] 已调度 {len(self._versions)} 个Token")
+
+    async def close(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        tasks = list(self._refresh_tasks)
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _on_token_changed(self, event: str, token_id: int, fields: Dict):
+        if event == "deleted":
+            self._forget(token_id)
+        elif event == "added" or {"at_expires", "is_active"} & fields.keys():
+            self._schedule(token_id)
+
+    def _forget(self, token_id: int):
+        self._versions.pop(token_id, None)
+        self._expires.pop(token_id, None)
+        self._not_before.pop(token_id, None)
+
+    @staticmethod
+    def _expires_at(token) -> Optional[float]:
+        """AT 过期时间 (unix 时间戳)，没有 AT 时为 None"""
+        if not token.at or not token.at_expires:
+            return None
+        expires = token.at_expires
+        if expires.tzinfo is None:
+            expires = expires.replace(tzinfo=timezone.utc)
+        return expires.timestamp()
+
+    def _due_time(self, expires: Optional[float]) -> float:
+        """计算刷新时间 (unix 时间戳)"""
+        if expires is None:
+            return time.time()
+        jitter = random.uniform(0, max(config.at_refresh_jitter, 0))
+        return expires - config.at_refresh_lead - jitter
+
+    def _schedule(self, token_id: int, due: Optional[float] = None):
+        """(重新) 调度 token，未启用或已删除的 token 不调度
+
+        未指定 due 时按 at_expires 计算；已调度且 at_expires 未变化时保持原调度。
+        """
+        token = self.token_manager.registry.get(token_id)
+        if not token or not token.is_active:
+            self._forget(token_id)
+            return
+
+        expires = self._expires_at(token)
+        if due is None:
+            if token_id in self._versions and self._expires.get(token_id) == expires:
+                return
+            due = self._due_time(expires)
+        # 刚刷新过的 token 至少间隔 RETRY_DELAY 再刷新，避免上游返回的过期时间过近时反复刷新
+        due = max(due, self._not_before.get(token_id, 0))
+
+        version = next(self._version_counter)
+        self._versions[token_id] = version
+        self._expires[token_id] = expires
+        heapq.heappush(self._heap, (due, token_id, version))
+        self._wakeup.set()
+
+    async def _run(self):
+        while True:
+            try:
+                self._wakeup.clear()
+                now = time.time()
+                while self._heap and self._heap[0][0] <= now:
+                    _, token_id, version = heapq.heappop(self._heap)
+                    if self._versions.get(token_id) != version:
+                        continue
+                    self._running.add(token_id)
+                    self._not_before[token_id] = now + RETRY_DELAY
+                    task = asyncio.create_task(self._refresh(token_id, version))
+                    self._refresh_tasks.add(task)
+                    task.add_done_callback(self._refresh_tasks.discard)
+
+                timeout = self._heap[0][0] - now if self._heap else None
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+                except asyncio.TimeoutError:
+                    pass
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                debug_logger.log_error(f"[AT_SCHEDULER] 调度异常: {str(e)}")
+                await asyncio.sleep(1)
+
+    async def _refresh(self, token_id: int, version: int):
+        try:
+            async with self._semaphore:
+                debug_logger.log_info(f"[AT_SCHEDULER] Token {token_id}: AT 即将过期，后台刷新")
+                await self.token_manager.refresh_ahead(token_id)
+        except Exception as e:
+            debug_logger.log_error(f"[AT_SCHEDULER] Token {token_id}: 刷新异常 - {str(e)}")
+        finally:
+            self._running.discard(token_id)
+            # 刷新写入新的 at_expires 会触发重新调度；否则稍后重试
+            if self._versions.get(token_id) == version:
+                self._schedule(token_id, due=self._not_before.get(token_id, time.time() + RETRY_DELAY))
+
+    def get_stats(self) -> dict:
+        """获取调度状态"""
+        upcoming = sorted(
+            (due, token_id) for due, token_id, version in self._heap
+            if self._versions.get(token_id) == version
+        )
+        return {
+            "scheduled": len(self._versions),
+            "running": len(self._running),
+            "next": [
+                {"token_id": token_id, "in_seconds": max(0, int(due - time.time()))}
+                for due, token_id in upcoming[:10]
+            ]
+        }
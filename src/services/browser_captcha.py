@@ -18,6 +18,7 @@ from datetime import datetime
 from urllib.parse import urlparse, unquote
 
 from ..core.logger import debug_logger
+from ..core.config import config
 
 
 # ==================== Docker 环境检测 ====================
@@ -198,9 +199,10 @@ def validate_browser_proxy_url(proxy_url: str) -> tuple[bool, str]:
     return True, None
 
 class TokenBrowser:
-    """简化版浏览器：每次获取 token 时启动新浏览器，用完即关
+    """常驻浏览器：浏览器进程长期复用，每次打码使用新的隐身 context
     
-    每次都是新的随机 UA，避免长时间运行导致的各种问题
+    每个 context 都是新的随机 UA / 分辨率，保持指纹轮换；
+    浏览器在打码 N 次后或被上层举报失败时回收重启
     """
     
     # UA 池
@@ -351,17 +353,30 @@ class TokenBrowser:
         self._semaphore = asyncio.Semaphore(1)  # 同时只能有一个任务
         self._solve_count = 0
         self._error_count = 0
+        # 常驻浏览器进程
+        self._playwright = None
+        self._browser = None
+        self._browser_solves = 0  # 当前浏览器进程已完成的打码次数
+        self._needs_recycle = False
+        # 预热的 (project_id, context, page)，page 已加载 reCAPTCHA 脚本
+        self._warm: Optional[tuple] = None
+        self._warm_task: Optional[asyncio.Task] = None
     
-    async def _create_browser(self) -> tuple:
-        """创建新浏览器实例（新 UA），返回 (playwright, browser, context)"""
-        import random
+    async def _ensure_browser(self):
+        """确保浏览器进程可用，达到回收条件时重启"""
+        if (
+            self._browser
+            and self._browser.is_connected()
+            and not self._needs_recycle
+            and self._browser_solves < config.browser_recycle_after
+        ):
+            return
         
-        random_ua = random.choice(self.UA_LIST)
-        base_w, base_h = random.choice(self.RESOLUTIONS)
-        width, height = base_w, base_h - random.randint(0, 80)
-        viewport = {"width": width, "height": height}
+        if self._browser:
+            debug_logger.log_info(f"[BrowserCaptcha] Token-{self.token_id} 回收浏览器 (已打码 {self._browser_solves} 次)")
+        await self._shutdown_browser()
         
-        playwright = await async_playwright().start()
+        self._playwright = await async_playwright().start()
         Path(self.user_data_dir).mkdir(parents=True, exist_ok=True)
         
         # 代理配置
@@ -377,7 +392,7 @@ class TokenBrowser:
         except: pass
         
         try:
-            browser = await playwright.chromium.launch(
+            self._browser = await self._playwright.chromium.launch(
                 headless=False,
                 proxy=proxy_option,
                 args=[
@@ -387,71 +402,85 @@ class TokenBrowser:
                     '--disable-setuid-sandbox',
                     '--no-first-run',
                     '--no-zygote',
-                    f'--window-size={width},{height}',
                     '--disable-infobars',
                     '--hide-scrollbars',
                 ]
             )
-            context = await browser.new_context(
-                user_agent=random_ua,
-                viewport=viewport,
-            )
-            return playwright, browser, context
+            self._browser_solves = 0
+            self._needs_recycle = False
+            debug_logger.log_info(f"[BrowserCaptcha] Token-{self.token_id} 浏览器已启动")
         except Exception as e:
             debug_logger.log_error(f"[BrowserCaptcha] Token-{self.token_id} 启动浏览器失败: {type(e).__name__}: {str(e)[:200]}")
             # 确保清理已创建的对象
-            try:
-                if playwright:
-                    await playwright.stop()
-            except: pass
+            await self._shutdown_browser()
             raise
     
-    async def _close_browser(self, playwright, browser, context):
-        """关闭浏览器实例"""
+    async def _shutdown_browser(self):
+        """关闭浏览器进程（包括预热的 context）"""
+        if self._warm:
+            _, context, _ = self._warm
+            self._warm = None
+            await self._close_context(context)
         try:
-            if context:
-                await context.close()
+            if self._browser:
+                await self._browser.close()
         except: pass
         try:
-            if browser:
-                await browser.close()
+            if self._playwright:
+                await self._playwright.stop()
         except: pass
+        self._browser = None
+        self._playwright = None
+    
+    async def _new_context(self):
+        """创建新的隐身 context（新 UA + 新分辨率）"""
+        random_ua = random.choice(self.UA_LIST)
+        base_w, base_h = random.choice(self.RESOLUTIONS)
+        viewport = {"width": base_w, "height": base_h - random.randint(0, 80)}
+        return await self._browser.new_context(
+            user_agent=random_ua,
+            viewport=viewport,
+        )
+    
+    async def _close_context(self, context):
         try:
-            if playwright:
-                await playwright.stop()
+            if context:
+                await context.close()
         except: pass
     
-    async def _execute_captcha(self, context, project_id: str, website_key: str, action: str) -> Optional[str]:
-        """在给定 context 中执行打码逻辑"""
-        page = None
+    async def _prepare_page(self, context, project_id: str, website_key: str):
+        """在给定 context 中打开页面并等待 reCAPTCHA 就绪，失败返回 None"""
+        page = await context.new_page()
+        await page.add_init_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined});")
+        
+        page_url = f"https://labs.google/fx/tools/flow/project/{project_id}"
+        
+        async def handle_route(route):
+            if route.request.url.rstrip('/') == page_url.rstrip('/'):
+                html = f"""<html><head><script src="https://www.google.com/recaptcha/enterprise.js?render={website_key}"></script></head><body></body></html>"""
+                await route.fulfill(status=200, content_type="text/html", body=html)
+            elif any(d in route.request.url for d in ["google.com", "gstatic.com", "recaptcha.net"]):
+                await route.continue_()
+            else:
+                await route.abort()
+        
+        await page.route("**/*", handle_route)
+        try:
+            await page.goto(page_url, wait_until="load", timeout=30000)
+        except Exception as e:
+            debug_logger.log_warning(f"[BrowserCaptcha] Token-{self.token_id} page.goto 失败: {type(e).__name__}: {str(e)[:200]}")
+            return None
+        
+        try:
+            await page.wait_for_function("typeof grecaptcha !== 'undefined'", timeout=15000)
+        except Exception as e:
+            debug_logger.log_warning(f"[BrowserCaptcha] Token-{self.token_id} grecaptcha 未就绪: {type(e).__name__}: {str(e)[:200]}")
+            return None
+        return page
+    
+    async def _execute_captcha(self, page, website_key: str, action: str) -> Optional[str]:
+        """在已就绪的页面上执行打码"""
         try:
-            page = await context.new_page()
-            await page.add_init_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined});")
-            
-            page_url = f"https://labs.google/fx/tools/flow/project/{project_id}"
-            
-            async def handle_route(route):
-                if route.request.url.rstrip('/') == page_url.rstrip('/'):
-                    html = f"""<html><head><script src="https://www.google.com/recaptcha/enterprise.js?render={website_key}"></script></head><body></body></html>"""
-                    await route.fulfill(status=200, content_type="text/html", body=html)
-                elif any(d in route.request.url for d in ["google.com", "gstatic.com", "recaptcha.net"]):
-                    await route.continue_()
-                else:
-                    await route.abort()
-            
-            await page.route("**/*", handle_route)
-            try:
-                await page.goto(page_url, wait_until="load", timeout=30000)
-            except Exception as e:
-                debug_logger.log_warning(f"[BrowserCaptcha] Token-{self.token_id} page.goto 失败: {type(e).__name__}: {str(e)[:200]}")
-                return None
-            
-            try:
-                await page.wait_for_function("typeof grecaptcha !== 'undefined'", timeout=15000)
-            except Exception as e:
-                debug_logger.log_warning(f"[BrowserCaptcha] Token-{self.token_id} grecaptcha 未就绪: {type(e).__name__}: {str(e)[:200]}")
-                return None
-            
             token = await asyncio.wait_for(
                 page.evaluate(f"""
                     (actionName) => {{
@@ -470,49 +499,112 @@ class TokenBrowser:
             msg = f"{type(e).__name__}: {str(e)}"
             debug_logger.log_warning(f"[BrowserCaptcha] Token-{self.token_id} 打码失败: {msg[:200]}")
             return None
-        finally:
-            if page:
-                try: await page.close()
-                except: pass
+    
+    def _take_warm(self, project_id: str) -> Optional[tuple]:
+        """取出匹配 project_id 的预热 context，返回 (context, page)"""
+        if self._warm and self._warm[0] == project_id:
+            _, context, page = self._warm
+            self._warm = None
+            return context, page
+        return None
+    
+    def _schedule_prewarm(self, project_id: str, website_key: str):
+        """后台为下一次打码预热 context"""
+        if self._warm_task is None or self._warm_task.done():
+            self._warm_task = asyncio.create_task(self.prewarm(project_id, website_key))
+    
+    async def prewarm(self, project_id: Optional[str], website_key: str):
+        """预先创建 context 并加载 reCAPTCHA 脚本（无 project_id 时仅启动浏览器）"""
+        async with self._semaphore:
+            if not project_id:
+                await self._ensure_browser()
+                return
+            if self._warm:
+                if self._warm[0] == project_id:
+                    return
+                _, context, _ = self._warm
+                self._warm = None
+                await self._close_context(context)
+            
+            context = None
+            try:
+                await self._ensure_browser()
+                context = await self._new_context()
+                page = await self._prepare_page(context, project_id, website_key)
+                if page:
+                    self._warm = (project_id, context, page)
+                    context = None
+                    debug_logger.log_info(f"[BrowserCaptcha] Token-{self.token_id} 预热完成 (project: {project_id[:8]}...)")
+            except Exception as e:
+                debug_logger.log_warning(f"[BrowserCaptcha] Token-{self.token_id} 预热失败: {type(e).__name__}: {str(e)[:200]}")
+            finally:
+                await self._close_context(context)
+    
+    def mark_bad(self):
+        """标记当前浏览器需要回收（下次打码前重启进程）"""
+        self._needs_recycle = True
     
     async def get_token(self, project_id: str, website_key: str, action: str = "IMAGE_GENERATION") -> Optional[str]:
-        """获取 Token：启动新浏览器 -> 打码 -> 关闭浏览器"""
+        """获取 Token：复用常驻浏览器，每次使用新的隐身 context（新 UA）"""
         async with self._semaphore:
             MAX_RETRIES = 3
             
             for attempt in range(MAX_RETRIES):
-                playwright = None
-                browser = None
                 context = None
                 try:
                     start_ts = time.time()
                     
-                    # 每次都启动新浏览器（新 UA）
-                    playwright, browser, context = await self._create_browser()
+                    await self._ensure_browser()
+                    
+                    # 优先使用预热好的 context
+                    warm = self._take_warm(project_id)
+                    if warm:
+                        context, page = warm
+                    else:
+                        context = await self._new_context()
+                        page = await self._prepare_page(context, project_id, website_key)
                     
                     # 执行打码
-                    token = await self._execute_captcha(context, project_id, website_key, action)
+                    token = await self._execute_captcha(page, website_key, action) if page else None
                     
                     if token:
                         self._solve_count += 1
-                        debug_logger.log_info(f"[BrowserCaptcha] Token-{self.token_id} 获取成功 ({(time.time()-start_ts)*1000:.0f}ms)")
-                        return token
+                        self._browser_solves += 1
+                        debug_logger.log_info(f"[BrowserCaptcha] Token-{self.token_id} 获取成功 ({(time.time()-start_ts)*1000:.0f}ms{', 预热' if warm else ''})")
+                        break
                     
                     self._error_count += 1
+                    # 失败后回收浏览器，下次重试使用全新进程
+                    self._needs_recycle = True
                     debug_logger.log_warning(f"[BrowserCaptcha] Token-{self.token_id} 尝试 {attempt+1}/{MAX_RETRIES} 失败")
                     
                 except Exception as e:
                     self._error_count += 1
+                    self._needs_recycle = True
                     debug_logger.log_error(f"[BrowserCaptcha] Token-{self.token_id} 浏览器错误: {type(e).__name__}: {str(e)[:200]}")
                 finally:
-                    # 无论成功失败都关闭浏览器
-                    await self._close_browser(playwright, browser, context)
+                    # 每个 context 只用一次
+                    await self._close_context(context)
                 
                 # 重试前等待
                 if attempt < MAX_RETRIES - 1:
                     await asyncio.sleep(1)
-            
-            return None
+            else:
+                return None
+        
+        self._schedule_prewarm(project_id, website_key)
+        return token
+    
+    async def close(self):
+        """关闭浏览器进程"""
+        if self._warm_task and not self._warm_task.done():
+            self._warm_task.cancel()
+            try:
+                await self._warm_task
+            except asyncio.CancelledError:
+                pass
+        async with self._semaphore:
+            await self._shutdown_browser()
     
 
 class BrowserCaptchaService:
@@ -593,7 +685,8 @@ class BrowserCaptchaService:
             async with self._browsers_lock:
                 for browser_id in list(self._browsers.keys()):
                     if browser_id >= self._browser_count:
-                        self._browsers.pop(browser_id)
+                        browser = self._browsers.pop(browser_id)
+                        await browser.close()
                         debug_logger.log_info(f"[BrowserCaptcha] 移除多余浏览器实例 {browser_id}")
     
     def _log_stats(self):
@@ -672,24 +765,48 @@ class BrowserCaptchaService:
         return token, browser_id
 
     async def report_error(self, browser_id: int = None):
-        """上层举报：Token 无效（统计用）
+        """上层举报：Token 无效，标记该浏览器下次打码前回收重启
         
         Args:
-            browser_id: 浏览器 ID（当前架构下每次都是新浏览器，此参数仅用于日志）
+            browser_id: 浏览器 ID
         """
         async with self._browsers_lock:
             self._stats["api_403"] += 1
             if browser_id is not None:
-                debug_logger.log_info(f"[BrowserCaptcha] 浏览器 {browser_id} 的 token 验证失败")
+                debug_logger.log_info(f"[BrowserCaptcha] 浏览器 {browser_id} 的 token 验证失败，将回收该浏览器")
+                browser = self._browsers.get(browser_id)
+                if browser:
+                    browser.mark_bad()
+
+    async def warmup(self, project_id: Optional[str] = None):
+        """预先启动所有浏览器，并在提供 project_id 时预热 reCAPTCHA 页面
+
+        作为后台任务运行，失败只记录日志 (之后的打码请求会按需启动浏览器)。
+        """
+        try:
+            self._check_available()
+        except RuntimeError as e:
+            debug_logger.log_warning(f"[BrowserCaptcha] 跳过浏览器预热: {e}")
+            return
+        for browser_id in range(self._browser_count):
+            try:
+                browser = await self._get_or_create_browser(browser_id)
+                await browser.prewarm(project_id, self.website_key)
+            except Exception as e:
+                debug_logger.log_warning(f"[BrowserCaptcha] 浏览器 {browser_id} 预热失败: {e}")
 
     async def remove_browser(self, browser_id: int):
         async with self._browsers_lock:
             if browser_id in self._browsers:
-                self._browsers.pop(browser_id)
+                browser = self._browsers.pop(browser_id)
+                await browser.close()
 
     async def close(self):
         async with self._browsers_lock:
+            browsers = list(self._browsers.values())
             self._browsers.clear()
+        for browser in browsers:
+            await browser.close()
             
     async def open_login_browser(self): return {"success": False, "error": "Not implemented"}
     async def create_browser_for_token(self, t, s=None): pass
@@ -0,0 +1,180 @@
+"""Persistent index for FileCache
+
+记录每个缓存文件的大小、创建时间、最近访问时间和命中次数。
+索引常驻内存 (按最近访问排序的 OrderedDict)，查找为 O(1)；
+增删立即写入 SQLite，访问记录在定期 flush 时批量写入，重启后无需扫描目录。
+"""
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional
+import aiosqlite
+from ..core.logger import debug_logger
+
+
+class CacheEntry:
+    __slots__ = ("filename", "size", "created_at", "last_access", "hits")
+
+    def __init__(self, filename: str, size: int, created_at: float, last_access: float, hits: int = 0):
+        self.filename = filename
+        self.size = size
+        self.created_at = created_at
+        self.last_access = last_access
+        self.hits = hits
+
+
+class CacheIndex:
+    """缓存文件索引 (LRU 顺序)"""
+
+    def __init__(self, db_path: Path):
+        self.db_path = db_path
+        self._conn: Optional[aiosqlite.Connection] = None
+        # 最久未访问的在前
+        self._entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self._dirty: Dict[str, CacheEntry] = {}
+        self.total_size = 0
+
+    async def open(self, cache_dir: Path):
+        """打开索引并与缓存目录对账 (仅启动时扫描一次目录)"""
+        self._conn = await aiosqlite.connect(self.db_path)
+        await self._conn.execute("PRAGMA journal_mode=WAL")
+        await self._conn.execute("PRAGMA synchronous=NORMAL")
+        await self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS cache_entries (
+                filename TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL,
+                hits INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+
+        async with self._conn.execute(
+            "SELECT filename, size, created_at, last_access, hits FROM cache_entries ORDER BY last_access"
+        ) as cursor:
+            rows = await cursor.fetchall()
+
+        on_disk = {}
+        for path in cache_dir.iterdir():
+            if path.is_file() and not path.name.startswith("."):
+                stat = path.stat()
+                on_disk[path.name] = (stat.st_size, stat.st_mtime)
+
+        stale = []
+        for filename, size, created_at, last_access, hits in rows:
+            disk = on_disk.pop(filename, None)
+            if disk is None:
+                stale.append((filename,))
+                continue
+            self._add_entry(CacheEntry(filename, disk[0], created_at, last_access, hits))
+
+        # 索引之外的文件 (例如旧版本遗留) 按 mtime 补录
+        missing = sorted(on_disk.items(), key=lambda item: item[1][1])
+        for filename, (size, mtime) in missing:
+            self._add_entry(CacheEntry(filename, size, mtime, mtime))
+        self._entries = OrderedDict(sorted(self._entries.items(), key=lambda item: item[1].last_access))
+
+        if stale:
+            await self._conn.executemany("DELETE FROM cache_entries WHERE filename = ?", stale)
+        if missing:
+            await self._conn.executemany(
+                "INSERT OR REPLACE INTO cache_entries (filename, size, created_at, last_access, hits) VALUES (?, ?, ?, ?, 0)",
+                [(filename, size, mtime, mtime) for filename, (size, mtime) in missing]
+            )
+        await self._conn.commit()
+        debug_logger.log_info(
+            f"[CACHE] 索引已加载: {len(self._entries)} 个文件, {self.total_size} bytes "
+            f"(移除 {len(stale)} 条失效记录, 补录 {len(missing)} 个文件)"
+        )
+
+    async def close(self):
+        if self._conn:
+            await self.flush()
+            await self._conn.close()
+            self._conn = None
+
+    def _add_entry(self, entry: CacheEntry):
+        old = self._entries.pop(entry.filename, None)
+        if old:
+            self.total_size -= old.size
+        self._entries[entry.filename] = entry
+        self.total_size += entry.size
+
+    def get(self, filename: str) -> Optional[CacheEntry]:
+        return self._entries.get(filename)
+
+    def touch(self, filename: str):
+        """记录一次命中 (移到 LRU 队尾，稍后批量持久化)"""
+        entry = self._entries.get(filename)
+        if entry:
+            entry.last_access = time.time()
+            entry.hits += 1
+            self._entries.move_to_end(filename)
+            self._dirty[filename] = entry
+
+    async def add(self, filename: str, size: int):
+        now = time.time()
+        self._add_entry(CacheEntry(filename, size, now, now))
+        self._dirty.pop(filename, None)
+        if self._conn:
+            await self._conn.execute(
+                "INSERT OR REPLACE INTO cache_entries (filename, size, created_at, last_access, hits) VALUES (?, ?, ?, ?, 0)",
+                (filename, size, now, now)
+            )
+            await self._conn.commit()
+
+    async def remove(self, filenames: List[str]):
+        for filename in filenames:
+            entry = self._entries.pop(filename, None)
+            if entry:
+                self.total_size -= entry.size
+            self._dirty.pop(filename, None)
+        if self._conn and filenames:
+            await self._conn.executemany("DELETE FROM cache_entries WHERE filename = ?", [(f,) for f in filenames])
+            await self._conn.commit()
+
+    async def clear(self):
+        self._entries.clear()
+        self._dirty.clear()
+        self.total_size = 0
+        if self._conn:
+            await self._conn.execute("DELETE FROM cache_entries")
+            await self._conn.commit()
+
+    async def flush(self):
+        """批量写入访问记录"""
+        if not self._dirty or not self._conn:
+            return
+        dirty, self._dirty = self._dirty, {}
+        await self._conn.executemany(
+            "UPDATE cache_entries SET last_access = ?, hits = ? WHERE filename = ?",
+            [(entry.last_access, entry.hits, filename) for filename, entry in dirty.items()]
+        )
+        await self._conn.commit()
+
+    def expired(self, timeout: int) -> List[str]:
+        """创建时间超过 timeout 的文件"""
+        cutoff = time.time() - timeout
+        return [filename for filename, entry in self._entries.items() if entry.created_at < cutoff]
+
+    def eviction_candidates(self, max_bytes: int, keep: Optional[str] = None) -> List[str]:
+        """按 LRU 顺序选出需要淘汰的文件，使总大小回到 max_bytes 以内"""
+        if max_bytes <= 0 or self.total_size <= max_bytes:
+            return []
+        excess = self.total_size - max_bytes
+        candidates = []
+        for filename, entry in self._entries.items():
+            if excess <= 0:
+                break
+            if filename == keep:
+                continue
+            candidates.append(filename)
+            excess -= entry.size
+        return candidates
+
+    def get_stats(self) -> dict:
+        return {
+            "files": len(self._entries),
+            "total_size": self.total_size,
+            "hits": sum(entry.hits for entry in self._entries.values())
+        }
@@ -0,0 +1,180 @@
+"""API captcha providers
+
+第三方 reCAPTCHA 打码服务 (yescaptcha / capmonster / ezcaptcha / capsolver)
+统一的 createTask + getTaskResult 异步轮询实现，支持多个服务竞速取最快结果。
+"""
+import asyncio
+import time
+from typing import Dict, List, Optional, Type
+from ..core.config import config
+from ..core.logger import debug_logger
+from .http_session_pool import http_session_pool
+
+
+WEBSITE_KEY = "6LdsFiUsAAAAAIjVDZcuLhaHiDn5nnHVXVRQGeMV"
+
+
+class CaptchaProvider:
+    """打码服务基类（createTask / getTaskResult 协议）"""
+
+    name: str = ""
+    task_type: str = ""
+
+    # 轮询参数: 首次等待、退避倍数、最大间隔、总超时(秒)
+    initial_delay: float = 2.0
+    backoff: float = 1.5
+    max_delay: float = 5.0
+    timeout: float = 120.0
+
+    def __init__(self, api_key: str, base_url: str):
+        self.api_key = api_key
+        self.base_url = base_url.rstrip("/")
+
+    def build_task(self, project_id: str, action: str) -> Dict:
+        """构造 createTask 的 task 字段"""
+        return {
+            "websiteURL": f"https://labs.google/fx/tools/flow/project/{project_id}",
+            "websiteKey": WEBSITE_KEY,
+            "type": self.task_type,
+            "pageAction": action
+        }
+
+    async def solve(self, project_id: str, action: str = "IMAGE_GENERATION") -> Optional[str]:
+        """提交任务并异步轮询结果
+
+        Returns:
+            gRecaptchaResponse，失败或超时返回 None
+        """
+        async with http_session_pool.session() as session:
+            result = await session.post(
+                f"{self.base_url}/createTask",
+                json={"clientKey": self.api_key, "task": self.build_task(project_id, action)},
+                impersonate="chrome110"
+            )
+            result_json = result.json()
+            task_id = result_json.get("taskId")
+
+            debug_logger.log_info(f"[reCAPTCHA {self.name}] created task_id: {task_id}")
+
+            if not task_id:
+                error_desc = result_json.get("errorDescription", "Unknown error")
+                debug_logger.log_error(f"[reCAPTCHA {self.name}] Failed to create task: {error_desc}")
+                return None
+
+            deadline = time.time() + self.timeout
+            delay = self.initial_delay
+            attempt = 0
+            while time.time() < deadline:
+                await asyncio.sleep(delay)
+                delay = min(delay * self.backoff, self.max_delay)
+                attempt += 1
+
+                result = await session.post(
+                    f"{self.base_url}/getTaskResult",
+                    json={"clientKey": self.api_key, "taskId": task_id},
+                    impersonate="chrome110"
+                )
+                result_json = result.json()
+
+                debug_logger.log_info(f"[reCAPTCHA {self.name}] polling #{attempt}: {result_json}")
+
+                if result_json.get("errorId"):
+                    error_desc = result_json.get("errorDescription", "Unknown error")
+                    debug_logger.log_error(f"[reCAPTCHA {self.name}] Task failed: {error_desc}")
+                    return None
+
+                if result_json.get("status") == "ready":
+                    response = result_json.get("solution", {}).get("gRecaptchaResponse")
+                    if response:
+                        debug_logger.log_info(f"[reCAPTCHA {self.name}] Token获取成功")
+                        return response
+
+            debug_logger.log_error(f"[reCAPTCHA {self.name}] Timeout waiting for token")
+            return None
+
+
+class YesCaptchaProvider(CaptchaProvider):
+    name = "yescaptcha"
+    task_type = "RecaptchaV3TaskProxylessM1"
+
+
+class CapMonsterProvider(CaptchaProvider):
+    name = "capmonster"
+    task_type = "RecaptchaV3TaskProxyless"
+
+
+class EzCaptchaProvider(CaptchaProvider):
+    name = "ezcaptcha"
+    task_type = "ReCaptchaV3TaskProxylessS9"
+
+
+class CapSolverProvider(CaptchaProvider):
+    name = "capsolver"
+    task_type = "ReCaptchaV3EnterpriseTaskProxyLess"
+
+
+PROVIDERS: Dict[str, Type[CaptchaProvider]] = {
+    "yescaptcha": YesCaptchaProvider,
+    "capmonster": CapMonsterProvider,
+    "ezcaptcha": EzCaptchaProvider,
+    "capsolver": CapSolverProvider,
+}
+
+
+def get_provider(method: str) -> Optional[CaptchaProvider]:
+    """根据当前配置创建打码服务实例，未知或未配置 API key 时返回 None"""
+    provider_cls = PROVIDERS.get(method)
+    if provider_cls is None:
+        debug_logger.log_error(f"[reCAPTCHA] Unknown API method: {method}")
+        return None
+
+    api_key = getattr(config, f"{method}_api_key")
+    if not api_key:
+        debug_logger.log_info(f"[reCAPTCHA] {method} API key not configured, skipping")
+        return None
+    return provider_cls(api_key, getattr(config, f"{method}_base_url"))
+
+
+async def _safe_solve(provider: CaptchaProvider, project_id: str, action: str) -> Optional[str]:
+    try:
+        return await provider.solve(project_id, action)
+    except Exception as e:
+        debug_logger.log_error(f"[reCAPTCHA {provider.name}] error: {str(e)}")
+        return None
+
+
+async def solve_captcha(method: str, project_id: str, action: str = "IMAGE_GENERATION") -> Optional[str]:
+    """使用 API 打码服务获取 token
+
+    配置了 race_providers 时，同时向主服务和竞速服务提交任务，
+    采用最先返回的有效 token 并取消其余任务。
+    """
+    methods: List[str] = [method]
+    for extra in config.captcha_race_providers:
+        if extra not in methods:
+            methods.append(extra)
+
+    providers = [p for p in (get_provider(m) for m in methods) if p]
+    if not providers:
+        return None
+    if len(providers) == 1:
+        return await _safe_solve(providers[0], project_id, action)
+
+    debug_logger.log_info(f"[reCAPTCHA] 竞速模式: {', '.join(p.name for p in providers)}")
+    tasks = {
+        asyncio.create_task(_safe_solve(p, project_id, action)): p.name
+        for p in providers
+    }
+    pending = set(tasks)
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                token = task.result()
+                if token:
+                    debug_logger.log_info(f"[reCAPTCHA] 竞速获胜: {tasks[task]}")
+                    return token
+        return None
+    finally:
+        for task in pending:
+            task.cancel()
@@ -0,0 +1,159 @@
+"""Pre-solved reCAPTCHA token pool
+
+按 (打码方式, project_id, action) 在后台预先获取 reCAPTCHA token，
+生成请求到达时直接取用，避免在请求路径上等待打码。
+池大小根据最近请求速率动态调整，token 在有效期结束前被丢弃。
+"""
+import asyncio
+import math
+import time
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, Optional, Tuple
+from ..core.config import config
+from ..core.logger import debug_logger
+
+
+# (method, project_id, action)
+PoolKey = Tuple[str, str, str]
+# 打码函数: (project_id, action) -> (token, browser_id)
+Solver = Callable[[str, str], Awaitable[Tuple[Optional[str], Optional[int]]]]
+
+# 请求速率统计窗口(秒)
+RATE_WINDOW = 60
+
+
+class _PooledToken:
+    def __init__(self, token: str, browser_id: Optional[int]):
+        self.token = token
+        self.browser_id = browser_id
+        self.solved_at = time.time()
+
+
+class CaptchaTokenPool:
+    """reCAPTCHA token 预取池"""
+
+    def __init__(self, solver: Solver):
+        self.solver = solver
+        self._tokens: Dict[PoolKey, Deque[_PooledToken]] = {}
+        self._requests: Dict[PoolKey, Deque[float]] = {}
+        self._refill_tasks: Dict[PoolKey, asyncio.Task] = {}
+        # 最近一次打码耗时(秒)，用于估算需要预留的 token 数量
+        self._solve_time: Dict[PoolKey, float] = {}
+        self._hits = 0
+        self._misses = 0
+        self._expired = 0
+
+    async def get_token(self, project_id: str, action: str) -> Tuple[Optional[str], Optional[int]]:
+        """获取 reCAPTCHA token
+
+        Returns:
+            (token, browser_id) 元组，与 FlowClient._get_recaptcha_token 一致
+        """
+        if not config.captcha_pool_enabled:
+            return await self.solver(project_id, action)
+
+        key = (config.captcha_method, project_id, action)
+        self._record_request(key)
+
+        pooled = self._pop_fresh(key)
+        self._schedule_refill(key)
+
+        if pooled:
+            self._hits += 1
+            debug_logger.log_info(f"[CaptchaPool] 命中预取 token (action: {action}, 剩余 {len(self._tokens.get(key, ()))})")
+            return pooled.token, pooled.browser_id
+
+        self._misses += 1
+        return await self._solve(key)
+
+    def _record_request(self, key: PoolKey):
+        now = time.time()
+        requests = self._requests.setdefault(key, deque())
+        requests.append(now)
+        while requests and now - requests[0] > RATE_WINDOW:
+            requests.popleft()
+
+    def _pop_fresh(self, key: PoolKey) -> Optional[_PooledToken]:
+        """取出一个未过期的 token，顺带丢弃已过期的"""
+        tokens = self._tokens.get(key)
+        if not tokens:
+            return None
+        ttl = config.captcha_pool_token_ttl
+        now = time.time()
+        while tokens:
+            pooled = tokens.popleft()
+            if now - pooled.solved_at < ttl:
+                return pooled
+            self._expired += 1
+        return None
+
+    def _target_size(self, key: PoolKey) -> int:
+        """根据最近请求速率估算需要预留的 token 数"""
+        requests = self._requests.get(key)
+        if not requests or time.time() - requests[-1] > config.captcha_pool_idle_timeout:
+            return 0
+        rate = len(requests) / RATE_WINDOW
+        solve_time = self._solve_time.get(key, 5.0)
+        # 打码期间预计到达的请求数 + 1 个余量
+        target = math.ceil(rate * solve_time) + 1
+        return min(target, config.captcha_pool_max_size)
+
+    def _schedule_refill(self, key: PoolKey):
+        task = self._refill_tasks.get(key)
+        if task is None or task.done():
+            self._refill_tasks[key] = asyncio.create_task(self._refill(key))
+
+    async def _refill(self, key: PoolKey):
+        """后台补充 token 直到达到目标数量"""
+        try:
+            while True:
+                tokens = self._tokens.setdefault(key, deque())
+                # 丢弃过期 token
+                ttl = config.captcha_pool_token_ttl
+                now = time.time()
+                while tokens and now - tokens[0].solved_at >= ttl:
+                    tokens.popleft()
+                    self._expired += 1
+
+                if len(tokens) >= self._target_size(key):
+                    return
+
+                token, browser_id = await self._solve(key)
+                if not token:
+                    return
+                tokens.append(_PooledToken(token, browser_id))
+        except Exception as e:
+            debug_logger.log_warning(f"[CaptchaPool] 预取 token 失败: {str(e)}")
+
+    async def _solve(self, key: PoolKey) -> Tuple[Optional[str], Optional[int]]:
+        _, project_id, action = key
+        start_time = time.time()
+        token, browser_id = await self.solver(project_id, action)
+        if token:
+            self._solve_time[key] = time.time() - start_time
+        return token, browser_id
+
+    async def close(self):
+        """停止所有预取任务"""
+        tasks = [task for task in self._refill_tasks.values() if not task.done()]
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+        self._refill_tasks.clear()
+        self._tokens.clear()
+
+    def get_stats(self) -> dict:
+        """获取命中统计"""
+        total = self._hits + self._misses
+        return {
+            "enabled": config.captcha_pool_enabled,
+            "hits": self._hits,
+            "misses": self._misses,
+            "expired": self._expired,
+            "hit_rate": round(self._hits / total, 4) if total else 0,
+            "pooled": {
+                f"{method}:{project_id}:{action}": len(tokens)
+                for (method, project_id, action), tokens in self._tokens.items()
+            }
+        }
@@ -1,20 +1,42 @@
 """File caching service"""
 import os
 import asyncio
+import base64
 import hashlib
+import threading
 import time
+import uuid
 from pathlib import Path
-from typing import Optional
+from contextlib import aclosing
+from typing import AsyncIterator, List, Optional
 from datetime import datetime, timedelta
-from curl_cffi.requests import AsyncSession
+from curl_cffi import CurlInfo
+from curl_cffi.curl import CURL_WRITEFUNC_ERROR
+from curl_cffi.requests import Session
 from ..core.config import config
 from ..core.logger import debug_logger
+from .cache_index import CacheIndex
+
+
+# 下载写盘的缓冲区大小
+WRITE_BUFFER_SIZE = 1024 * 1024
+# wget/curl 备用下载的整体超时(秒)
+COMMAND_TIMEOUT = 90
+
+
+class FileTooLargeError(Exception):
+    """下载文件超过 cache.max_file_size"""
+
+    def __init__(self, size: int, max_size: int):
+        super().__init__(f"File too large: {size} bytes exceeds limit of {max_size} bytes")
+        self.size = size
+        self.max_size = max_size
 
 
 class FileCache:
     """File caching service for videos"""
 
-    def __init__(self, cache_dir: str = "tmp", default_timeout: int = 7200, proxy_manager=None):
+    def __init__(self, cache_dir: str = "tmp", default_timeout: int = 7200, proxy_manager=None, index_path: str = None):
         """
         Initialize file cache
 
@@ -22,6 +44,7 @@ class FileCache:
             cache_dir: Cache directory path
             default_timeout: Default cache timeout in seconds (default: 2 hours)
             proxy_manager: ProxyManager instance for downloading files
+            index_path: Cache index database path (default: data/file_cache.db)
         """
         self.cache_dir = Path(cache_dir)
         self.cache_dir.mkdir(exist_ok=True)
@@ -29,9 +52,19 @@ class FileCache:
         self.proxy_manager = proxy_manager
         self._cleanup_task = None
 
+        if index_path is None:
+            # 索引不放在缓存目录中，避免被 /tmp 静态路由暴露
+            data_dir = Path(__file__).parent.parent.parent / "data"
+            data_dir.mkdir(exist_ok=True)
+            index_path = str(data_dir / "file_cache.db")
+        self.index = CacheIndex(Path(index_path))
+
     async def start_cleanup_task(self):
-        """Start background cleanup task"""
+        """Load the cache index and start background cleanup task"""
         if self._cleanup_task is None:
+            await self._remove_partial_files()
+            await self.index.open(self.cache_dir)
+            await self._cleanup_expired_files()
             self._cleanup_task = asyncio.create_task(self._cleanup_loop())
 
     async def stop_cleanup_task(self):
@@ -43,6 +76,7 @@ class FileCache:
             except asyncio.CancelledError:
                 pass
             self._cleanup_task = None
+        await self.index.close()
 
     async def _cleanup_loop(self):
         """Background task to clean up expired files"""
@@ -60,24 +94,15 @@ class FileCache:
                 )
 
     async def _cleanup_expired_files(self):
-        """Remove expired cache files"""
+        """Remove expired cache files and evict LRU files over the size budget"""
         try:
-            current_time = time.time()
-            removed_count = 0
+            expired = self.index.expired(self.default_timeout)
+            if expired:
+                await self._remove_files(expired)
+                debug_logger.log_info(f"Cleanup: removed {len(expired)} expired cache files")
 
-            for file_path in self.cache_dir.iterdir():
-                if file_path.is_file():
-                    # Check file age
-                    file_age = current_time - file_path.stat().st_mtime
-                    if file_age > self.default_timeout:
-                        try:
-                            file_path.unlink()
-                            removed_count += 1
-                        except Exception:
-                            pass
-
-            if removed_count > 0:
-                debug_logger.log_info(f"Cleanup: removed {removed_count} expired cache files")
+            await self._evict()
+            await self.index.flush()
 
         except Exception as e:
             debug_logger.log_error(
@@ -86,6 +111,43 @@ class FileCache:
                 response_text=""
             )
 
+    async def _remove_partial_files(self):
+        """删除上次运行中断遗留的下载临时文件"""
+        def remove():
+            for file_path in self.cache_dir.glob(".*.part"):
+                try:
+                    file_path.unlink()
+                except OSError:
+                    pass
+        await asyncio.to_thread(remove)
+
+    async def _remove_files(self, filenames: List[str]):
+        """删除缓存文件并从索引移除"""
+        def unlink():
+            for filename in filenames:
+                try:
+                    (self.cache_dir / filename).unlink()
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    debug_logger.log_warning(f"Failed to remove cache file {filename}: {str(e)}")
+        await asyncio.to_thread(unlink)
+        await self.index.remove(filenames)
+
+    async def _evict(self, keep: Optional[str] = None):
+        """超出 cache.max_size 时按最近最少访问淘汰"""
+        candidates = self.index.eviction_candidates(config.cache_max_size, keep=keep)
+        if candidates:
+            await self._remove_files(candidates)
+            debug_logger.log_info(
+                f"Cache eviction: removed {len(candidates)} files, {self.index.total_size} bytes in use"
+            )
+
+    async def _register(self, filename: str, size: int):
+        """新缓存文件写入索引，必要时淘汰旧文件"""
+        await self.index.add(filename, size)
+        await self._evict(keep=filename)
+
     def _generate_cache_filename(self, url: str, media_type: str) -> str:
         """Generate unique filename for cached file"""
         # Use URL hash as filename
@@ -101,6 +163,130 @@ class FileCache:
 
         return f"{url_hash}{ext}"
 
+    def _temp_path(self, file_path: Path) -> Path:
+        """下载中的临时文件 (与目标同目录，完成后原子重命名)"""
+        return file_path.with_name(f".{file_path.name}.{uuid.uuid4().hex[:8]}.part")
+
+    def _fetch_to_file(self, url: str, file_path: Path, headers: dict, proxy_url: Optional[str], cancelled: threading.Event) -> int:
+        """在工作线程中用 curl_cffi 下载到临时文件，完成后原子重命名为目标文件
+
+        同步会话的 content_callback 直接写盘，回调返回前 curl 不会继续读取 socket，
+        内存占用与下载速度无关 (AsyncSession.stream 的接收队列没有上限，下载快于写盘时数据会堆积在内存中)。
+        cancelled 被设置时在下一个数据块中止传输。
+
+        Returns:
+            文件大小(字节)
+
+        Raises:
+            FileTooLargeError: 超过 cache.max_file_size
+        """
+        max_size = config.cache_max_file_size
+        temp_path = self._temp_path(file_path)
+        total = 0
+        error: Optional[Exception] = None
+
+        with Session() as session, open(temp_path, "wb", buffering=WRITE_BUFFER_SIZE) as f:
+            def on_chunk(chunk: bytes):
+                nonlocal total, error
+                if cancelled.is_set():
+                    return CURL_WRITEFUNC_ERROR
+                if total == 0:
+                    # 第一个数据块到达时响应头已完整，非 200 时不写入错误页面
+                    status_code = session.curl.getinfo(CurlInfo.RESPONSE_CODE)
+                    if status_code != 200:
+                        error = Exception(f"HTTP {status_code}")
+                        return CURL_WRITEFUNC_ERROR
+                total += len(chunk)
+                if max_size and total > max_size:
+                    error = FileTooLargeError(total, max_size)
+                    return CURL_WRITEFUNC_ERROR
+                return f.write(chunk)
+
+            try:
+                try:
+                    response = session.get(
+                        url,
+                        timeout=60,
+                        proxy=proxy_url,
+                        headers=headers,
+                        impersonate="chrome120",
+                        verify=False,
+                        content_callback=on_chunk
+                    )
+                except Exception:
+                    if error:
+                        raise error
+                    raise
+                if response.status_code != 200:
+                    raise Exception(f"HTTP {response.status_code}")
+                if total == 0:
+                    raise Exception("Downloaded file is empty")
+                f.close()
+                os.replace(temp_path, file_path)
+                return total
+            except BaseException:
+                f.close()
+                try:
+                    temp_path.unlink()
+                except OSError:
+                    pass
+                raise
+
+    async def _download_with_curl_cffi(self, url: str, file_path: Path, headers: dict, proxy_url: Optional[str]) -> int:
+        """在线程中执行 _fetch_to_file；任务被取消时通知工作线程中止传输并清理临时文件"""
+        cancelled = threading.Event()
+        try:
+            return await asyncio.to_thread(self._fetch_to_file, url, file_path, headers, proxy_url, cancelled)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    async def _download_with_command(self, cmd: List[str], file_path: Path, env: Optional[dict] = None) -> int:
+        """异步执行 wget/curl 下载到临时文件，成功后原子重命名为目标文件
+
+        cmd 中的 "{output}" 会被替换为临时文件路径。超时或任务被取消时终止子进程，
+        不阻塞事件循环。
+
+        Returns:
+            文件大小(字节)
+        """
+        temp_path = self._temp_path(file_path)
+        cmd = [str(temp_path) if arg == "{output}" else arg for arg in cmd]
+        process = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.PIPE,
+            env=env
+        )
+        try:
+            try:
+                _, stderr = await asyncio.wait_for(process.communicate(), timeout=COMMAND_TIMEOUT)
+            except asyncio.TimeoutError:
+                raise Exception(f"{cmd[0]} timed out after {COMMAND_TIMEOUT}s")
+
+            if process.returncode != 0:
+                error_msg = stderr.decode('utf-8', errors='ignore').strip() if stderr else ""
+                raise Exception(f"{cmd[0]} exited with code {process.returncode}: {error_msg or 'Unknown error'}")
+
+            file_size = temp_path.stat().st_size if temp_path.exists() else 0
+            if file_size == 0:
+                raise Exception("Downloaded file is empty")
+            max_size = config.cache_max_file_size
+            if max_size and file_size > max_size:
+                raise FileTooLargeError(file_size, max_size)
+
+            os.replace(temp_path, file_path)
+            return file_size
+        except BaseException:
+            if process.returncode is None:
+                process.kill()
+                await asyncio.shield(process.wait())
+            try:
+                temp_path.unlink()
+            except OSError:
+                pass
+            raise
+
     async def download_and_cache(self, url: str, media_type: str) -> str:
         """
         Download file from URL and cache it locally
@@ -116,17 +302,15 @@ class FileCache:
         file_path = self.cache_dir / filename
 
         # Check if already cached and not expired
-        if file_path.exists():
-            file_age = time.time() - file_path.stat().st_mtime
-            if file_age < self.default_timeout:
+        entry = self.index.get(filename)
+        if entry:
+            if time.time() - entry.created_at < self.default_timeout:
+                self.index.touch(filename)
                 debug_logger.log_info(f"Cache hit: {filename}")
                 return filename
             else:
                 # Remove expired file
-                try:
-                    file_path.unlink()
-                except Exception:
-                    pass
+                await self._remove_files([filename])
 
         # Download file
         debug_logger.log_info(f"Downloading file from: {url}")
@@ -138,48 +322,39 @@ class FileCache:
             if proxy_config and proxy_config.enabled and proxy_config.proxy_url:
                 proxy_url = proxy_config.proxy_url
 
-        # Try method 1: curl_cffi with browser impersonation
+        # Try method 1: curl_cffi with browser impersonation (边下载边写入临时文件)
         try:
-            async with AsyncSession() as session:
-                proxies = {"http": proxy_url, "https": proxy_url} if proxy_url else None
-                headers = {
-                    "Accept": "*/*",
-                    "Accept-Language": "zh-CN,zh;q=0.9,en;q=0.8",
-                    "Accept-Encoding": "gzip, deflate, br",
-                    "Connection": "keep-alive",
-                    "Sec-Fetch-Dest": "document",
-                    "Sec-Fetch-Mode": "navigate",
-                    "Sec-Fetch-Site": "none",
-                    "Upgrade-Insecure-Requests": "1"
-                }
-                response = await session.get(
-                    url,
-                    timeout=60,
-                    proxies=proxies,
-                    headers=headers,
-                    impersonate="chrome120",
-                    verify=False
-                )
-
-                if response.status_code == 200:
-                    with open(file_path, 'wb') as f:
-                        f.write(response.content)
-                    debug_logger.log_info(f"File cached (curl_cffi): {filename} ({len(response.content)} bytes)")
-                    return filename
-                else:
-                    debug_logger.log_warning(f"curl_cffi failed with HTTP {response.status_code}, trying wget...")
+            headers = {
+                "Accept": "*/*",
+                "Accept-Language": "zh-CN,zh;q=0.9,en;q=0.8",
+                "Accept-Encoding": "gzip, deflate, br",
+                "Connection": "keep-alive",
+                "Sec-Fetch-Dest": "document",
+                "Sec-Fetch-Mode": "navigate",
+                "Sec-Fetch-Site": "none",
+                "Upgrade-Insecure-Requests": "1"
+            }
+            file_size = await self._download_with_curl_cffi(url, file_path, headers, proxy_url)
+            await self._register(filename, file_size)
+            debug_logger.log_info(f"File cached (curl_cffi): {filename} ({file_size} bytes)")
+            return filename
 
+        except FileTooLargeError as e:
+            debug_logger.log_error(
+                error_message=f"Failed to download file: {str(e)}",
+                status_code=0,
+                response_text=str(e)
+            )
+            raise Exception(f"Failed to cache file: {str(e)}")
         except Exception as e:
             debug_logger.log_warning(f"curl_cffi failed: {str(e)}, trying wget...")
 
         # Try method 2: wget command
         try:
-            import subprocess
-
             wget_cmd = [
                 "wget",
                 "-q",  # Quiet mode
-                "-O", str(file_path),  # Output file
+                "-O", "{output}",  # Output file
                 "--timeout=60",
                 "--tries=3",
                 "--user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
@@ -200,34 +375,30 @@ class FileCache:
             # Add URL
             wget_cmd.append(url)
 
-            # Execute wget
-            result = subprocess.run(wget_cmd, capture_output=True, timeout=90, env=env)
-
-            if result.returncode == 0 and file_path.exists():
-                file_size = file_path.stat().st_size
-                if file_size > 0:
-                    debug_logger.log_info(f"File cached (wget): {filename} ({file_size} bytes)")
-                    return filename
-                else:
-                    raise Exception("Downloaded file is empty")
-            else:
-                error_msg = result.stderr.decode('utf-8', errors='ignore') if result.stderr else "Unknown error"
-                debug_logger.log_warning(f"wget failed: {error_msg}, trying curl...")
+            file_size = await self._download_with_command(wget_cmd, file_path, env=env)
+            await self._register(filename, file_size)
+            debug_logger.log_info(f"File cached (wget): {filename} ({file_size} bytes)")
+            return filename
 
         except FileNotFoundError:
             debug_logger.log_warning("wget not found, trying curl...")
+        except FileTooLargeError as e:
+            debug_logger.log_error(
+                error_message=f"Failed to download file: {str(e)}",
+                status_code=0,
+                response_text=str(e)
+            )
+            raise Exception(f"Failed to cache file: {str(e)}")
         except Exception as e:
             debug_logger.log_warning(f"wget failed: {str(e)}, trying curl...")
 
         # Try method 3: system curl command
         try:
-            import subprocess
-
             curl_cmd = [
                 "curl",
                 "-L",  # Follow redirects
                 "-s",  # Silent mode
-                "-o", str(file_path),  # Output file
+                "-o", "{output}",  # Output file
                 "--max-time", "60",
                 "-H", "Accept: */*",
                 "-H", "Accept-Language: zh-CN,zh;q=0.9,en;q=0.8",
@@ -239,22 +410,16 @@ class FileCache:
             if proxy_url:
                 curl_cmd.extend(["-x", proxy_url])
 
+            if config.cache_max_file_size:
+                curl_cmd.extend(["--max-filesize", str(config.cache_max_file_size)])
+
             # Add URL
             curl_cmd.append(url)
 
-            # Execute curl
-            result = subprocess.run(curl_cmd, capture_output=True, timeout=90)
-
-            if result.returncode == 0 and file_path.exists():
-                file_size = file_path.stat().st_size
-                if file_size > 0:
-                    debug_logger.log_info(f"File cached (curl): {filename} ({file_size} bytes)")
-                    return filename
-                else:
-                    raise Exception("Downloaded file is empty")
-            else:
-                error_msg = result.stderr.decode('utf-8', errors='ignore') if result.stderr else "Unknown error"
-                raise Exception(f"curl command failed: {error_msg}")
+            file_size = await self._download_with_command(curl_cmd, file_path)
+            await self._register(filename, file_size)
+            debug_logger.log_info(f"File cached (curl): {filename} ({file_size} bytes)")
+            return filename
 
         except Exception as e:
             debug_logger.log_error(
@@ -264,6 +429,69 @@ class FileCache:
             )
             raise Exception(f"Failed to cache file: {str(e)}")
 
+    async def cache_base64_stream(self, chunks: AsyncIterator[bytes], resolution: str = "") -> Optional[str]:
+        """
+        Decode streamed base64 image data straight into a cache file
+
+        Args:
+            chunks: Async iterator of base64 fragments (any length)
+            resolution: Resolution info for filename (e.g., "4K", "2K")
+
+        Returns:
+            Local cache filename, or None if the stream contained no data
+        """
+        unique_id = hashlib.md5(f"{uuid.uuid4()}{time.time()}".encode()).hexdigest()
+        suffix = f"_{resolution}" if resolution else ""
+        filename = f"{unique_id}{suffix}.jpg"
+        file_path = self.cache_dir / filename
+        temp_path = self._temp_path(file_path)
+
+        f = await asyncio.to_thread(open, temp_path, "wb")
+        try:
+            total = 0
+            pending = b""
+            buffer = bytearray()
+            async with aclosing(chunks):
+                async for chunk in chunks:
+                    pending += chunk
+                    # 只解码 4 的整数倍长度，剩余部分留到下一块
+                    usable = len(pending) - len(pending) % 4
+                    if not usable:
+                        continue
+                    buffer += base64.b64decode(pending[:usable])
+                    pending = pending[usable:]
+                    if len(buffer) >= WRITE_BUFFER_SIZE:
+                        data, buffer = bytes(buffer), bytearray()
+                        total += len(data)
+                        await asyncio.to_thread(f.write, data)
+            if pending:
+                buffer += base64.b64decode(pending)
+            if buffer:
+                total += len(buffer)
+                await asyncio.to_thread(f.write, bytes(buffer))
+            await asyncio.to_thread(f.close)
+
+            if total == 0:
+                temp_path.unlink()
+                return None
+            os.replace(temp_path, file_path)
+            await self._register(filename, total)
+            debug_logger.log_info(f"Base64 image stream cached: {filename} ({total} bytes)")
+            return filename
+        except BaseException as e:
+            f.close()
+            try:
+                temp_path.unlink()
+            except OSError:
+                pass
+            if isinstance(e, Exception):
+                debug_logger.log_error(
+                    error_message=f"Failed to cache base64 image stream: {str(e)}",
+                    status_code=0,
+                    response_text=""
+                )
+            raise
+
     async def cache_base64_image(self, base64_data: str, resolution: str = "") -> str:
         """
         Cache base64 encoded image data to local file
@@ -275,9 +503,6 @@ class FileCache:
         Returns:
             Local cache filename
         """
-        import base64
-        import uuid
-
         # Generate unique filename
         unique_id = hashlib.md5(f"{uuid.uuid4()}{time.time()}".encode()).hexdigest()
         suffix = f"_{resolution}" if resolution else ""
@@ -289,6 +514,7 @@ class FileCache:
             image_data = base64.b64decode(base64_data)
             with open(file_path, 'wb') as f:
                 f.write(image_data)
+            await self._register(filename, len(image_data))
             debug_logger.log_info(f"Base64 image cached: {filename} ({len(image_data)} bytes)")
             return filename
         except Exception as e:
@@ -317,12 +543,14 @@ class FileCache:
         try:
             removed_count = 0
             for file_path in self.cache_dir.iterdir():
-                if file_path.is_file():
+                # 跳过正在下载的临时文件
+                if file_path.is_file() and not file_path.name.startswith("."):
                     try:
                         file_path.unlink()
                         removed_count += 1
                     except Exception:
                         pass
+            await self.index.clear()
 
             debug_logger.log_info(f"Cache cleared: removed {removed_count} files")
             return removed_count
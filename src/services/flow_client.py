@@ -4,10 +4,68 @@ import time
 import uuid
 import random
 import base64
-from typing import Dict, Any, Optional, List
-from curl_cffi.requests import AsyncSession
+import json
+from typing import AsyncGenerator, Dict, Any, Optional, List, Union
 from ..core.logger import debug_logger
 from ..core.config import config
+from .http_session_pool import http_session_pool
+from .captcha_token_pool import CaptchaTokenPool
+from .captcha_providers import solve_captcha
+
+
+class _JsonStringFieldExtractor:
+    """从分块到达的 JSON 响应中提取某个字符串字段的值
+
+    适用于 base64 这类值中只可能出现 "\/" 转义的字段，
+    值内容边解析边返回，不缓存整个响应。
+    """
+
+    def __init__(self, key: bytes):
+        self._needle = b'"' + key + b'"'
+        self._buffer = b""
+        self._state = "key"
+        self.done = False
+
+    def feed(self, chunk: bytes) -> bytes:
+        """输入一段响应数据，返回其中属于字段值的部分"""
+        if self.done:
+            return b""
+        data = self._buffer + chunk
+        self._buffer = b""
+
+        if self._state == "key":
+            idx = data.find(self._needle)
+            if idx < 0:
+                # 保留可能被截断的 key 前缀
+                self._buffer = data[-(len(self._needle) - 1):]
+                return b""
+            data = data[idx + len(self._needle):]
+            self._state = "colon"
+
+        if self._state == "colon":
+            data = data.lstrip()
+            if data[:1] == b":":
+                data = data[1:].lstrip()
+                self._state = "quote"
+            elif data:
+                raise ValueError("Unexpected JSON after field name")
+            else:
+                return b""
+
+        if self._state == "quote":
+            if not data:
+                return b""
+            if data[:1] != b'"':
+                raise ValueError("Field value is not a string")
+            data = data[1:]
+            self._state = "value"
+
+        end = data.find(b'"')
+        if end >= 0:
+            data = data[:end]
+            self.done = True
+        # 去掉 JSON 转义 ("\/" -> "/")
+        return data.replace(b"\\", b"")
 
 
 class FlowClient:
@@ -21,6 +79,8 @@ class FlowClient:
         self.timeout = config.flow_timeout
         # 缓存每个账号的 User-Agent
         self._user_agent_cache = {}
+        # reCAPTCHA token 预取池
+        self.captcha_pool = CaptchaTokenPool(self._solve_recaptcha_token)
 
         # Default "real browser" headers (Android Chrome style) to reduce upstream 4xx/5xx instability.
         # These will be applied as defaults (won't override caller-provided headers).
@@ -137,33 +197,7 @@ class FlowClient:
         proxy_url = await self.proxy_manager.get_proxy_url()
         request_timeout = timeout or self.timeout
 
-        if headers is None:
-            headers = {}
-
-        # ST认证 - 使用Cookie
-        if use_st and st_token:
-            headers["Cookie"] = f"__Secure-next-auth.session-token={st_token}"
-
-        # AT认证 - 使用Bearer
-        if use_at and at_token:
-            headers["authorization"] = f"Bearer {at_token}"
-
-        # 确定账号标识（优先使用 token 的前16个字符作为标识）
-        account_id = None
-        if st_token:
-            account_id = st_token[:16]  # 使用 ST 的前16个字符
-        elif at_token:
-            account_id = at_token[:16]  # 使用 AT 的前16个字符
-
-        # 通用请求头 - 基于账号生成固定的 User-Agent
-        headers.update({
-            "Content-Type": "application/json",
-            "User-Agent": self._generate_user_agent(account_id)
-        })
-
-        # Add default Chromium/Android client headers (do not override explicitly provided values).
-        for key, value in self._default_client_headers.items():
-            headers.setdefault(key, value)
+        headers = self._build_headers(headers, use_st, st_token, use_at, at_token)
 
         # Log request
         if config.debug_enabled:
@@ -178,7 +212,8 @@ class FlowClient:
         start_time = time.time()
 
         try:
-            async with AsyncSession() as session:
+            # ST 认证请求使用一次性会话，避免账号 Cookie 留在共享会话中
+            async with http_session_pool.session(proxy_url, isolated=use_st) as session:
                 if method.upper() == "GET":
                     response = await session.get(
                         url,
@@ -210,25 +245,8 @@ class FlowClient:
 
                 # 检查HTTP错误
                 if response.status_code >= 400:
-                    # 解析错误响应
-                    error_reason = f"HTTP Error {response.status_code}"
-                    try:
-                        error_body = response.json()
-                        # 提取 Google API 错误格式中的 reason
-                        if "error" in error_body:
-                            error_info = error_body["error"]
-                            error_message = error_info.get("message", "")
-                            # 从 details 中提取 reason
-                            details = error_info.get("details", [])
-                            for detail in details:
-                                if detail.get("reason"):
-                                    error_reason = detail.get("reason")
-                                    break
-                            if error_message:
-                                error_reason = f"{error_reason}: {error_message}"
-                    except:
-                        error_reason = f"HTTP Error {response.status_code}: {response.text[:200]}"
-                    
+                    error_reason = self._parse_error_reason(response.status_code, response.text)
+
                     # 失败时输出请求体和错误内容到控制台
                     debug_logger.log_error(f"[API FAILED] URL: {url}")
                     debug_logger.log_error(f"[API FAILED] Request Body: {json_data}")
@@ -250,6 +268,65 @@ class FlowClient:
 
             raise Exception(f"Flow API request failed: {error_msg}")
 
+    def _build_headers(
+        self,
+        headers: Optional[Dict],
+        use_st: bool,
+        st_token: Optional[str],
+        use_at: bool,
+        at_token: Optional[str]
+    ) -> Dict[str, str]:
+        """构造请求头 (认证 + 按账号固定的 User-Agent + 默认浏览器请求头)"""
+        if headers is None:
+            headers = {}
+
+        # ST认证 - 使用Cookie
+        if use_st and st_token:
+            headers["Cookie"] = f"__Secure-next-auth.session-token={st_token}"
+
+        # AT认证 - 使用Bearer
+        if use_at and at_token:
+            headers["authorization"] = f"Bearer {at_token}"
+
+        # 确定账号标识（优先使用 token 的前16个字符作为标识）
+        account_id = None
+        if st_token:
+            account_id = st_token[:16]  # 使用 ST 的前16个字符
+        elif at_token:
+            account_id = at_token[:16]  # 使用 AT 的前16个字符
+
+        # 通用请求头 - 基于账号生成固定的 User-Agent
+        headers.update({
+            "Content-Type": "application/json",
+            "User-Agent": self._generate_user_agent(account_id)
+        })
+
+        # Add default Chromium/Android client headers (do not override explicitly provided values).
+        for key, value in self._default_client_headers.items():
+            headers.setdefault(key, value)
+        return headers
+
+    def _parse_error_reason(self, status_code: int, text: str) -> str:
+        """从 Google API 错误响应中提取错误原因"""
+        error_reason = f"HTTP Error {status_code}"
+        try:
+            error_body = json.loads(text)
+            # 提取 Google API 错误格式中的 reason
+            if "error" in error_body:
+                error_info = error_body["error"]
+                error_message = error_info.get("message", "")
+                # 从 details 中提取 reason
+                details = error_info.get("details", [])
+                for detail in details:
+                    if detail.get("reason"):
+                        error_reason = detail.get("reason")
+                        break
+                if error_message:
+                    error_reason = f"{error_reason}: {error_message}"
+        except:
+            error_reason = f"HTTP Error {status_code}: {text[:200]}"
+        return error_reason
+
     # ========== 认证相关 (使用ST) ==========
 
     async def refresh_session_token(self, old_st: str, email: str) -> Optional[str]:
@@ -276,7 +353,7 @@ class FlowClient:
             headers.setdefault(key, value)
 
         try:
-            async with AsyncSession() as session:
+            async with http_session_pool.session(proxy_url, isolated=True) as session:
                 response = await session.get(
                     refresh_url,
                     headers=headers,
@@ -490,14 +567,14 @@ class FlowClient:
     async def upload_image(
         self,
         at: str,
-        image_bytes: bytes,
+        image_bytes: Union[bytes, str],
         aspect_ratio: str = "IMAGE_ASPECT_RATIO_LANDSCAPE"
     ) -> str:
         """上传图片,返回mediaGenerationId
 
         Args:
             at: Access Token
-            image_bytes: 图片字节数据
+            image_bytes: 图片字节数据，或已校验的 base64 字符串 (直接透传，不再解码/重新编码)
             aspect_ratio: 图片或视频宽高比（会自动转换为图片格式）
 
         Returns:
@@ -509,11 +586,16 @@ class FlowClient:
         if aspect_ratio.startswith("VIDEO_"):
             aspect_ratio = aspect_ratio.replace("VIDEO_", "IMAGE_")
 
-        # 自动检测图片 MIME 类型
-        mime_type = self._detect_image_mime_type(image_bytes)
+        if isinstance(image_bytes, str):
+            # 客户端传入的 base64: 只解码开头 16 个字符 (12 字节) 用于检测 MIME 类型
+            image_base64 = image_bytes
+            mime_type = self._detect_image_mime_type(base64.b64decode(image_base64[:16]))
+        else:
+            # 自动检测图片 MIME 类型
+            mime_type = self._detect_image_mime_type(image_bytes)
 
-        # 编码为base64 (去掉前缀)
-        image_base64 = base64.b64encode(image_bytes).decode('utf-8')
+            # 编码为base64 (去掉前缀)
+            image_base64 = base64.b64encode(image_bytes).decode('utf-8')
 
         url = f"{self.api_base_url}:uploadUserImage"
         json_data = {
@@ -653,6 +735,26 @@ class FlowClient:
         Returns:
             base64 编码的图片数据
         """
+        chunks = []
+        async for chunk in self.upsample_image_stream(at, project_id, media_id, target_resolution):
+            chunks.append(chunk)
+        return b"".join(chunks).decode("ascii")
+
+    async def upsample_image_stream(
+        self,
+        at: str,
+        project_id: str,
+        media_id: str,
+        target_resolution: str = "UPSAMPLE_IMAGE_RESOLUTION_4K"
+    ) -> AsyncGenerator[bytes, None]:
+        """放大图片到 2K/4K，流式产出 encodedImage 的 base64 内容
+
+        响应体边接收边解析，不在内存中保留完整的 JSON 和 base64 字符串。
+        参数同 upsample_image。
+
+        Yields:
+            base64 数据片段 (长度不保证是 4 的倍数)
+        """
         url = f"{self.api_base_url}/flow/upsampleImage"
 
         # 获取 reCAPTCHA token - 使用 IMAGE_GENERATION action
@@ -675,18 +777,61 @@ class FlowClient:
             }
         }
 
-        # 4K/2K 放大使用专用超时，因为返回的 base64 数据量很大
-        result = await self._make_request(
-            method="POST",
-            url=url,
-            json_data=json_data,
-            use_at=True,
-            at_token=at,
-            timeout=config.upsample_timeout
-        )
+        proxy_url = await self.proxy_manager.get_proxy_url()
+        headers = self._build_headers(None, False, None, True, at)
+        if config.debug_enabled:
+            debug_logger.log_request(method="POST", url=url, headers=headers, body=json_data, proxy=proxy_url)
 
-        # 返回 base64 编码的图片
-        return result.get("encodedImage", "")
+        start_time = time.time()
+        total = 0
+        try:
+            async with http_session_pool.session(proxy_url) as session:
+                # 4K/2K 放大使用专用超时，因为返回的 base64 数据量很大
+                async with session.stream(
+                    "POST",
+                    url,
+                    headers=headers,
+                    json=json_data,
+                    proxy=proxy_url,
+                    timeout=config.upsample_timeout,
+                    impersonate="chrome110"
+                ) as response:
+                    if response.status_code >= 400:
+                        text = (await response.acontent()).decode("utf-8", errors="replace")
+                        if config.debug_enabled:
+                            debug_logger.log_response(
+                                status_code=response.status_code,
+                                headers=dict(response.headers),
+                                body=text,
+                                duration_ms=(time.time() - start_time) * 1000
+                            )
+                        debug_logger.log_error(f"[API FAILED] URL: {url}")
+                        debug_logger.log_error(f"[API FAILED] Response: {text}")
+                        raise Exception(self._parse_error_reason(response.status_code, text))
+
+                    extractor = _JsonStringFieldExtractor(b"encodedImage")
+                    async for chunk in response.aiter_content():
+                        value = extractor.feed(chunk)
+                        if value:
+                            total += len(value)
+                            yield value
+                        if extractor.done:
+                            # 图片数据已读完，忽略剩余字段
+                            break
+
+                    if config.debug_enabled:
+                        debug_logger.log_response(
+                            status_code=response.status_code,
+                            headers=dict(response.headers),
+                            body=f"<encodedImage: {total} base64 chars streamed>",
+                            duration_ms=(time.time() - start_time) * 1000
+                        )
+        except Exception as e:
+            error_msg = str(e)
+            if "HTTP Error" not in error_msg and not any(x in error_msg for x in ["PUBLIC_ERROR", "INVALID_ARGUMENT"]):
+                debug_logger.log_error(f"[API FAILED] URL: {url}")
+                debug_logger.log_error(f"[API FAILED] Exception: {error_msg}")
+            raise Exception(f"Flow API request failed: {error_msg}")
 
     # ========== 视频生成 (使用AT) - 异步返回 ==========
 
@@ -1230,6 +1375,14 @@ class FlowClient:
         return str(uuid.uuid4())
 
     async def _get_recaptcha_token(self, project_id: str, action: str = "IMAGE_GENERATION") -> tuple[Optional[str], Optional[int]]:
+        """获取reCAPTCHA token - 优先使用预取池中的 token
+
+        Returns:
+            (token, browser_id) 元组，browser_id 用于失败时调用 report_error
+        """
+        return await self.captcha_pool.get_token(project_id, action)
+
+    async def _solve_recaptcha_token(self, project_id: str, action: str = "IMAGE_GENERATION") -> tuple[Optional[str], Optional[int]]:
         """获取reCAPTCHA token - 支持多种打码方式
         
         Args:
@@ -1298,83 +1451,4 @@ class FlowClient:
             project_id: 项目ID
             action: reCAPTCHA action类型 (IMAGE_GENERATION 或 VIDEO_GENERATION)
         """
-        # 获取配置
-        if method == "yescaptcha":
-            client_key = config.yescaptcha_api_key
-            base_url = config.yescaptcha_base_url
-            task_type = "RecaptchaV3TaskProxylessM1"
-        elif method == "capmonster":
-            client_key = config.capmonster_api_key
-            base_url = config.capmonster_base_url
-            task_type = "RecaptchaV3TaskProxyless"
-        elif method == "ezcaptcha":
-            client_key = config.ezcaptcha_api_key
-            base_url = config.ezcaptcha_base_url
-            task_type = "ReCaptchaV3TaskProxylessS9"
-        elif method == "capsolver":
-            client_key = config.capsolver_api_key
-            base_url = config.capsolver_base_url
-            task_type = "ReCaptchaV3EnterpriseTaskProxyLess"
-        else:
-            debug_logger.log_error(f"[reCAPTCHA] Unknown API method: {method}")
-            return None
-
-        if not client_key:
-            debug_logger.log_info(f"[reCAPTCHA] {method} API key not configured, skipping")
-            return None
-
-        website_key = "6LdsFiUsAAAAAIjVDZcuLhaHiDn5nnHVXVRQGeMV"
-        website_url = f"https://labs.google/fx/tools/flow/project/{project_id}"
-        page_action = action
-
-        try:
-            async with AsyncSession() as session:
-                create_url = f"{base_url}/createTask"
-                create_data = {
-                    "clientKey": client_key,
-                    "task": {
-                        "websiteURL": website_url,
-                        "websiteKey": website_key,
-                        "type": task_type,
-                        "pageAction": page_action
-                    }
-                }
-
-                result = await session.post(create_url, json=create_data, impersonate="chrome110")
-                result_json = result.json()
-                task_id = result_json.get('taskId')
-
-                debug_logger.log_info(f"[reCAPTCHA {method}] created task_id: {task_id}")
-
-                if not task_id:
-                    error_desc = result_json.get('errorDescription', 'Unknown error')
-                    debug_logger.log_error(f"[reCAPTCHA {method}] Failed to create task: {error_desc}")
-                    return None
-
-                get_url = f"{base_url}/getTaskResult"
-                for i in range(40):
-                    get_data = {
-                        "clientKey": client_key,
-                        "taskId": task_id
-                    }
-                    result = await session.post(get_url, json=get_data, impersonate="chrome110")
-                    result_json = result.json()
-
-                    debug_logger.log_info(f"[reCAPTCHA {method}] polling #{i+1}: {result_json}")
-
-                    status = result_json.get('status')
-                    if status == 'ready':
-                        solution = result_json.get('solution', {})
-                        response = solution.get('gRecaptchaResponse')
-                        if response:
-                            debug_logger.log_info(f"[reCAPTCHA {method}] Token获取成功")
-                            return response
-
-                    time.sleep(3)
-
-                debug_logger.log_error(f"[reCAPTCHA {method}] Timeout waiting for token")
-                return None
-
-        except Exception as e:
-            debug_logger.log_error(f"[reCAPTCHA {method}] error: {str(e)}")
-            return None
+        return await solve_captcha(method, project_id, action)
@@ -3,11 +3,34 @@ import asyncio
 import base64
 import json
 import time
-from typing import Optional, AsyncGenerator, List, Dict, Any
+from typing import Optional, AsyncGenerator, List, Dict, Any, Union
 from ..core.logger import debug_logger
 from ..core.config import config
 from ..core.models import Task, RequestLog
 from .file_cache import FileCache
+from .upload_cache import UploadCache
+from .video_status_poller import VideoStatusPoller
+from .poll_scheduler import PollScheduler
+from .admission_queue import AdmissionQueue, QueueFullError
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _json_dumps(obj: Any) -> str:
+    """紧凑 JSON 序列化 (安装了 orjson 时使用 orjson)"""
+    if orjson is not None:
+        return orjson.dumps(obj).decode("utf-8")
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+
+
+def _json_string(value: str) -> str:
+    """把字符串编码为 JSON 字符串字面量 (含引号)"""
+    if orjson is not None:
+        return orjson.dumps(value).decode("utf-8")
+    return json.dumps(value, ensure_ascii=False)
 
 
 # Model configuration
@@ -590,6 +613,14 @@ class GenerationHandler:
             default_timeout=config.cache_timeout,
             proxy_manager=proxy_manager
         )
+        # 参考图上传缓存
+        self.upload_cache = UploadCache(flow_client)
+        # 跨请求合并的视频状态轮询器
+        self.video_poller = VideoStatusPoller(flow_client)
+        # 基于历史耗时的自适应轮询调度
+        self.poll_scheduler = PollScheduler(db)
+        # Token 并发已满时的排队
+        self.admission_queue = AdmissionQueue(load_balancer)
 
     async def check_token_availability(self, is_image: bool, is_video: bool) -> bool:
         """检查Token可用性
@@ -611,7 +642,7 @@ class GenerationHandler:
         self,
         model: str,
         prompt: str,
-        images: Optional[List[bytes]] = None,
+        images: Optional[List[Union[bytes, str]]] = None,
         stream: bool = False
     ) -> AsyncGenerator:
         """统一生成入口
@@ -619,7 +650,7 @@ class GenerationHandler:
         Args:
             model: 模型名称
             prompt: 提示词
-            images: 图片列表 (bytes格式)
+            images: 图片列表 (bytes，或 data URI 中已校验的 base64 字符串)
             stream: 是否流式输出
         """
         start_time = time.time()
@@ -666,12 +697,23 @@ class GenerationHandler:
         # 2. 选择Token
         debug_logger.log_info(f"[GENERATION] 正在选择可用Token...")
 
-        if generation_type == "image":
-            token = await self.load_balancer.select_token(for_image_generation=True, model=model)
-        else:
-            token = await self.load_balancer.select_token(for_video_generation=True, model=model)
+        # 选择Token并同时占用并发槽位，全部占满时排队等待
+        lease = None
+        try:
+            async for item in self.admission_queue.admit(generation_type, model=model):
+                if isinstance(item, int):
+                    if stream:
+                        yield self._create_stream_chunk(f"⏳ 所有Token繁忙，排队中 (第 {item} 位)...\n")
+                else:
+                    lease = item
+        except QueueFullError as e:
+            debug_logger.log_warning(f"[GENERATION] {str(e)}")
+            if stream:
+                yield self._create_stream_chunk(f"❌ {str(e)}\n")
+            yield self._create_error_response(str(e))
+            return
 
-        if not token:
+        if not lease:
             error_msg = self._get_no_token_error_message(generation_type)
             debug_logger.log_error(f"[GENERATION] {error_msg}")
             if stream:
@@ -679,6 +721,7 @@ class GenerationHandler:
             yield self._create_error_response(error_msg)
             return
 
+        token = lease.token
         debug_logger.log_info(f"[GENERATION] 已选择Token: {token.id} ({token.email})")
 
         try:
@@ -708,13 +751,13 @@ class GenerationHandler:
             if generation_type == "image":
                 debug_logger.log_info(f"[GENERATION] 开始图片生成流程...")
                 async for chunk in self._handle_image_generation(
-                    token, project_id, model_config, prompt, images, stream
+                    lease, token, project_id, model_config, prompt, images, stream
                 ):
                     yield chunk
             else:  # video
                 debug_logger.log_info(f"[GENERATION] 开始视频生成流程...")
                 async for chunk in self._handle_video_generation(
-                    token, project_id, model_config, prompt, images, stream
+                    lease, token, project_id, model_config, prompt, images, stream
                 ):
                     yield chunk
 
@@ -772,6 +815,40 @@ class GenerationHandler:
                 500,
                 duration
             )
+        finally:
+            # 兜底释放并发槽位（已释放时无操作）
+            await lease.release()
+
+    async def _upload_reference_images(
+        self,
+        token,
+        images: List[Union[bytes, str]],
+        aspect_ratio: str,
+        media_ids: List[str],
+        progress: bool
+    ) -> AsyncGenerator:
+        """并行上传参考图片
+
+        结果按输入顺序写入 media_ids；progress 为 True 时每完成一张产出一条进度。
+        任意一张上传失败时取消其余上传 (与其他请求共享的上传继续进行) 并抛出异常。
+        """
+        async def upload(idx: int, image_bytes: bytes):
+            return idx, await self.upload_cache.upload(token, image_bytes, aspect_ratio)
+
+        results: List[Optional[str]] = [None] * len(images)
+        tasks = [asyncio.create_task(upload(idx, image_bytes)) for idx, image_bytes in enumerate(images)]
+        try:
+            for done, future in enumerate(asyncio.as_completed(tasks), start=1):
+                idx, media_id = await future
+                results[idx] = media_id
+                if progress:
+                    yield self._create_stream_chunk(f"已上传第 {done}/{len(images)} 张图片\n")
+        finally:
+            for task in tasks:
+                task.cancel()
+            # 等待取消完成，并取回其余失败上传的异常
+            await asyncio.gather(*tasks, return_exceptions=True)
+        media_ids.extend(results)
 
     def _get_no_token_error_message(self, generation_type: str) -> str:
         """获取无可用Token时的详细错误信息"""
@@ -782,21 +859,17 @@ class GenerationHandler:
 
     async def _handle_image_generation(
         self,
+        lease,
         token,
         project_id: str,
         model_config: dict,
         prompt: str,
-        images: Optional[List[bytes]],
+        images: Optional[List[Union[bytes, str]]],
         stream: bool
     ) -> AsyncGenerator:
         """处理图片生成 (同步返回)"""
 
-        # 获取并发槽位
-        if self.concurrency_manager:
-            if not await self.concurrency_manager.acquire_image(token.id):
-                yield self._create_error_response("图片并发限制已达上限")
-                return
-
+        # 并发槽位已在 reserve 时占用
         try:
             # 上传图片 (如果有)
             image_inputs = []
@@ -804,19 +877,17 @@ class GenerationHandler:
                 if stream:
                     yield self._create_stream_chunk(f"上传 {len(images)} 张参考图片...\n")
 
-                # 支持多图输入
-                for idx, image_bytes in enumerate(images):
-                    media_id = await self.flow_client.upload_image(
-                        token.at,
-                        image_bytes,
-                        model_config["aspect_ratio"]
-                    )
+                # 支持多图输入 (并行上传，按原顺序组装)
+                media_ids = []
+                async for chunk in self._upload_reference_images(
+                    token, images, model_config["aspect_ratio"], media_ids, progress=stream
+                ):
+                    yield chunk
+                for media_id in media_ids:
                     image_inputs.append({
                         "name": media_id,
                         "imageInputType": "IMAGE_INPUT_TYPE_REFERENCE"
                     })
-                    if stream:
-                        yield self._create_stream_chunk(f"已上传第 {idx + 1}/{len(images)} 张图片\n")
 
             # 调用生成API
             if stream:
@@ -851,57 +922,36 @@ class GenerationHandler:
                 max_retries = 3
                 for retry_attempt in range(max_retries):
                     try:
-                        # 调用 upsample API
-                        encoded_image = await self.flow_client.upsample_image(
-                            at=token.at,
-                            project_id=project_id,
-                            media_id=media_id,
-                            target_resolution=upsample_resolution
+                        # 调用 upsample API，边接收边解码写入缓存文件
+                        cached_filename = await self.file_cache.cache_base64_stream(
+                            self.flow_client.upsample_image_stream(
+                                at=token.at,
+                                project_id=project_id,
+                                media_id=media_id,
+                                target_resolution=upsample_resolution
+                            ),
+                            resolution_name
                         )
 
-                        if encoded_image:
+                        if cached_filename:
                             debug_logger.log_info(f"[UPSAMPLE] 图片已放大到 {resolution_name}")
 
                             if stream:
                                 yield self._create_stream_chunk(f"✅ 图片已放大到 {resolution_name}\n")
 
-                            # 缓存放大后的图片 (如果启用)
-                            # 日志统一记录原图URL (放大后的base64数据太大，不适合存储)
+                            # 放大后的图片总是通过缓存地址返回 (不再内联 base64)
+                            # 日志统一记录原图URL
                             self._last_generated_url = image_url
 
-                            if config.cache_enabled:
-                                try:
-                                    if stream:
-                                        yield self._create_stream_chunk(f"缓存 {resolution_name} 图片中...\n")
-                                    cached_filename = await self.file_cache.cache_base64_image(encoded_image, resolution_name)
-                                    local_url = f"{self._get_base_url()}/tmp/{cached_filename}"
-                                    if stream:
-                                        yield self._create_stream_chunk(f"✅ {resolution_name} 图片缓存成功\n")
-                                        yield self._create_stream_chunk(
-                                            f"![Generated Image]({local_url})",
-                                            finish_reason="stop"
-                                        )
-                                    else:
-                                        yield self._create_completion_response(
-                                            local_url,
-                                            media_type="image"
-                                        )
-                                    return
-                                except Exception as e:
-                                    debug_logger.log_error(f"Failed to cache {resolution_name} image: {str(e)}")
-                                    if stream:
-                                        yield self._create_stream_chunk(f"⚠️ 缓存失败: {str(e)}，返回 base64...\n")
-
-                            # 缓存未启用或缓存失败，返回 base64 格式
-                            base64_url = f"data:image/jpeg;base64,{encoded_image}"
+                            local_url = f"{self._get_base_url()}/tmp/{cached_filename}"
                             if stream:
                                 yield self._create_stream_chunk(
-                                    f"![Generated Image]({base64_url})",
+                                    f"![Generated Image]({local_url})",
                                     finish_reason="stop"
                                 )
                             else:
                                 yield self._create_completion_response(
-                                    base64_url,
+                                    local_url,
                                     media_type="image"
                                 )
                             return
@@ -965,26 +1015,21 @@ class GenerationHandler:
 
         finally:
             # 释放并发槽位
-            if self.concurrency_manager:
-                await self.concurrency_manager.release_image(token.id)
+            await lease.release()
 
     async def _handle_video_generation(
         self,
+        lease,
         token,
         project_id: str,
         model_config: dict,
         prompt: str,
-        images: Optional[List[bytes]],
+        images: Optional[List[Union[bytes, str]]],
         stream: bool
     ) -> AsyncGenerator:
         """处理视频生成 (异步轮询)"""
 
-        # 获取并发槽位
-        if self.concurrency_manager:
-            if not await self.concurrency_manager.acquire_video(token.id):
-                yield self._create_error_response("视频并发限制已达上限")
-                return
-
+        # 并发槽位已在 reserve 时占用
         try:
             # 获取模型类型和配置
             video_type = model_config.get("video_type")
@@ -1070,8 +1115,8 @@ class GenerationHandler:
                     # 只有1张图: 仅作为首帧
                     if stream:
                         yield self._create_stream_chunk("上传首帧图片...\n")
-                    start_media_id = await self.flow_client.upload_image(
-                        token.at, images[0], model_config["aspect_ratio"]
+                    start_media_id = await self.upload_cache.upload(
+                        token, images[0], model_config["aspect_ratio"]
                     )
                     debug_logger.log_info(f"[I2V] 仅上传首帧: {start_media_id}")
 
@@ -1079,11 +1124,9 @@ class GenerationHandler:
                     # 2张图: 首帧+尾帧
                     if stream:
                         yield self._create_stream_chunk("上传首帧和尾帧图片...\n")
-                    start_media_id = await self.flow_client.upload_image(
-                        token.at, images[0], model_config["aspect_ratio"]
-                    )
-                    end_media_id = await self.flow_client.upload_image(
-                        token.at, images[1], model_config["aspect_ratio"]
+                    start_media_id, end_media_id = await asyncio.gather(
+                        self.upload_cache.upload(token, images[0], model_config["aspect_ratio"]),
+                        self.upload_cache.upload(token, images[1], model_config["aspect_ratio"])
                     )
                     debug_logger.log_info(f"[I2V] 上传首尾帧: {start_media_id}, {end_media_id}")
 
@@ -1092,10 +1135,13 @@ class GenerationHandler:
                 if stream:
                     yield self._create_stream_chunk(f"上传 {image_count} 张参考图片...\n")
 
-                for idx, img in enumerate(images):  # 上传所有图片,不限制数量
-                    media_id = await self.flow_client.upload_image(
-                        token.at, img, model_config["aspect_ratio"]
-                    )
+                # 上传所有图片,不限制数量 (并行上传，按原顺序组装)
+                media_ids = []
+                async for chunk in self._upload_reference_images(
+                    token, images, model_config["aspect_ratio"], media_ids, progress=stream
+                ):
+                    yield chunk
+                for media_id in media_ids:
                     reference_images.append({
                         "imageUsageType": "IMAGE_USAGE_TYPE_ASSET",
                         "mediaId": media_id
@@ -1189,13 +1235,16 @@ class GenerationHandler:
             # 检查是否需要放大
             upsample_config = model_config.get("upsample")
 
-            async for chunk in self._poll_video_result(token, project_id, operations, stream, upsample_config):
+            async for chunk in self._poll_video_result(
+                token, project_id, operations, stream, upsample_config,
+                model_key=model_config["model_key"],
+                prompt=prompt
+            ):
                 yield chunk
 
         finally:
             # 释放并发槽位
-            if self.concurrency_manager:
-                await self.concurrency_manager.release_video(token.id)
+            await lease.release()
 
     async def _poll_video_result(
         self,
@@ -1203,27 +1252,39 @@ class GenerationHandler:
         project_id: str,
         operations: List[Dict],
         stream: bool,
-        upsample_config: Optional[Dict] = None
+        upsample_config: Optional[Dict] = None,
+        model_key: Optional[str] = None,
+        prompt: str = ""
     ) -> AsyncGenerator:
         """轮询视频生成结果
         
         Args:
             upsample_config: 放大配置 {"resolution": "VIDEO_RESOLUTION_4K", "model_key": "veo_3_1_upsampler_4k"}
+            model_key: 当前轮询任务的模型，用于估算预计耗时
+            prompt: 提示词，记录放大任务时使用
         """
 
-        max_attempts = config.max_poll_attempts
-        poll_interval = config.poll_interval
-        
-        # 如果需要放大，轮询次数加倍（放大可能需要 30 分钟）
+        # 总轮询时长与原固定间隔策略保持一致: max_poll_attempts * poll_interval
+        max_wait = config.max_poll_attempts * config.poll_interval
         if upsample_config:
-            max_attempts = max_attempts * 3  # 放大需要更长时间
+            max_wait = max_wait * 3  # 放大需要更长时间
+        expected = await self.poll_scheduler.expected_duration(model_key)
+        earliest = await self.poll_scheduler.earliest_completion(model_key)
+        # 预计耗时较长的任务（如 4K 放大可能需要 30 分钟）放宽等待上限
+        max_wait = max(max_wait, expected * 3)
+
+        start_time = time.time()
+        last_progress_time = start_time
+        progress_update_interval = 20  # 每20秒报告一次进度
+        attempt = 0
 
-        for attempt in range(max_attempts):
-            await asyncio.sleep(poll_interval)
+        while time.time() - start_time < max_wait:
+            elapsed = time.time() - start_time
+            await asyncio.sleep(self.poll_scheduler.next_delay(earliest, elapsed))
+            attempt += 1
 
             try:
-                result = await self.flow_client.check_video_status(token.at, operations)
-                checked_operations = result.get("operations", [])
+                checked_operations = await self.video_poller.check(token.at, operations)
 
                 if not checked_operations:
                     continue
@@ -1231,15 +1292,18 @@ class GenerationHandler:
                 operation = checked_operations[0]
                 status = operation.get("status")
 
-                # 状态更新 - 每20秒报告一次 (poll_interval=3秒, 20秒约7次轮询)
-                progress_update_interval = 7  # 每7次轮询 = 21秒
-                if stream and attempt % progress_update_interval == 0:  # 每20秒报告一次
-                    progress = min(int((attempt / max_attempts) * 100), 95)
+                # 状态更新 - 按预计耗时估算进度
+                now = time.time()
+                if stream and now - last_progress_time >= progress_update_interval:
+                    last_progress_time = now
+                    progress = min(int(((now - start_time) / expected) * 100), 95)
                     yield self._create_stream_chunk(f"生成进度: {progress}%\n")
 
                 # 检查状态
                 if status == "MEDIA_GENERATION_STATUS_SUCCESSFUL":
-                    # 成功
+                    # 成功 (完成时间不含后续放大和缓存耗时，用于按模型统计生成耗时)
+                    task_id = operation["operation"]["name"]
+                    finished_at = time.time()
                     metadata = operation["operation"].get("metadata", {})
                     video_info = metadata.get("video", {})
                     video_url = video_info.get("fifeUrl")
@@ -1252,6 +1316,14 @@ class GenerationHandler:
 
                     # ========== 视频放大处理 ==========
                     if upsample_config and video_media_id:
+                        # 基础视频已完成，先记录，放大任务单独记录
+                        await self.db.update_task(
+                            task_id,
+                            status="completed",
+                            progress=100,
+                            result_urls=[video_url],
+                            completed_at=finished_at
+                        )
                         if stream:
                             resolution_name = "4K" if "4K" in upsample_config["resolution"] else "1080P"
                             yield self._create_stream_chunk(f"\n视频生成完成，开始 {resolution_name} 放大处理...（可能需要 30 分钟）\n")
@@ -1269,12 +1341,22 @@ class GenerationHandler:
                             
                             upsample_operations = upsample_result.get("operations", [])
                             if upsample_operations:
+                                await self.db.create_task(Task(
+                                    task_id=upsample_operations[0]["operation"]["name"],
+                                    token_id=token.id,
+                                    model=upsample_config["model_key"],
+                                    prompt=prompt,
+                                    status="processing",
+                                    scene_id=upsample_operations[0].get("sceneId")
+                                ))
                                 if stream:
                                     yield self._create_stream_chunk("放大任务已提交，继续轮询...\n")
                                 
                                 # 递归轮询放大结果（不再放大）
                                 async for chunk in self._poll_video_result(
-                                    token, project_id, upsample_operations, stream, None
+                                    token, project_id, upsample_operations, stream, None,
+                                    model_key=upsample_config["model_key"],
+                                    prompt=prompt
                                 ):
                                     yield chunk
                                 return
@@ -1307,13 +1389,12 @@ class GenerationHandler:
                             yield self._create_stream_chunk("缓存已关闭,正在返回源链接...\n")
 
                     # 更新数据库
-                    task_id = operation["operation"]["name"]
                     await self.db.update_task(
                         task_id,
                         status="completed",
                         progress=100,
                         result_urls=[local_url],
-                        completed_at=time.time()
+                        completed_at=finished_at
                     )
 
                     # 存储URL用于日志记录
@@ -1364,36 +1445,29 @@ class GenerationHandler:
                 continue
 
         # 超时
-        yield self._create_error_response(f"视频生成超时 (已轮询{max_attempts}次)")
+        yield self._create_error_response(f"视频生成超时 (已轮询{attempt}次, {int(time.time() - start_time)}秒)")
 
     # ========== 响应格式化 ==========
 
     def _create_stream_chunk(self, content: str, role: str = None, finish_reason: str = None) -> str:
-        """创建流式响应chunk"""
-        import json
-        import time
-
-        chunk = {
-            "id": f"chatcmpl-{int(time.time())}",
-            "object": "chat.completion.chunk",
-            "created": int(time.time()),
-            "model": "flow2api",
-            "choices": [{
-                "index": 0,
-                "delta": {},
-                "finish_reason": finish_reason
-            }]
-        }
-
-        if role:
-            chunk["choices"][0]["delta"]["role"] = role
+        """创建流式响应chunk
 
+        按固定模板拼接，只对 content / role / finish_reason 做 JSON 转义，
+        输出与序列化完整 chunk 字典等价。
+        """
+        now = int(time.time())
+        delta = f'"role":{_json_string(role)},' if role else ""
         if finish_reason:
-            chunk["choices"][0]["delta"]["content"] = content
+            delta += f'"content":{_json_string(content)}'
+            finish = _json_string(finish_reason)
         else:
-            chunk["choices"][0]["delta"]["reasoning_content"] = content
+            delta += f'"reasoning_content":{_json_string(content)}'
+            finish = "null"
 
-        return f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+        return (
+            f'data: {{"id":"chatcmpl-{now}","object":"chat.completion.chunk","created":{now},'
+            f'"model":"flow2api","choices":[{{"index":0,"delta":{{{delta}}},"finish_reason":{finish}}}]}}\n\n'
+        )
 
     def _create_completion_response(self, content: str, media_type: str = "image", is_availability_check: bool = False) -> str:
         """创建非流式响应
@@ -1406,9 +1480,6 @@ class GenerationHandler:
         Returns:
             JSON格式的响应
         """
-        import json
-        import time
-
         # 可用性检查: 返回纯文本消息
         if is_availability_check:
             formatted_content = content
@@ -1434,12 +1505,10 @@ class GenerationHandler:
             }]
         }
 
-        return json.dumps(response, ensure_ascii=False)
+        return _json_dumps(response)
 
     def _create_error_response(self, error_message: str) -> str:
         """创建错误响应"""
-        import json
-
         error = {
             "error": {
                 "message": error_message,
@@ -1448,7 +1517,7 @@ class GenerationHandler:
             }
         }
 
-        return json.dumps(error, ensure_ascii=False)
+        return _json_dumps(error)
 
     def _get_base_url(self) -> str:
         """获取基础URL用于缓存文件访问"""
@@ -0,0 +1,137 @@
+"""Shared HTTP session pool
+
+复用长连接的 curl_cffi AsyncSession，按 (代理URL, 浏览器指纹) 分组，
+避免每次上游请求都重新进行 TCP + TLS 握手。
+"""
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, Optional, Tuple
+from curl_cffi.requests import AsyncSession
+from ..core.config import config
+from ..core.logger import debug_logger
+
+
+class _PooledSession:
+    """池中单个会话的状态"""
+
+    def __init__(self, session: AsyncSession):
+        self.session = session
+        self.in_use = 0
+        self.last_used = time.time()
+
+
+class HttpSessionPool:
+    """按 (proxy_url, impersonate) 复用的 AsyncSession 池
+
+    - 同一 key 的请求共享一个会话（curl 连接缓存 + HTTP/2 多路复用）
+    - 会话归还时清空 Cookie Jar，共享会话之间不传递 Cookie
+    - 超过 max_size 时淘汰最久未使用的空闲会话
+    - 空闲超过 idle_timeout 的会话在下次获取时被关闭
+    """
+
+    def __init__(self):
+        self._sessions: Dict[Tuple[Optional[str], str], _PooledSession] = {}
+        self._lock = asyncio.Lock()
+
+    @asynccontextmanager
+    async def session(self, proxy_url: Optional[str] = None, impersonate: str = "chrome110", isolated: bool = False):
+        """获取共享会话
+
+        Args:
+            proxy_url: 代理URL
+            impersonate: 浏览器指纹
+            isolated: 使用一次性会话而不是共享会话。携带账号 Cookie 的请求 (ST 认证) 必须使用，
+                避免响应中的 Set-Cookie 进入共享 Cookie Jar 后被其他账号的请求带上
+
+        Usage:
+            async with http_session_pool.session(proxy_url) as session:
+                response = await session.get(url, ...)
+        """
+        if isolated:
+            async with AsyncSession(impersonate=impersonate, proxy=proxy_url or None) as session:
+                yield session
+            return
+
+        entry = await self._acquire(proxy_url, impersonate)
+        try:
+            yield entry.session
+        finally:
+            entry.in_use -= 1
+            entry.last_used = time.time()
+            # 共享会话不保留 Cookie，丢弃本次响应写入 Cookie Jar 的内容
+            entry.session.cookies.clear()
+
+    async def _acquire(self, proxy_url: Optional[str], impersonate: str) -> _PooledSession:
+        key = (proxy_url or None, impersonate)
+        async with self._lock:
+            await self._evict_idle()
+
+            entry = self._sessions.get(key)
+            if entry is None:
+                await self._evict_for_capacity()
+                entry = _PooledSession(AsyncSession(
+                    impersonate=impersonate,
+                    proxy=proxy_url or None,
+                    max_clients=config.http_pool_max_clients
+                ))
+                self._sessions[key] = entry
+                debug_logger.log_info(
+                    f"[HttpPool] 新建会话 (proxy={'yes' if proxy_url else 'no'}, impersonate={impersonate}, 当前共 {len(self._sessions)} 个)"
+                )
+
+            entry.in_use += 1
+            entry.last_used = time.time()
+            return entry
+
+    async def _evict_idle(self):
+        """关闭空闲超时的会话（调用方需持有锁）"""
+        idle_timeout = config.http_pool_idle_timeout
+        now = time.time()
+        expired = [
+            key for key, entry in self._sessions.items()
+            if entry.in_use == 0 and now - entry.last_used > idle_timeout
+        ]
+        for key in expired:
+            await self._close_entry(self._sessions.pop(key))
+        if expired:
+            debug_logger.log_info(f"[HttpPool] 已关闭 {len(expired)} 个空闲会话")
+
+    async def _evict_for_capacity(self):
+        """超出容量时淘汰最久未使用的空闲会话（调用方需持有锁）"""
+        max_size = config.http_pool_max_size
+        while len(self._sessions) >= max_size:
+            idle = [(entry.last_used, key) for key, entry in self._sessions.items() if entry.in_use == 0]
+            if not idle:
+                # 所有会话都在使用中，允许临时超出上限
+                break
+            _, key = min(idle, key=lambda item: item[0])
+            await self._close_entry(self._sessions.pop(key))
+
+    async def _close_entry(self, entry: _PooledSession):
+        try:
+            await entry.session.close()
+        except Exception as e:
+            debug_logger.log_warning(f"[HttpPool] 关闭会话异常: {str(e)}")
+
+    async def close(self):
+        """关闭所有会话（应用关闭时调用）"""
+        async with self._lock:
+            sessions = list(self._sessions.values())
+            self._sessions.clear()
+        for entry in sessions:
+            await self._close_entry(entry)
+        if sessions:
+            debug_logger.log_info(f"[HttpPool] 已关闭全部 {len(sessions)} 个会话")
+
+    def get_stats(self) -> dict:
+        """获取会话池状态"""
+        return {
+            "size": len(self._sessions),
+            "in_use": sum(entry.in_use for entry in self._sessions.values()),
+            "max_size": config.http_pool_max_size
+        }
+
+
+# Global session pool instance
+http_session_pool = HttpSessionPool()
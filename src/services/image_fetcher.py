@@ -0,0 +1,101 @@
+"""Reference image fetcher
+
+并发获取请求中引用的图片: 本地 /tmp/ 缓存文件在线程中读取，
+远程图片通过共享会话池流式下载并限制大小，同一请求内相同 URL 只下载一次。
+"""
+import asyncio
+from pathlib import Path
+from typing import Dict, List, Optional
+from urllib.parse import urlparse
+from ..core.config import config
+from ..core.logger import debug_logger
+from .http_session_pool import http_session_pool
+
+
+class ImageTooLargeError(Exception):
+    """图片超过 generation.max_image_bytes"""
+
+
+class ImageFetcher:
+    """获取参考图片数据"""
+
+    def __init__(self, cache_dir: Optional[Path] = None):
+        self.cache_dir = cache_dir
+
+    async def _read_local(self, url: str) -> Optional[bytes]:
+        """读取本地 /tmp/ 缓存文件，不存在时返回 None"""
+        if not self.cache_dir or "/tmp/" not in url:
+            return None
+
+        filename = urlparse(url).path.split("/tmp/")[-1]
+        cache_dir = self.cache_dir.resolve()
+        local_file_path = (cache_dir / filename).resolve()
+        # 只允许读取缓存目录下的文件
+        if local_file_path.parent != cache_dir:
+            return None
+
+        def read() -> Optional[bytes]:
+            if not local_file_path.is_file():
+                return None
+            max_bytes = config.max_image_bytes
+            if max_bytes and local_file_path.stat().st_size > max_bytes:
+                raise ImageTooLargeError(f"本地图片超过 {max_bytes} 字节上限")
+            return local_file_path.read_bytes()
+
+        return await asyncio.to_thread(read)
+
+    async def _download(self, url: str) -> Optional[bytes]:
+        """流式下载远程图片，超过大小上限时中止"""
+        max_bytes = config.max_image_bytes
+        async with http_session_pool.session() as session:
+            async with session.stream("GET", url, timeout=30, verify=False) as response:
+                if response.status_code != 200:
+                    debug_logger.log_warning(f"[CONTEXT] 图片下载失败，状态码: {response.status_code}")
+                    return None
+
+                content_length = response.headers.get("content-length")
+                if max_bytes and content_length and content_length.isdigit() and int(content_length) > max_bytes:
+                    response.quit_now.set()
+                    raise ImageTooLargeError(f"远程图片超过 {max_bytes} 字节上限 ({content_length} 字节)")
+
+                data = bytearray()
+                async for chunk in response.aiter_content():
+                    data += chunk
+                    if max_bytes and len(data) > max_bytes:
+                        # 通知 curl 中止传输
+                        response.quit_now.set()
+                        raise ImageTooLargeError(f"远程图片超过 {max_bytes} 字节上限")
+                return bytes(data)
+
+    async def fetch(self, url: str) -> Optional[bytes]:
+        """获取单张图片: 优先读取本地缓存，否则下载；失败时返回 None"""
+        try:
+            data = await self._read_local(url)
+            if data:
+                return data
+        except ImageTooLargeError as e:
+            debug_logger.log_warning(f"[CONTEXT] {str(e)}: {url}")
+            return None
+        except Exception as e:
+            debug_logger.log_warning(f"[CONTEXT] 本地缓存读取失败: {str(e)}")
+
+        try:
+            return await self._download(url)
+        except ImageTooLargeError as e:
+            debug_logger.log_warning(f"[CONTEXT] {str(e)}: {url}")
+        except Exception as e:
+            debug_logger.log_error(f"[CONTEXT] 图片下载异常: {str(e)}")
+        return None
+
+    async def fetch_all(self, urls: List[str]) -> List[Optional[bytes]]:
+        """并发获取多张图片，结果与 urls 顺序一致，相同 URL 只获取一次"""
+        tasks: Dict[str, asyncio.Task] = {}
+        for url in urls:
+            if url not in tasks:
+                tasks[url] = asyncio.create_task(self.fetch(url))
+        try:
+            await asyncio.gather(*tasks.values())
+        finally:
+            for task in tasks.values():
+                task.cancel()
+        return [tasks[url].result() for url in urls]
@@ -1,17 +1,70 @@
 """Load balancing module for Flow2API"""
 import random
-from typing import Optional
+from typing import Callable, List, Optional
 from ..core.models import Token
 from .concurrency_manager import ConcurrencyManager
 from ..core.logger import debug_logger
 
 
+class NoEligibleTokenError(Exception):
+    """No enabled token can serve the request, so waiting for a slot is pointless"""
+
+
+class TokenLease:
+    """A token selected together with its concurrency slot
+
+    Use as an async context manager; the slot is released on exit.
+    """
+
+    def __init__(
+        self,
+        token: Token,
+        kind: str,
+        concurrency_manager: Optional[ConcurrencyManager] = None,
+        on_release: Optional[Callable[[str], None]] = None
+    ):
+        self.token = token
+        self.kind = kind
+        self._concurrency_manager = concurrency_manager
+        self._on_release = on_release
+        self._released = False
+
+    async def release(self):
+        """Release the concurrency slot (idempotent)"""
+        if self._released:
+            return
+        self._released = True
+        if self._concurrency_manager:
+            if self.kind == "image":
+                await self._concurrency_manager.release_image(self.token.id)
+            else:
+                await self._concurrency_manager.release_video(self.token.id)
+        if self._on_release:
+            self._on_release(self.kind)
+
+    async def __aenter__(self) -> "TokenLease":
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.release()
+
+
 class LoadBalancer:
     """Token load balancer with random selection"""
 
     def __init__(self, token_manager, concurrency_manager: Optional[ConcurrencyManager] = None):
         self.token_manager = token_manager
         self.concurrency_manager = concurrency_manager
+        # 槽位释放时的回调 (kind)，供排队中的请求重试
+        self._release_listeners: List[Callable[[str], None]] = []
+
+    def add_release_listener(self, listener: Callable[[str], None]):
+        """Register a callback invoked whenever a lease releases its slot"""
+        self._release_listeners.append(listener)
+
+    def _notify_release(self, kind: str):
+        for listener in self._release_listeners:
+            listener(kind)
 
     async def select_token(
         self,
@@ -73,8 +126,8 @@ class LoadBalancer:
 
             available_tokens.append(token)
 
-        # 输出过滤信息
-        if filtered_reasons:
+        # 输出过滤信息 (调试关闭时跳过逐条格式化)
+        if filtered_reasons and debug_logger.enabled:
             debug_logger.log_info(f"[LOAD_BALANCER] 已过滤Token:")
             for token_id, reason in filtered_reasons.items():
                 debug_logger.log_info(f"[LOAD_BALANCER]   - Token {token_id}: {reason}")
@@ -87,3 +140,64 @@ class LoadBalancer:
         selected = random.choice(available_tokens)
         debug_logger.log_info(f"[LOAD_BALANCER] ✅ 已选择Token {selected.id} ({selected.email}) - 余额: {selected.credits}")
         return selected
+
+    async def reserve(self, kind: str, model: Optional[str] = None) -> Optional[TokenLease]:
+        """
+        Select a token and acquire its concurrency slot in one step
+
+        Candidates are tried in random order; acquiring the slot is atomic,
+        so a token filled up by a concurrent request is skipped instead of
+        failing later with "并发限制已达上限".
+
+        Args:
+            kind: "image" or "video"
+            model: Model name
+
+        Returns:
+            TokenLease holding the slot, or None if every eligible token is saturated
+
+        Raises:
+            NoEligibleTokenError: No candidate token exists or none was skipped
+                for being full (e.g. all ATs are invalid)
+        """
+        is_image = kind == "image"
+        debug_logger.log_info(f"[LOAD_BALANCER] 开始预留Token (类型={kind}, 模型={model})")
+
+        active_tokens = await self.token_manager.get_active_tokens()
+        candidates = [
+            token for token in active_tokens
+            if (token.image_enabled if is_image else token.video_enabled)
+        ]
+        random.shuffle(candidates)
+
+        saturated = 0
+        for token in candidates:
+            lease = TokenLease(token, kind, self.concurrency_manager, self._notify_release)
+            if self.concurrency_manager:
+                if is_image:
+                    acquired = await self.concurrency_manager.acquire_image(token.id)
+                else:
+                    acquired = await self.concurrency_manager.acquire_video(token.id)
+                if not acquired:
+                    saturated += 1
+                    debug_logger.log_info("[LOAD_BALANCER]   - Token %s: %s并发已满", token.id, "图片" if is_image else "视频")
+                    continue
+
+            # 先占槽位再检查AT，避免为已满的Token刷新AT
+            try:
+                at_valid = await self.token_manager.is_at_valid(token.id)
+            except BaseException:
+                await lease.release()
+                raise
+            if not at_valid:
+                debug_logger.log_info("[LOAD_BALANCER]   - Token %s: AT无效或已过期", token.id)
+                await lease.release()
+                continue
+
+            debug_logger.log_info(f"[LOAD_BALANCER] ✅ 已预留Token {token.id} ({token.email}) - 余额: {token.credits}")
+            return lease
+
+        debug_logger.log_info(f"[LOAD_BALANCER] ❌ 没有可预留的Token (类型={kind}, 候选={len(candidates)}, 并发已满={saturated})")
+        if not saturated:
+            raise NoEligibleTokenError(kind)
+        return None
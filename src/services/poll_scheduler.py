@@ -0,0 +1,99 @@
+"""Adaptive video poll scheduling
+
+根据模型的历史耗时（tasks 表 created_at/completed_at）估算最早可能完成的时间，
+在此之前不轮询，之后按超出时长逐步放宽间隔，并加入随机抖动避免请求同步。
+"""
+import random
+import time
+from typing import Dict, Optional
+from ..core.config import config
+from ..core.logger import debug_logger
+
+
+# 没有历史数据时的默认预计耗时(秒)
+DEFAULT_EXPECTED_DURATION = 120
+DEFAULT_UPSAMPLE_DURATION = {
+    "4k": 1200,
+    "1080p": 300
+}
+
+# 历史统计缓存时间(秒)
+STATS_REFRESH_INTERVAL = 600
+# 至少需要多少条历史记录才采用学习到的耗时
+MIN_SAMPLES = 3
+# 没有历史数据时，最早完成时间按预计耗时的比例估算
+DEFAULT_EARLIEST_RATIO = 0.5
+# 超过最早完成时间后，轮询间隔最多为已超出时长的这一比例 (发现延迟不超过该比例)
+OVERDUE_DELAY_RATIO = 0.1
+
+
+class PollScheduler:
+    """视频轮询间隔调度器"""
+
+    def __init__(self, db):
+        self.db = db
+        self._stats: Dict[str, Dict[str, float]] = {}
+        self._stats_loaded_at = 0.0
+
+    async def _refresh_stats(self):
+        """按需刷新历史耗时统计"""
+        if time.time() - self._stats_loaded_at < STATS_REFRESH_INTERVAL:
+            return
+        self._stats_loaded_at = time.time()
+        try:
+            self._stats = await self.db.get_task_duration_stats()
+        except Exception as e:
+            debug_logger.log_warning(f"[PollScheduler] 加载历史耗时失败: {str(e)}")
+
+    async def _learned(self, model_key: Optional[str]) -> Optional[Dict[str, float]]:
+        """样本足够时返回模型的历史耗时统计"""
+        await self._refresh_stats()
+        stats = self._stats.get(model_key) if model_key else None
+        if stats and stats["count"] >= MIN_SAMPLES and stats["avg"]:
+            return stats
+        return None
+
+    @staticmethod
+    def _default_duration(model_key: Optional[str]) -> float:
+        if model_key and "upsampler" in model_key:
+            for resolution, duration in DEFAULT_UPSAMPLE_DURATION.items():
+                if resolution in model_key:
+                    return duration
+        return DEFAULT_EXPECTED_DURATION
+
+    async def expected_duration(self, model_key: Optional[str]) -> float:
+        """获取模型的平均耗时(秒)，用于估算进度和等待上限"""
+        stats = await self._learned(model_key)
+        if stats:
+            return float(stats["avg"])
+        return self._default_duration(model_key)
+
+    async def earliest_completion(self, model_key: Optional[str]) -> float:
+        """获取模型最早可能完成的时间(秒)，即历史最短耗时"""
+        stats = await self._learned(model_key)
+        if stats and stats["min"]:
+            return float(stats["min"])
+        return self._default_duration(model_key) * DEFAULT_EARLIEST_RATIO
+
+    def next_delay(self, earliest: float, elapsed: float) -> float:
+        """计算下一次轮询前的等待时间
+
+        - 最早完成时间之前: 直接等到该时间点 (单次不超过最大间隔)
+        - 之后: 间隔不超过已超出时长的 OVERDUE_DELAY_RATIO，
+          使任务在任意时刻完成时的发现延迟都与其超出时长成比例
+        """
+        min_interval = config.poll_interval
+        max_interval = max(config.poll_max_interval, min_interval)
+
+        remaining = earliest - elapsed
+        if remaining > 0:
+            delay = remaining
+        else:
+            delay = -remaining * OVERDUE_DELAY_RATIO
+
+        delay = min(max(delay, min_interval), max_interval)
+        jitter = config.poll_jitter
+        if remaining > 0:
+            # 最早完成时间之前只提前不推后，避免越过该时间点
+            return delay * random.uniform(1 - jitter, 1)
+        return delay * random.uniform(1 - jitter, 1 + jitter)
@@ -0,0 +1,170 @@
+"""Write-behind token statistics
+
+在内存中按 token 累加使用/成功/错误计数，定时或累计到一定事件数后
+在一个事务中批量写入数据库，避免请求路径上的多次读-改-写。
+连续错误计数同时在内存中维护，保证自动禁用判断实时准确。
+"""
+import asyncio
+from datetime import date, datetime
+from typing import Dict, Optional
+from ..core.config import config
+from ..core.logger import debug_logger
+
+
+class _PendingStats:
+    """单个 token 尚未写入数据库的增量"""
+
+    def __init__(self):
+        self.images = 0
+        self.videos = 0
+        self.errors = 0
+        self.uses = 0
+        self.last_used_at: Optional[datetime] = None
+        # True 表示期间发生过连续错误清零，写入时用 consecutive_delta 覆盖原值
+        self.reset_consecutive = False
+        self.consecutive_delta = 0
+
+
+class TokenStatsWriter:
+    """Token 统计的写后缓冲"""
+
+    def __init__(self, db):
+        self.db = db
+        self._pending: Dict[int, _PendingStats] = {}
+        self._pending_date = str(date.today())
+        self._pending_events = 0
+        # token_id -> 当前连续错误数（以内存为准）
+        self._consecutive: Dict[int, int] = {}
+        self._flush_lock = asyncio.Lock()
+        self._flush_task: Optional[asyncio.Task] = None
+        self._wakeup = asyncio.Event()
+
+    async def start(self):
+        """Start background flush task"""
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_loop())
+
+    async def close(self):
+        """Stop background task and flush remaining counters"""
+        if self._flush_task:
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+            self._flush_task = None
+        await self.flush()
+
+    async def _flush_loop(self):
+        interval = config.stats_flush_interval_ms / 1000
+        while True:
+            try:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+                await self.flush()
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                debug_logger.log_error(f"[StatsWriter] 批量写入统计失败: {str(e)}")
+
+    async def _bucket(self, token_id: int) -> _PendingStats:
+        """获取 token 的增量桶；跨天时先把旧日期的数据写入"""
+        today = str(date.today())
+        if today != self._pending_date:
+            await self.flush()
+            self._pending_date = today
+
+        self._pending_events += 1
+        if self._pending_events >= config.stats_flush_max_events:
+            self._wakeup.set()
+
+        bucket = self._pending.get(token_id)
+        if bucket is None:
+            bucket = self._pending[token_id] = _PendingStats()
+        return bucket
+
+    async def record_usage(self, token_id: int, is_video: bool = False):
+        """记录一次使用（图片或视频）"""
+        bucket = await self._bucket(token_id)
+        bucket.uses += 1
+        bucket.last_used_at = datetime.now()
+        if is_video:
+            bucket.videos += 1
+        else:
+            bucket.images += 1
+
+    async def record_error(self, token_id: int) -> int:
+        """记录一次错误
+
+        Returns:
+            记录后的连续错误数
+        """
+        if token_id not in self._consecutive:
+            stats = await self.db.get_token_stats(token_id)
+            # 读取期间其他请求可能已经写入内存计数 (并发的首次错误或清零)，以内存为准
+            self._consecutive.setdefault(token_id, stats.consecutive_error_count if stats else 0)
+
+        bucket = await self._bucket(token_id)
+        bucket.errors += 1
+        bucket.consecutive_delta += 1
+        self._consecutive[token_id] += 1
+        return self._consecutive[token_id]
+
+    async def reset_errors(self, token_id: int):
+        """清零连续错误数（请求成功或手动启用）"""
+        if self._consecutive.get(token_id) == 0:
+            return
+        bucket = await self._bucket(token_id)
+        bucket.reset_consecutive = True
+        bucket.consecutive_delta = 0
+        self._consecutive[token_id] = 0
+
+    def forget(self, token_id: int):
+        """丢弃已删除 token 的缓存"""
+        self._pending.pop(token_id, None)
+        self._consecutive.pop(token_id, None)
+
+    async def flush(self):
+        """把累计的增量在一个事务中写入数据库"""
+        async with self._flush_lock:
+            if not self._pending:
+                return
+            pending, self._pending = self._pending, {}
+            today = self._pending_date
+            self._pending_events = 0
+
+            stats_rows = []
+            usage_rows = []
+            for token_id, bucket in pending.items():
+                stats_rows.append((
+                    token_id, bucket.images, bucket.videos, bucket.errors,
+                    bucket.reset_consecutive, bucket.consecutive_delta
+                ))
+                if bucket.uses:
+                    usage_rows.append((token_id, bucket.uses, bucket.last_used_at))
+
+            try:
+                await self.db.apply_token_stats_batch(today, stats_rows, usage_rows)
+            except Exception:
+                # 写入失败时把增量合并回去，等待下次重试
+                for token_id, bucket in pending.items():
+                    self._merge_back(token_id, bucket)
+                raise
+
+    def _merge_back(self, token_id: int, old: _PendingStats):
+        """把写入失败的旧增量合并到当前增量之前"""
+        new = self._pending.get(token_id)
+        if new is None:
+            self._pending[token_id] = old
+            return
+        new.images += old.images
+        new.videos += old.videos
+        new.errors += old.errors
+        new.uses += old.uses
+        new.last_used_at = new.last_used_at or old.last_used_at
+        if not new.reset_consecutive:
+            new.reset_consecutive = old.reset_consecutive
+            new.consecutive_delta += old.consecutive_delta
@@ -0,0 +1,201 @@
+"""Bulk token import pipeline
+
+批量导入 Token: 受限并发 + 限速地执行 ST→AT 转换，按邮箱索引去重，
+新账号查询余额并创建项目，最后在一个事务中写入全部记录，过程中产出进度。
+"""
+import asyncio
+import time
+from datetime import datetime, timezone
+from typing import Any, AsyncGenerator, Awaitable, Callable, Dict, List
+from ..core.config import config
+from ..core.logger import debug_logger
+from ..core.models import Token
+
+
+class _RateLimiter:
+    """按固定间隔放行请求 (每秒最多 rate 个)"""
+
+    def __init__(self, rate: float):
+        self._interval = 1.0 / rate if rate > 0 else 0
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self):
+        if not self._interval:
+            return
+        async with self._lock:
+            now = time.monotonic()
+            delay = self._next - now
+            self._next = max(now, self._next) + self._interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+class TokenImporter:
+    """批量导入 Token"""
+
+    def __init__(self, token_manager):
+        self.token_manager = token_manager
+        self.flow_client = token_manager.flow_client
+        self._semaphore = asyncio.Semaphore(max(1, config.token_import_concurrency))
+        self._limiter = _RateLimiter(config.token_import_rate)
+
+    async def _call(self, func: Callable[..., Awaitable[Any]], *args) -> Any:
+        """在并发和速率限制下调用 Flow 接口"""
+        async with self._semaphore:
+            await self._limiter.wait()
+            return await func(*args)
+
+    async def _run_all(self, jobs: List[Awaitable], stage: str) -> AsyncGenerator[Dict, None]:
+        """并行执行任务，每完成一个产出一条进度"""
+        total = len(jobs)
+        done = 0
+        for future in asyncio.as_completed(jobs):
+            await future
+            done += 1
+            yield {"type": "progress", "stage": stage, "done": done, "total": total}
+
+    async def run(self, items: List[Any]) -> AsyncGenerator[Dict, None]:
+        """执行导入
+
+        Args:
+            items: ImportTokenItem 列表 (session_token / image_enabled / video_enabled /
+                image_concurrency / video_concurrency)
+
+        Yields:
+            {"type": "progress", ...} 进度事件，最后一条为 {"type": "result", ...}
+        """
+        # (序号, 错误信息)，并行完成顺序不固定，最后按序号排序
+        errors: List[tuple] = []
+        converted: Dict[int, Dict] = {}
+
+        # 1. ST → AT (受限并发)
+        async def convert(idx: int, item):
+            st = item.session_token
+            if not st:
+                errors.append((idx, f"第{idx+1}项: 缺少 session_token"))
+                return
+            try:
+                result = await self._call(self.flow_client.st_to_at, st)
+            except Exception as e:
+                errors.append((idx, f"第{idx+1}项: {str(e)}"))
+                return
+
+            user_info = result.get("user", {})
+            email = user_info.get("email")
+            if not email:
+                errors.append((idx, f"第{idx+1}项: 无法获取邮箱信息"))
+                return
+
+            at_expires = None
+            expires = result.get("expires")
+            if expires:
+                try:
+                    at_expires = datetime.fromisoformat(expires.replace('Z', '+00:00'))
+                except ValueError:
+                    pass
+
+            converted[idx] = {
+                "idx": idx,
+                "item": item,
+                "st": st,
+                "at": result["access_token"],
+                "at_expires": at_expires,
+                "is_expired": bool(at_expires and at_expires <= datetime.now(timezone.utc)),
+                "email": email,
+                "name": user_info.get("name", email.split("@")[0])
+            }
+
+        jobs = [convert(idx, item) for idx, item in enumerate(items)]
+        async for event in self._run_all(jobs, "convert"):
+            yield event
+
+        # 2. 按邮箱去重 (同一邮箱后出现的覆盖前面的)，对照已有 token 的邮箱索引
+        email_index = {token.email: token for token in self.token_manager.registry.all()}
+        latest: Dict[str, Dict] = {}
+        duplicates = 0
+        for idx in sorted(converted):
+            entry = converted[idx]
+            if entry["email"] in latest:
+                duplicates += 1
+            latest[entry["email"]] = entry
+
+        new_entries = [entry for email, entry in latest.items() if email not in email_index]
+
+        # 3. 新账号: 查询余额并创建项目
+        project_name = datetime.now().strftime("%b %d - %H:%M")
+
+        async def prepare_new(entry: Dict):
+            try:
+                credits_result = await self._call(self.flow_client.get_credits, entry["at"])
+                entry["credits"] = credits_result.get("credits", 0)
+                entry["user_paygate_tier"] = credits_result.get("userPaygateTier")
+            except Exception:
+                entry["credits"] = 0
+                entry["user_paygate_tier"] = None
+            try:
+                entry["project_id"] = await self._call(self.flow_client.create_project, entry["st"], project_name)
+            except Exception as e:
+                entry["error"] = f"第{entry['idx']+1}项: 创建项目失败: {str(e)}"
+
+        if new_entries:
+            async for event in self._run_all([prepare_new(entry) for entry in new_entries], "prepare"):
+                yield event
+
+        # 4. 一个事务写入全部记录
+        new_tokens: List[Token] = []
+        updates: List[tuple] = []
+        for email, entry in latest.items():
+            item = entry["item"]
+            existing = email_index.get(email)
+            if existing:
+                fields = {
+                    "st": entry["st"],
+                    "at": entry["at"],
+                    "at_expires": entry["at_expires"],
+                    "image_enabled": item.image_enabled,
+                    "video_enabled": item.video_enabled,
+                    "image_concurrency": item.image_concurrency,
+                    "video_concurrency": item.video_concurrency
+                }
+                # 与 TokenManager.update_token 相同: 清空未过期token的429禁用状态
+                fields.update(self.token_manager.edit_unban_fields(existing))
+                # 如果过期则禁用
+                if entry["is_expired"]:
+                    fields["is_active"] = False
+                updates.append((existing.id, fields))
+            elif "error" in entry:
+                errors.append((entry["idx"], entry["error"]))
+            else:
+                new_tokens.append(Token(
+                    st=entry["st"],
+                    at=entry["at"],
+                    at_expires=entry["at_expires"],
+                    email=email,
+                    name=entry["name"],
+                    is_active=not entry["is_expired"],
+                    credits=entry["credits"],
+                    user_paygate_tier=entry["user_paygate_tier"],
+                    current_project_id=entry["project_id"],
+                    current_project_name=project_name,
+                    image_enabled=item.image_enabled,
+                    video_enabled=item.video_enabled,
+                    image_concurrency=item.image_concurrency,
+                    video_concurrency=item.video_concurrency
+                ))
+
+        yield {"type": "progress", "stage": "save", "done": 0, "total": len(new_tokens) + len(updates)}
+        await self.token_manager.db.import_tokens(new_tokens, updates)
+
+        errors = [message for _, message in sorted(errors)]
+        added = len(new_tokens)
+        updated = len(updates) + duplicates
+        debug_logger.log_info(f"[IMPORT] 导入完成: 新增 {added}, 更新 {updated}, 失败 {len(errors)}")
+        yield {
+            "type": "result",
+            "success": True,
+            "added": added,
+            "updated": updated,
+            "errors": errors if errors else None,
+            "message": f"导入完成: 新增 {added} 个, 更新 {updated} 个" + (f", {len(errors)} 个失败" if errors else "")
+        }
@@ -1,12 +1,19 @@
 """Token manager for Flow2API with AT auto-refresh"""
 import asyncio
 from datetime import datetime, timedelta, timezone
-from typing import Optional, List
+from typing import Dict, Optional, List
 from ..core.database import Database
 from ..core.models import Token, Project
 from ..core.logger import debug_logger
 from .flow_client import FlowClient
 from .proxy_manager import ProxyManager
+from .stats_writer import TokenStatsWriter
+from .token_registry import TokenRegistry
+from .at_refresh_scheduler import AtRefreshScheduler
+
+
+# 请求路径上 AT 剩余有效期低于该值(秒)时同步刷新，其余由后台调度提前刷新
+AT_EXPIRY_MARGIN = 60
 
 
 class TokenManager:
@@ -15,7 +22,16 @@ class TokenManager:
     def __init__(self, db: Database, flow_client: FlowClient):
         self.db = db
         self.flow_client = flow_client
-        self._lock = asyncio.Lock()
+        # 每个 token 独立的刷新锁，不同账号的刷新可以并行
+        self._refresh_locks: Dict[int, asyncio.Lock] = {}
+        # 进行中的 AT 刷新 (single-flight)，同一 token 的并发调用共享同一次刷新
+        self._refresh_inflight: Dict[int, asyncio.Task] = {}
+        # 使用统计写后缓冲，定时批量落库
+        self.stats_writer = TokenStatsWriter(db)
+        # Token 内存索引，随数据库写入自动更新
+        self.registry = TokenRegistry(db)
+        # AT 过期前后台主动刷新 (需在 registry 之后创建，保证变更通知先更新索引)
+        self.refresh_scheduler = AtRefreshScheduler(self)
 
     # ========== Token CRUD ==========
 
@@ -24,7 +40,9 @@ class TokenManager:
         return await self.db.get_all_tokens()
 
     async def get_active_tokens(self) -> List[Token]:
-        """Get all active tokens"""
+        """Get all active tokens (from the in-memory registry once loaded)"""
+        if self.registry.loaded:
+            return self.registry.active()
         return await self.db.get_active_tokens()
 
     async def get_token(self, token_id: int) -> Optional[Token]:
@@ -34,13 +52,15 @@ class TokenManager:
     async def delete_token(self, token_id: int):
         """Delete token"""
         await self.db.delete_token(token_id)
+        self.stats_writer.forget(token_id)
+        self._refresh_locks.pop(token_id, None)
 
     async def enable_token(self, token_id: int):
         """Enable a token and reset error count"""
         # Enable the token
         await self.db.update_token(token_id, is_active=True)
         # Reset error count when enabling (only reset total error_count, keep today_error_count)
-        await self.db.reset_error_count(token_id)
+        await self.stats_writer.reset_errors(token_id)
 
     async def disable_token(self, token_id: int):
         """Disable a token"""
@@ -208,36 +228,48 @@ class TokenManager:
 
         # 检查token是否因429被禁用，如果是且未过期，则清空429状态
         token = await self.db.get_token(token_id)
-        if token and token.ban_reason == "429_rate_limit":
-            # 检查token是否过期
-            is_expired = False
-            if token.at_expires:
-                now = datetime.now(timezone.utc)
-                if token.at_expires.tzinfo is None:
-                    at_expires_aware = token.at_expires.replace(tzinfo=timezone.utc)
-                else:
-                    at_expires_aware = token.at_expires
-                is_expired = at_expires_aware <= now
-
-            # 如果未过期，清空429禁用状态
-            if not is_expired:
-                debug_logger.log_info(f"[UPDATE_TOKEN] Token {token_id} 编辑保存，清空429禁用状态")
-                update_fields["ban_reason"] = None
-                update_fields["banned_at"] = None
+        update_fields.update(self.edit_unban_fields(token))
 
         if update_fields:
             await self.db.update_token(token_id, **update_fields)
 
+    def edit_unban_fields(self, token: Optional[Token]) -> dict:
+        """编辑/重新导入token时需要附加的更新字段
+
+        token因429被禁用且未过期时，清空429禁用状态
+        """
+        if not token or token.ban_reason != "429_rate_limit":
+            return {}
+
+        # 检查token是否过期
+        is_expired = False
+        if token.at_expires:
+            now = datetime.now(timezone.utc)
+            if token.at_expires.tzinfo is None:
+                at_expires_aware = token.at_expires.replace(tzinfo=timezone.utc)
+            else:
+                at_expires_aware = token.at_expires
+            is_expired = at_expires_aware <= now
+
+        # 如果未过期，清空429禁用状态
+        if is_expired:
+            return {}
+        debug_logger.log_info(f"[UPDATE_TOKEN] Token {token.id} 编辑保存，清空429禁用状态")
+        return {"ban_reason": None, "banned_at": None}
+
     # ========== AT自动刷新逻辑 (核心) ==========
 
     async def is_at_valid(self, token_id: int) -> bool:
-        """检查AT是否有效,如果无效或即将过期则自动刷新
+        """检查AT是否有效 (内存检查),AT不存在或已过期时同步刷新
 
         Returns:
             True if AT is valid or refreshed successfully
             False if AT cannot be refreshed
         """
-        token = await self.db.get_token(token_id)
+        if self.registry.loaded:
+            token = self.registry.get(token_id)
+        else:
+            token = await self.db.get_token(token_id)
         if not token:
             return False
 
@@ -251,7 +283,7 @@ class TokenManager:
             debug_logger.log_info(f"[AT_CHECK] Token {token_id}: AT过期时间未知,尝试刷新")
             return await self._refresh_at(token_id)
 
-        # 检查是否即将过期 (提前1小时刷新)
+        # AT 由 refresh_scheduler 在过期前主动刷新，这里只在已过期时兜底同步刷新
         now = datetime.now(timezone.utc)
         # 确保at_expires也是timezone-aware
         if token.at_expires.tzinfo is None:
@@ -261,24 +293,50 @@ class TokenManager:
 
         time_until_expiry = at_expires_aware - now
 
-        if time_until_expiry.total_seconds() < 3600:  # 1 hour (3600 seconds)
-            debug_logger.log_info(f"[AT_CHECK] Token {token_id}: AT即将过期 (剩余 {time_until_expiry.total_seconds():.0f} 秒),需要刷新")
+        if time_until_expiry.total_seconds() < AT_EXPIRY_MARGIN:
+            debug_logger.log_info(f"[AT_CHECK] Token {token_id}: AT已过期 (剩余 {time_until_expiry.total_seconds():.0f} 秒),需要刷新")
             return await self._refresh_at(token_id)
 
         # AT有效
         return True
 
 
+    def _refresh_lock(self, token_id: int) -> asyncio.Lock:
+        """获取 token 的刷新锁"""
+        lock = self._refresh_locks.get(token_id)
+        if lock is None:
+            lock = self._refresh_locks[token_id] = asyncio.Lock()
+        return lock
+
     async def _refresh_at(self, token_id: int) -> bool:
         """内部方法: 刷新AT
 
-        如果 AT 刷新失败（ST 可能过期），会尝试通过浏览器自动刷新 ST，
-        然后重试 AT 刷新。
+        同一 token 的并发调用等待同一次刷新结果；
+        单个调用方被取消不会中断共享的刷新。
 
         Returns:
             True if refresh successful, False otherwise
         """
-        async with self._lock:
+        task = self._refresh_inflight.get(token_id)
+        if task is None or task.done():
+            task = asyncio.create_task(self._refresh_at_locked(token_id))
+            self._refresh_inflight[token_id] = task
+            task.add_done_callback(lambda t: self._on_refresh_done(token_id, t))
+        else:
+            debug_logger.log_info(f"[AT_REFRESH] Token {token_id}: 等待进行中的刷新")
+        return await asyncio.shield(task)
+
+    def _on_refresh_done(self, token_id: int, task: asyncio.Task):
+        if self._refresh_inflight.get(token_id) is task:
+            del self._refresh_inflight[token_id]
+
+    async def _refresh_at_locked(self, token_id: int) -> bool:
+        """刷新AT (持有该 token 的刷新锁)
+
+        如果 AT 刷新失败（ST 可能过期），会尝试通过浏览器自动刷新 ST，
+        然后重试 AT 刷新。
+        """
+        async with self._refresh_lock(token_id):
             token = await self.db.get_token(token_id)
             if not token:
                 return False
@@ -455,25 +513,19 @@ class TokenManager:
     # ========== Token使用统计 ==========
 
     async def record_usage(self, token_id: int, is_video: bool = False):
-        """Record token usage"""
-        await self.db.update_token(token_id, use_count=1, last_used_at=datetime.now())
-
-        if is_video:
-            await self.db.increment_token_stats(token_id, "video")
-        else:
-            await self.db.increment_token_stats(token_id, "image")
+        """Record token usage (buffered, flushed by stats_writer)"""
+        await self.stats_writer.record_usage(token_id, is_video)
 
     async def record_error(self, token_id: int):
         """Record token error and auto-disable if threshold reached"""
-        await self.db.increment_token_stats(token_id, "error")
+        consecutive_errors = await self.stats_writer.record_error(token_id)
 
-        # Check if should auto-disable token (based on consecutive errors)
-        stats = await self.db.get_token_stats(token_id)
+        # Check if should auto-disable token (based on in-memory consecutive errors)
         admin_config = await self.db.get_admin_config()
 
-        if stats and stats.consecutive_error_count >= admin_config.error_ban_threshold:
+        if consecutive_errors >= admin_config.error_ban_threshold:
             debug_logger.log_warning(
-                f"[TOKEN_BAN] Token {token_id} consecutive error count ({stats.consecutive_error_count}) "
+                f"[TOKEN_BAN] Token {token_id} consecutive error count ({consecutive_errors}) "
                 f"reached threshold ({admin_config.error_ban_threshold}), auto-disabling"
             )
             await self.disable_token(token_id)
@@ -484,7 +536,7 @@ class TokenManager:
         This method resets error_count to 0, which is used for auto-disable threshold checking.
         Note: today_error_count and historical statistics are NOT reset.
         """
-        await self.db.reset_error_count(token_id)
+        await self.stats_writer.reset_errors(token_id)
 
     async def ban_token_for_429(self, token_id: int):
         """因429错误立即禁用token
@@ -557,77 +609,27 @@ class TokenManager:
                     banned_at=None
                 )
                 # 重置错误计数
-                await self.db.reset_error_count(token.id)
+                await self.stats_writer.reset_errors(token.id)
 
-    async def auto_refresh_st_tokens(self):
-        """自动刷新即将过期或已过期 token 的 Session Token
+    async def refresh_ahead(self, token_id: int) -> bool:
+        """后台主动刷新: 先尝试通过 Flow 页面刷新 ST，再刷新 AT
 
-        规则:
-        - 仅处理已启用的 token
-        - AT 已过期或剩余时间少于 2 小时时触发刷新
-        - 通过请求 Flow 页面获取新的 ST
-        - 刷新成功后等待下次使用时自动刷新 AT
+        由 refresh_scheduler 在 AT 过期前调用。
         """
-        all_tokens = await self.db.get_all_tokens()
-        now = datetime.now(timezone.utc)
-
-        for token in all_tokens:
-            # 跳过未启用的 token
-            if not token.is_active:
-                continue
-
-            # 检查 AT 过期时间是否存在
-            if not token.at_expires:
-                continue
-
-            # 确保时区一致
-            if token.at_expires.tzinfo is None:
-                at_expires_aware = token.at_expires.replace(tzinfo=timezone.utc)
-            else:
-                at_expires_aware = token.at_expires
-
-            # 计算剩余时间（秒）
-            time_until_expiry = (at_expires_aware - now).total_seconds()
-
-            # 如果剩余时间大于 2 小时（7200 秒），跳过
-            if time_until_expiry > 7200:
-                continue
-
-            # 判断是已过期还是即将过期
-            if time_until_expiry <= 0:
-                # 已过期
-                expired_hours = abs(time_until_expiry) / 3600
-                debug_logger.log_info(
-                    f"[AUTO_ST_REFRESH] Token {token.id} (Email: {token.email}) AT 已过期 "
-                    f"{expired_hours:.1f} 小时，尝试刷新 ST..."
-                )
-            else:
-                # 即将过期
-                remaining_hours = time_until_expiry / 3600
-                debug_logger.log_info(
-                    f"[AUTO_ST_REFRESH] Token {token.id} (Email: {token.email}) AT 剩余 "
-                    f"{remaining_hours:.1f} 小时，尝试刷新 ST..."
-                )
+        token = self.registry.get(token_id) if self.registry.loaded else await self.db.get_token(token_id)
+        if not token or not token.is_active:
+            return False
 
-            # 尝试刷新 ST
-            try:
+        try:
+            async with self._refresh_lock(token_id):
                 new_st = await self.flow_client.refresh_session_token(token.st, token.email)
-                if new_st:
-                    # 更新数据库中的 ST
-                    await self.db.update_token(token.id, st=new_st)
-                    debug_logger.log_info(
-                        f"[AUTO_ST_REFRESH] Token {token.id} ST 刷新成功，"
-                        f"下次使用时将自动刷新 AT"
-                    )
-                else:
-                    debug_logger.log_warning(
-                        f"[AUTO_ST_REFRESH] Token {token.id} ST 刷新失败，"
-                        f"保持原状等待下次重试"
-                    )
-            except Exception as e:
-                debug_logger.log_error(
-                    f"[AUTO_ST_REFRESH] Token {token.id} ST 刷新异常: {str(e)}"
-                )
+            if new_st and new_st != token.st:
+                await self.db.update_token(token_id, st=new_st)
+                debug_logger.log_info(f"[AUTO_ST_REFRESH] Token {token_id} ST 刷新成功")
+        except Exception as e:
+            debug_logger.log_warning(f"[AUTO_ST_REFRESH] Token {token_id} ST 刷新异常: {str(e)}")
+
+        return await self._refresh_at(token_id)
 
     # ========== 余额刷新 ==========
 
@@ -0,0 +1,59 @@
+"""In-memory token registry
+
+启动时一次性加载全部 token，之后通过 Database 的 tokens 变更通知保持同步，
+负载均衡选择 token 时无需访问数据库。
+"""
+from typing import Dict, List, Optional
+from ..core.models import Token
+from ..core.logger import debug_logger
+
+
+class TokenRegistry:
+    """Token 内存索引"""
+
+    def __init__(self, db):
+        self.db = db
+        self._tokens: Dict[int, Token] = {}
+        self._loaded = False
+        db.add_token_listener(self._on_token_changed)
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded
+
+    async def load(self):
+        """从数据库加载全部 token"""
+        tokens = await self.db.get_all_tokens()
+        self._tokens = {token.id: token for token in tokens}
+        self._loaded = True
+        debug_logger.log_info(f"[TokenRegistry] 已加载 {len(self._tokens)} 个Token")
+
+    async def _on_token_changed(self, event: str, token_id: int, fields: Dict):
+        if not self._loaded:
+            return
+
+        if event == "deleted":
+            self._tokens.pop(token_id, None)
+            return
+
+        token = self._tokens.get(token_id)
+        if event == "added" or token is None:
+            token = await self.db.get_token(token_id)
+            if token:
+                self._tokens[token_id] = token
+            return
+
+        # 直接应用已写入的字段，避免再读一次数据库
+        self._tokens[token_id] = Token.model_validate({**token.model_dump(), **fields})
+
+    def get(self, token_id: int) -> Optional[Token]:
+        """按 ID 获取 token"""
+        return self._tokens.get(token_id)
+
+    def all(self) -> List[Token]:
+        """全部 token"""
+        return list(self._tokens.values())
+
+    def active(self) -> List[Token]:
+        """全部已启用的 token"""
+        return [token for token in self._tokens.values() if token.is_active]
@@ -0,0 +1,111 @@
+"""Reference image upload cache
+
+以 (Token, 图片 SHA-256, 宽高比) 为键缓存 uploadUserImage 返回的 mediaGenerationId，
+同一账号在 TTL 内重复引用同一张图片 (例如多轮对话中重新附带上一张生成图) 时跳过上传；
+并发上传同一张图片时只发出一次请求；每个 Token 同时进行的上传数受 upload_concurrency 限制。
+"""
+import asyncio
+import hashlib
+import time
+from collections import OrderedDict
+from typing import Dict, Tuple, Union
+from ..core.config import config
+from ..core.logger import debug_logger
+
+
+# 对 base64 字符串分块计算哈希时每块的字符数
+HASH_CHUNK_SIZE = 1024 * 1024
+
+class UploadCache:
+    """参考图上传缓存"""
+
+    def __init__(self, flow_client):
+        self.flow_client = flow_client
+        # key -> (media_id, expires_at)，按插入/命中顺序，超出上限时淘汰最旧的
+        self._entries: "OrderedDict[Tuple[int, str, str], Tuple[str, float]]" = OrderedDict()
+        self._inflight: Dict[Tuple[int, str, str], asyncio.Task] = {}
+        # 每个进行中上传的等待方数量，全部取消时取消实际上传
+        self._waiters: Dict[Tuple[int, str, str], int] = {}
+        self._semaphores: Dict[int, asyncio.Semaphore] = {}
+        self._hits = 0
+        self._misses = 0
+
+    @staticmethod
+    def _digest(image: Union[bytes, str]) -> str:
+        """图片内容的 SHA-256 (base64 字符串按文本分块计算，避免整体复制)"""
+        if isinstance(image, bytes):
+            return hashlib.sha256(image).hexdigest()
+        digest = hashlib.sha256(b"base64:")
+        for start in range(0, len(image), HASH_CHUNK_SIZE):
+            digest.update(image[start:start + HASH_CHUNK_SIZE].encode("ascii"))
+        return digest.hexdigest()
+
+    @classmethod
+    def _key(cls, token, image: Union[bytes, str], aspect_ratio: str) -> Tuple[int, str, str]:
+        # upload_image 会把 VIDEO_ 宽高比转换为 IMAGE_，两者上传结果相同
+        if aspect_ratio.startswith("VIDEO_"):
+            aspect_ratio = aspect_ratio.replace("VIDEO_", "IMAGE_")
+        return token.id, cls._digest(image), aspect_ratio
+
+    async def _upload(self, token, image_bytes: Union[bytes, str], aspect_ratio: str) -> str:
+        """实际上传 (按 Token 限制并发)"""
+        semaphore = self._semaphores.get(token.id)
+        if semaphore is None:
+            semaphore = self._semaphores[token.id] = asyncio.Semaphore(max(1, config.upload_concurrency))
+        async with semaphore:
+            return await self.flow_client.upload_image(token.at, image_bytes, aspect_ratio)
+
+    async def upload(self, token, image_bytes: Union[bytes, str], aspect_ratio: str) -> str:
+        """上传图片并返回 mediaGenerationId，命中缓存时不发请求"""
+        ttl = config.upload_cache_ttl
+        if ttl <= 0:
+            return await self._upload(token, image_bytes, aspect_ratio)
+
+        key = self._key(token, image_bytes, aspect_ratio)
+        cached = self._entries.get(key)
+        if cached:
+            media_id, expires_at = cached
+            if expires_at > time.time():
+                self._entries.move_to_end(key)
+                self._hits += 1
+                debug_logger.log_info(f"[UPLOAD_CACHE] Token {token.id}: 命中缓存 {media_id}")
+                return media_id
+            del self._entries[key]
+
+        task = self._inflight.get(key)
+        if task is None:
+            self._misses += 1
+            task = asyncio.create_task(self._upload(token, image_bytes, aspect_ratio))
+            self._inflight[key] = task
+            task.add_done_callback(lambda t, key=key, ttl=ttl: self._on_upload_done(key, t, ttl))
+        else:
+            self._hits += 1
+
+        # shield: 某个等待方被取消不影响共享同一上传的其他请求
+        self._waiters[key] = self._waiters.get(key, 0) + 1
+        try:
+            return await asyncio.shield(task)
+        finally:
+            self._waiters[key] -= 1
+            if not self._waiters[key]:
+                del self._waiters[key]
+                # 没有其他等待方时取消实际上传
+                if not task.done():
+                    task.cancel()
+
+    def _on_upload_done(self, key: Tuple[int, str, str], task: asyncio.Task, ttl: int):
+        self._inflight.pop(key, None)
+        if task.cancelled() or task.exception() is not None:
+            return
+        self._entries[key] = (task.result(), time.time() + ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > config.upload_cache_max_entries:
+            self._entries.popitem(last=False)
+
+    def get_stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "inflight": len(self._inflight),
+            "hits": self._hits,
+            "misses": self._misses
+        }
@@ -0,0 +1,152 @@
+"""Batched video status poller
+
+每个 AT 一个后台轮询循环：各请求把待查询的 operation 提交到该 AT 的队列，
+循环按统一节拍 (同一 AT 两次上游查询至少间隔 poll_interval) 通过一次
+batchCheckAsyncVideoGenerationStatus 调用查询队列中的全部 operation，再把结果分发给各个等待方。
+请求各自的轮询时间表不必对齐，落在同一节拍内的查询都会被合并。
+"""
+import asyncio
+import time
+from typing import Dict, List, Optional, Tuple
+from ..core.config import config
+from ..core.logger import debug_logger
+
+
+class _AtQueue:
+    """单个 AT 的待查询队列和轮询循环"""
+
+    def __init__(self):
+        # [(operation, future), ...]
+        self.items: List[Tuple[Dict, asyncio.Future]] = []
+        self.wakeup = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+        self.last_call = 0.0
+
+
+class VideoStatusPoller:
+    """跨请求合并的视频状态轮询器"""
+
+    def __init__(self, flow_client):
+        self.flow_client = flow_client
+        self._queues: Dict[str, _AtQueue] = {}
+        # 统计: 提交的查询数 / 实际上游调用数
+        self._submitted = 0
+        self._upstream_calls = 0
+
+    async def check(self, at: str, operations: List[Dict]) -> List[Dict]:
+        """查询一组 operation 的状态（与同一 AT 的其他请求合并后批量查询）
+
+        Args:
+            at: Access Token
+            operations: 操作列表 [{"operation": {"name": "task_id"}, "sceneId": "...", "status": "..."}]
+
+        Returns:
+            上游返回的 operation 列表，顺序与传入一致，缺失的 operation 会被跳过
+        """
+        queue = self._queues.get(at)
+        if queue is None:
+            queue = self._queues[at] = _AtQueue()
+            queue.task = asyncio.create_task(self._run(at, queue))
+
+        loop = asyncio.get_running_loop()
+        futures = []
+        for operation in operations:
+            future = loop.create_future()
+            queue.items.append((operation, future))
+            futures.append(future)
+        self._submitted += len(futures)
+        queue.wakeup.set()
+
+        results = await asyncio.gather(*futures)
+        return [r for r in results if r is not None]
+
+    async def _run(self, at: str, queue: _AtQueue):
+        """AT 的轮询循环，空闲超过一个节拍后退出"""
+        try:
+            while True:
+                if not queue.items:
+                    queue.wakeup.clear()
+                    try:
+                        await asyncio.wait_for(queue.wakeup.wait(), timeout=config.poll_interval)
+                    except asyncio.TimeoutError:
+                        pass
+                    if not queue.items:
+                        break
+                    continue
+
+                # 等待合并窗口，并保证两次上游查询至少间隔一个节拍
+                now = time.time()
+                due = max(now + config.poll_batch_window, queue.last_call + config.poll_interval)
+                await asyncio.sleep(due - now)
+
+                items = [(op, fut) for op, fut in queue.items if not fut.done()]
+                queue.items = []
+                if not items:
+                    continue
+                queue.last_call = time.time()
+
+                batch_size = max(1, config.poll_batch_size)
+                await asyncio.gather(*(
+                    self._check_batch(at, items[i:i + batch_size])
+                    for i in range(0, len(items), batch_size)
+                ))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            debug_logger.log_error(f"[VideoPoller] 轮询循环异常: {str(e)}")
+            for _, future in queue.items:
+                if not future.done():
+                    future.set_exception(e)
+            queue.items = []
+        finally:
+            if self._queues.get(at) is queue:
+                del self._queues[at]
+
+    async def _check_batch(self, at: str, items: List[Tuple[Dict, asyncio.Future]]):
+        """对同一 AT 的一批 operation 发起一次上游查询"""
+        self._upstream_calls += 1
+        try:
+            result = await self.flow_client.check_video_status(at, [op for op, _ in items])
+        except Exception as e:
+            for _, future in items:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        checked = {}
+        for operation in result.get("operations", []):
+            name = operation.get("operation", {}).get("name")
+            if name:
+                checked[name] = operation
+
+        for op, future in items:
+            if not future.done():
+                future.set_result(checked.get(op.get("operation", {}).get("name")))
+
+        if len(items) > 1:
+            debug_logger.log_info(f"[VideoPoller] 合并查询 {len(items)} 个视频任务状态")
+
+    async def close(self):
+        """停止所有轮询循环并取消未完成的查询"""
+        queues, self._queues = list(self._queues.values()), {}
+        for queue in queues:
+            if queue.task and not queue.task.done():
+                queue.task.cancel()
+        for queue in queues:
+            if queue.task:
+                try:
+                    await queue.task
+                except asyncio.CancelledError:
+                    pass
+            for _, future in queue.items:
+                if not future.done():
+                    future.cancel()
+
+    def get_stats(self) -> dict:
+        """获取合并轮询统计"""
+        return {
+            "tokens": len(self._queues),
+            "pending": sum(len(queue.items) for queue in self._queues.values()),
+            "submitted": self._submitted,
+            "upstream_calls": self._upstream_calls
+        }